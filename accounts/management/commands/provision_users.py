@@ -0,0 +1,36 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from accounts.provisioning import ProvisioningError, provision_users_csv, reconcile_profiles
+
+
+class Command(BaseCommand):
+    help = ('Массово создает пользователей с профилями из CSV (username, email, password, first_name, last_name, '
+            'phone) и досоздает недостающие профили')
+
+    def add_arguments(self, parser):
+        parser.add_argument('path', nargs='?')
+        parser.add_argument('--batch-size', type=int, default=1000)
+        parser.add_argument('--workers', type=int, default=None, help='Процессов для хеширования паролей')
+        parser.add_argument('--reconcile-only', action='store_true', help='Только создать недостающие профили')
+
+    def handle(self, *args, **options):
+        if options['reconcile_only']:
+            created = reconcile_profiles(options['batch_size'])
+            self.stdout.write(self.style.SUCCESS(f'Создано профилей: {created}'))
+            return
+        if not options['path']:
+            raise CommandError('Укажите путь к CSV или --reconcile-only')
+
+        def report(totals):
+            self.stdout.write(f'Создано: {totals["created"]}, пропущено: {totals["skipped"]}')
+
+        try:
+            with open(options['path'], encoding='utf-8-sig', newline='') as file:
+                totals = provision_users_csv(file, batch_size=options['batch_size'], workers=options['workers'],
+                                             callback=report)
+        except ProvisioningError as e:
+            raise CommandError(e)
+        self.stdout.write(self.style.SUCCESS(
+            f'Пользователей создано: {totals["created"]}, пропущено существующих: {totals["skipped"]}, '
+            f'досоздано профилей: {totals["reconciled"]}'
+        ))
@@ -0,0 +1,130 @@
+import csv
+import os
+from concurrent.futures import ProcessPoolExecutor
+
+import django
+from django.contrib.auth.hashers import make_password
+from django.contrib.auth.models import User
+from django.db import transaction
+
+from accounts.models import Profile
+
+PROVISION_COLUMNS = ('username', 'email', 'password', 'first_name', 'last_name', 'phone')
+
+
+class ProvisioningError(Exception):
+    pass
+
+
+def iter_user_rows(file):
+    reader = csv.DictReader(file)
+    if 'username' not in (reader.fieldnames or ()):
+        raise ProvisioningError('В CSV нет колонки username')
+    for line, row in enumerate(reader, 2):
+        row = {key: (value or '').strip() for key, value in row.items() if key in PROVISION_COLUMNS}
+        if not row['username']:
+            raise ProvisioningError(f'Строка {line}: не указан username')
+        yield row
+
+
+def iter_batches(rows, batch_size):
+    batch = []
+    for row in rows:
+        batch.append(row)
+        if len(batch) >= batch_size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+def hash_password(password):
+    # Пустой пароль дает непригодный для входа хеш, как у set_unusable_password
+    return make_password(password or None)
+
+
+class PasswordHasherPool:
+    # PBKDF2 занимает сотни миллисекунд на пароль, поэтому хеши считаются параллельно в отдельных процессах
+
+    def __init__(self, workers=None):
+        self.workers = workers or os.cpu_count() or 1
+        self.executor = None
+        if self.workers > 1:
+            self.executor = ProcessPoolExecutor(self.workers, initializer=django.setup)
+
+    def hash(self, passwords):
+        if self.executor is None:
+            return [hash_password(password) for password in passwords]
+        chunksize = max(1, len(passwords) // (self.workers * 4))
+        return list(self.executor.map(hash_password, passwords, chunksize=chunksize))
+
+    def close(self):
+        if self.executor is not None:
+            self.executor.shutdown()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+
+def filter_new_rows(batch, seen):
+    usernames = {User.normalize_username(row['username']) for row in batch}
+    existing = set(User.objects.filter(username__in=usernames).values_list('username', flat=True))
+    rows = []
+    for row in batch:
+        username = User.normalize_username(row['username'])
+        if username in existing or username in seen:
+            continue
+        seen.add(username)
+        rows.append(dict(row, username=username))
+    return rows
+
+
+@transaction.atomic
+def create_batch(rows, passwords, batch_size):
+    User.objects.bulk_create([
+        User(username=row['username'], email=User.objects.normalize_email(row.get('email', '')),
+             first_name=row.get('first_name', ''), last_name=row.get('last_name', ''), password=password)
+        for row, password in zip(rows, passwords)
+    ], batch_size=batch_size)
+    # bulk_create обходит post_save, профили создаются здесь же; pk перечитываются, т.к. SQLite их не возвращает
+    user_ids = dict(User.objects.filter(username__in=[row['username'] for row in rows]).values_list('username', 'pk'))
+    Profile.objects.bulk_create([
+        Profile(user_id=user_ids[row['username']], phone=row.get('phone') or None) for row in rows
+    ], batch_size=batch_size)
+
+
+def provision_users(rows, batch_size=1000, workers=None, callback=None):
+    totals = {'created': 0, 'skipped': 0}
+    seen = set()
+    with PasswordHasherPool(workers) as hasher:
+        for batch in iter_batches(rows, batch_size):
+            new_rows = filter_new_rows(batch, seen)
+            if new_rows:
+                create_batch(new_rows, hasher.hash([row.get('password', '') for row in new_rows]), batch_size)
+            totals['created'] += len(new_rows)
+            totals['skipped'] += len(batch) - len(new_rows)
+            if callback:
+                callback(totals)
+    totals['reconciled'] = reconcile_profiles(batch_size)
+    return totals
+
+
+def provision_users_csv(file, batch_size=1000, workers=None, callback=None):
+    return provision_users(iter_user_rows(file), batch_size=batch_size, workers=workers, callback=callback)
+
+
+def reconcile_profiles(batch_size=1000):
+    # Пользователи, созданные в обход сигнала (bulk_create, импорт), получают профили за один проход по ключу
+    queryset = User.objects.filter(profile__isnull=True).order_by('pk').values_list('pk', flat=True)
+    created, last_pk = 0, 0
+    while True:
+        user_ids = list(queryset.filter(pk__gt=last_pk)[:batch_size])
+        if user_ids:
+            Profile.objects.bulk_create([Profile(user_id=user_id) for user_id in user_ids], ignore_conflicts=True)
+            created += len(user_ids)
+            last_pk = user_ids[-1]
+        if len(user_ids) < batch_size:
+            return created
@@ -0,0 +1,25 @@
+from django.contrib.sessions.backends.cached_db import SessionStore as CachedDBStore
+
+
+class SessionStore(CachedDBStore):
+    # Сессия читается из кэша, а в базу и кэш пишется только при реальном изменении данных:
+    # повторная запись того же значения (например, размера страницы) не порождает UPDATE
+
+    def __init__(self, session_key=None):
+        super(SessionStore, self).__init__(session_key)
+        self._snapshot = None
+
+    def get_snapshot(self, data):
+        return self.serializer().dumps(data)
+
+    def load(self):
+        data = super(SessionStore, self).load()
+        self._snapshot = self.get_snapshot(data)
+        return data
+
+    def save(self, must_create=False):
+        if (not must_create and self.session_key is not None and self._snapshot is not None
+                and self.get_snapshot(self._get_session()) == self._snapshot):
+            return
+        super(SessionStore, self).save(must_create)
+        self._snapshot = self.get_snapshot(self._get_session())
@@ -1,11 +1,33 @@
 from django.contrib.auth.models import User
-from django.db.models.signals import post_save
+from django.db import transaction
+from django.db.models.signals import post_delete, post_save
 from django.dispatch import receiver
 
+from utils.images import schedule_derivatives
 from .models import Profile
+from .user_cache import invalidate_user
 
 
 @receiver(post_save, sender=User)
 def create_user_profile(**kwargs):
     if kwargs['created']:
         Profile.objects.create(user=kwargs['instance'])
+
+
+@receiver(post_save, sender=Profile)
+def create_avatar_derivatives(**kwargs):
+    schedule_derivatives(kwargs['instance'].avatar)
+
+
+@receiver(post_save, sender=User)
+@receiver(post_delete, sender=User)
+def invalidate_cached_user(**kwargs):
+    pk = kwargs['instance'].pk
+    transaction.on_commit(lambda: invalidate_user(pk))
+
+
+@receiver(post_save, sender=Profile)
+@receiver(post_delete, sender=Profile)
+def invalidate_cached_profile(**kwargs):
+    user_id = kwargs['instance'].user_id
+    transaction.on_commit(lambda: invalidate_user(user_id))
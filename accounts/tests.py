@@ -1,3 +1,146 @@
-from django.test import TestCase
+import io
 
-# Create your tests here.
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.db import connection
+from django.test import TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+
+from accounts.provisioning import ProvisioningError, provision_users_csv
+from accounts.user_cache import get_user_cache_key
+from utils.testing import QueryBudgetTestCase, seed_fleet
+
+
+class AccountsQueryBudgetTest(QueryBudgetTestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = seed_fleet()[0]
+
+    def test_sign_up(self):
+        self.assertQueryBudget(reverse('accounts:sign_up'), 1)
+
+    def test_sign_in(self):
+        self.assertQueryBudget(reverse('accounts:sign_in'), 2)
+
+    def test_password_change(self):
+        self.client.force_login(self.user)
+        self.assertQueryBudget(reverse('accounts:password_change'), 3)
+
+    def test_password_change_done(self):
+        self.client.force_login(self.user)
+        self.assertQueryBudget(reverse('accounts:password_change_done'), 3)
+
+    def test_profile(self):
+        self.client.force_login(self.user)
+        self.assertQueryBudget(reverse('accounts:profile', args=[self.user.profile.pk]), 5)
+
+    def test_logout(self):
+        self.client.force_login(self.user)
+        self.assertQueryBudget(reverse('accounts:logout'), 4, status_code=302)
+
+    def test_password_reset(self):
+        self.assertQueryBudget(reverse('accounts:password_reset'), 1)
+
+    def test_password_reset_done(self):
+        self.assertQueryBudget(reverse('accounts:password_reset_done'), 1)
+
+    def test_password_reset_confirm(self):
+        self.assertQueryBudget(reverse('accounts:password_reset_confirm', args=['MQ', 'invalid-token']), 2)
+
+    def test_password_reset_complete(self):
+        self.assertQueryBudget(reverse('accounts:password_reset_complete'), 1)
+
+
+@override_settings(SHARED_CACHE=True, SESSION_ENGINE='accounts.sessions')
+class CachedSessionTest(QueryBudgetTestCase):
+    AUTH_TABLES = ('django_session', 'auth_user', 'accounts_profile')
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = seed_fleet(brands=2, autos_per_brand=2)[0]
+
+    def get_auth_queries(self, url, method='get', data=None):
+        with CaptureQueriesContext(connection) as context:
+            getattr(self.client, method)(url, data)
+        return [query['sql'] for query in context.captured_queries
+                if any(table in query['sql'] for table in self.AUTH_TABLES)]
+
+    def test_steady_state_has_no_auth_queries(self):
+        self.client.force_login(self.user)
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.get(reverse('main:index'))
+        self.assertEqual(self.get_auth_queries(reverse('main:index')), [])
+        self.assertEqual(self.get_auth_queries(reverse('motorpool:brand_list')), [])
+
+    def test_anonymous_has_no_auth_queries(self):
+        self.assertEqual(self.get_auth_queries(reverse('main:index')), [])
+
+    def test_unchanged_session_is_not_saved(self):
+        self.client.force_login(self.user)
+        url = reverse('motorpool:brand_list_set_paginate')
+        self.client.post(url, {'item_count': 5})
+        queries = self.get_auth_queries(url, 'post', {'item_count': 5})
+        self.assertFalse([sql for sql in queries if sql.startswith(('UPDATE', 'INSERT'))], queries)
+        self.assertTrue(self.get_auth_queries(url, 'post', {'item_count': 10}))
+
+    def test_profile_save_invalidates_user(self):
+        self.client.force_login(self.user)
+        self.client.get(reverse('main:index'))
+        with self.captureOnCommitCallbacks(execute=True):
+            self.user.profile.phone = '+7 900 000-00-00'
+            self.user.profile.save()
+        self.assertTrue(self.get_auth_queries(reverse('main:index')))
+
+    def test_inactive_cached_user_is_reloaded(self):
+        self.client.force_login(self.user)
+        self.client.get(reverse('main:index'))
+        cached = cache.get(get_user_cache_key(self.user.pk))
+        cached.is_active = False
+        cache.set(get_user_cache_key(self.user.pk), cached)
+        User.objects.filter(pk=self.user.pk).update(is_active=False)
+        response = self.client.get(reverse('accounts:password_change'))
+        self.assertEqual(response.status_code, 302)
+
+
+@override_settings(STATICFILES_STORAGE='django.contrib.staticfiles.storage.StaticFilesStorage', SHARED_CACHE=False)
+class LocalCacheAuthTest(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user(username='local', password='secret')
+
+    def test_stock_authentication_without_shared_cache(self):
+        self.client.force_login(self.user)
+        self.assertEqual(self.client.get(reverse('accounts:password_change')).status_code, 200)
+        self.assertIsNone(cache.get(get_user_cache_key(self.user.pk)))
+        # Изменение в обход сигналов видно сразу: пользователь читается из базы на каждый запрос
+        User.objects.filter(pk=self.user.pk).update(is_active=False)
+        self.assertEqual(self.client.get(reverse('accounts:password_change')).status_code, 302)
+
+
+@override_settings(PASSWORD_HASHERS=['django.contrib.auth.hashers.MD5PasswordHasher'])
+class ProvisionUsersTest(TestCase):
+
+    def test_provision_users_csv(self):
+        User.objects.create(username='existing')
+        User.objects.bulk_create([User(username='orphan')])
+        file = io.StringIO('username,email,password,phone\n'
+                           'driver1,Driver1@EXAMPLE.com,secret,+79000000001\n'
+                           'driver2,,,\n'
+                           'existing,,,\n'
+                           'driver1,,,\n')
+        with self.assertNumQueries(8):
+            totals = provision_users_csv(file, workers=1)
+        self.assertEqual(totals, {'created': 2, 'skipped': 2, 'reconciled': 1})
+        driver = User.objects.select_related('profile').get(username='driver1')
+        self.assertTrue(driver.check_password('secret'))
+        self.assertEqual(driver.email, 'Driver1@example.com')
+        self.assertEqual(driver.profile.phone, '+79000000001')
+        self.assertFalse(User.objects.get(username='driver2').has_usable_password())
+        self.assertFalse(User.objects.filter(profile__isnull=True).exists())
+
+    def test_missing_username(self):
+        with self.assertRaises(ProvisioningError):
+            provision_users_csv(io.StringIO('username,email\n,a@example.com\n'), workers=1)
@@ -0,0 +1,62 @@
+from django.conf import settings
+from django.contrib import auth
+from django.contrib.auth import get_user_model
+from django.contrib.auth.middleware import AuthenticationMiddleware
+from django.contrib.auth.models import AnonymousUser
+from django.core.cache import cache
+from django.utils.crypto import constant_time_compare
+from django.utils.functional import SimpleLazyObject
+
+from utils.cache import is_shared_cache
+
+
+def get_user_cache_key(user_id):
+    return f'user:{user_id}'
+
+
+def invalidate_user(user_id):
+    # QuerySet.update() сигналов не шлет: после массового изменения пользователей вызывается явно,
+    # иначе кэш устареет до USER_CACHE_TIMEOUT
+    cache.delete(get_user_cache_key(user_id))
+
+
+def load_user(request, user_id):
+    # Пользователь с профилем, который нужен шапке каждой страницы, читается одним запросом и кэшируется целиком
+    user = get_user_model()._default_manager.select_related('profile').filter(pk=user_id).first()
+    if user is None or not user.is_active or not is_session_valid(request, user):
+        # Сброс сессии и прочие особые случаи оставляем штатному get_user
+        return auth.get_user(request)
+    cache.set(get_user_cache_key(user.pk), user, getattr(settings, 'USER_CACHE_TIMEOUT', 15 * 60))
+    return user
+
+
+def is_session_valid(request, user):
+    session_hash = request.session.get(auth.HASH_SESSION_KEY)
+    return bool(session_hash and constant_time_compare(session_hash, user.get_session_auth_hash()))
+
+
+def get_cached_user(request):
+    if not hasattr(request, '_cached_user'):
+        request._cached_user = _get_cached_user(request)
+    return request._cached_user
+
+
+def _get_cached_user(request):
+    user_id = request.session.get(auth.SESSION_KEY)
+    if user_id is None:
+        return AnonymousUser()
+    if request.session.get(auth.BACKEND_SESSION_KEY) not in settings.AUTHENTICATION_BACKENDS:
+        return auth.get_user(request)
+    user = cache.get(get_user_cache_key(user_id))
+    if user is None or not user.is_active or not is_session_valid(request, user):
+        return load_user(request, user_id)
+    return user
+
+
+class CachedAuthenticationMiddleware(AuthenticationMiddleware):
+    # Без общего кэша сброс пользователя дошел бы только до одного воркера, поэтому работает как штатный
+
+    def process_request(self, request):
+        super(CachedAuthenticationMiddleware, self).process_request(request)
+        if is_shared_cache():
+            request.user = SimpleLazyObject(lambda: get_cached_user(request))
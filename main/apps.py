@@ -4,3 +4,14 @@ from django.apps import AppConfig
 class MainConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'main'
+
+    def ready(self):
+        from django.conf import settings
+        from django.db.backends.signals import connection_created
+
+        from utils.slow_queries import install_slow_query_wrapper
+        from . import checks
+
+        # Без явного SLOW_QUERY_DIR журнал выключен: тесты и команды не пишут во временный каталог системы
+        if getattr(settings, 'SLOW_QUERY_ENABLED', True) and getattr(settings, 'SLOW_QUERY_DIR', None):
+            connection_created.connect(install_slow_query_wrapper)
@@ -0,0 +1,16 @@
+from django.conf import settings
+from django.core import checks
+
+
+@checks.register()
+def check_metrics_dir(app_configs, **kwargs):
+    # Без общего каталога каждый воркер отдает только свои счетчики, и метрики по всему парку неверны
+    if not getattr(settings, 'METRICS_ENABLED', True) or getattr(settings, 'METRICS_DIR', None):
+        return []
+    if getattr(settings, 'WEB_WORKERS', 1) <= 1:
+        return []
+    return [checks.Error(
+        'METRICS_DIR не задан, а воркеров несколько (WEB_CONCURRENCY): /metrics покажет только один процесс',
+        hint='Задайте METRICS_DIR - каталог, общий для всех воркеров, или отключите метрики METRICS_ENABLED=False',
+        id='main.E001',
+    )]
@@ -0,0 +1,44 @@
+import logging
+
+from django.core.management.base import BaseCommand
+
+from accounts.models import Profile
+from motorpool.models import Brand, Auto
+from utils.images import generate_derivatives
+
+IMAGE_FIELDS = (
+    (Brand, 'logo'),
+    (Auto, 'logo'),
+    (Profile, 'avatar'),
+)
+
+logger = logging.getLogger(__name__)
+
+
+class Command(BaseCommand):
+    help = 'Создает уменьшенные копии изображений брендов, автомобилей и аватаров'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--force', action='store_true', help='Пересоздать уже существующие копии')
+
+    def handle(self, *args, **options):
+        failed = 0
+        for model, field_name in IMAGE_FIELDS:
+            storage = model._meta.get_field(field_name).storage
+            rows = model.objects.exclude(**{field_name: ''}).exclude(**{f'{field_name}__isnull': True}).values_list(
+                'pk', field_name)
+            created = model_failed = 0
+            for pk, name in rows.iterator():
+                # Одно битое или пропавшее изображение не должно останавливать обработку остальных
+                try:
+                    created += generate_derivatives(storage, name, force=options['force'])
+                except Exception as e:
+                    model_failed += 1
+                    logger.exception('Не удалось обработать изображение %s pk=%s: %s', model._meta.label, pk, name)
+                    self.stderr.write(f'{model._meta.label} pk={pk}: {name}: {e}')
+            self.stdout.write(f'{model._meta.verbose_name_plural}: создано копий {created}, ошибок {model_failed}')
+            failed += model_failed
+        if failed:
+            self.stdout.write(self.style.WARNING(f'Готово, не обработано изображений: {failed}'))
+        else:
+            self.stdout.write(self.style.SUCCESS('Готово'))
@@ -0,0 +1,15 @@
+from django.core.management.base import BaseCommand
+
+from utils.cache import get_cache_stats
+
+
+class Command(BaseCommand):
+    help = 'Выводит счетчики попаданий, промахов и инвалидаций кеша страниц'
+
+    def handle(self, *args, **options):
+        stats = get_cache_stats()
+        requests = stats['hits'] + stats['misses']
+        hit_rate = stats['hits'] / requests * 100 if requests else 0
+        for name, value in stats.items():
+            self.stdout.write(f'{name}: {value}')
+        self.stdout.write(f'hit rate: {hit_rate:.1f}%')
@@ -0,0 +1,10 @@
+from django.core.management.base import BaseCommand
+
+from utils.profiling import make_profile_token
+
+
+class Command(BaseCommand):
+    help = 'Выдает подписанный токен для заголовка X-Profile, включающего профилирование запроса'
+
+    def handle(self, *args, **options):
+        self.stdout.write(make_profile_token())
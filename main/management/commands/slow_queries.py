@@ -0,0 +1,38 @@
+from django.core.management.base import BaseCommand
+
+from utils.slow_queries import ORDERINGS, slow_query_log
+
+
+class Command(BaseCommand):
+    help = 'Выводит самые медленные запросы из журнала, сгруппированные по отпечатку, вместе с планами EXPLAIN'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--top', type=int, default=None)
+        parser.add_argument('--order', choices=ORDERINGS, default='total_ms')
+        parser.add_argument('--no-explain', action='store_true')
+        parser.add_argument('--clear', action='store_true', help='Очистить журнал')
+
+    def handle(self, *args, **options):
+        if options['clear']:
+            slow_query_log.clear()
+            self.stdout.write(self.style.SUCCESS('Журнал медленных запросов очищен'))
+            return
+        entries = slow_query_log.top(options['top'], options['order'])
+        if not entries:
+            self.stdout.write('Медленных запросов нет')
+            return
+        for index, entry in enumerate(entries, 1):
+            views = ', '.join(f'{view} ({count})' for view, count in
+                              sorted(entry['views'].items(), key=lambda item: item[1], reverse=True))
+            self.stdout.write(self.style.MIGRATE_HEADING(
+                f'{index}. [{entry["fingerprint"]}] всего {entry["total_ms"]:.1f} мс, запросов {entry["count"]}, '
+                f'макс. {entry["max_ms"]:.1f} мс, в среднем {entry["total_ms"] / entry["count"]:.1f} мс'
+            ))
+            self.stdout.write(f'   база: {entry["alias"]}, последний раз: {entry["last_seen"]}')
+            self.stdout.write(f'   представления: {views}')
+            self.stdout.write(f'   параметры: {", ".join(entry["params"]) or "нет"}')
+            self.stdout.write(f'   {entry["sql"]}')
+            if entry['explain'] and not options['no_explain']:
+                self.stdout.write('   EXPLAIN:')
+                for line in entry['explain'].splitlines():
+                    self.stdout.write(f'     {line}')
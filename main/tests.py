@@ -1,3 +1,30 @@
-from django.test import TestCase
+from django.test import SimpleTestCase, override_settings
+from django.urls import reverse
 
-# Create your tests here.
+from main.checks import check_metrics_dir
+from utils.testing import QueryBudgetTestCase, seed_fleet
+
+
+class MainQueryBudgetTest(QueryBudgetTestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = seed_fleet()[0]
+
+    def test_index(self):
+        self.assertQueryBudget(reverse('main:index'), 1)
+
+    def test_index_authenticated(self):
+        self.client.force_login(self.user)
+        self.assertQueryBudget(reverse('main:index'), 4)
+
+
+class MetricsDirCheckTest(SimpleTestCase):
+
+    def test_several_workers_require_metrics_dir(self):
+        with override_settings(METRICS_ENABLED=True, METRICS_DIR=None, WEB_WORKERS=4):
+            self.assertEqual([error.id for error in check_metrics_dir(None)], ['main.E001'])
+        with override_settings(METRICS_ENABLED=True, METRICS_DIR='/var/run/metrics', WEB_WORKERS=4):
+            self.assertEqual(check_metrics_dir(None), [])
+        with override_settings(METRICS_ENABLED=True, METRICS_DIR=None, WEB_WORKERS=1):
+            self.assertEqual(check_metrics_dir(None), [])
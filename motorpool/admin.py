@@ -1,28 +1,51 @@
 from django.contrib import admin
+
+from utils.search import IndexedSearchMixin
+from .facets import HISTOGRAM_FACETS, facet_index
 from .models import Brand, Auto, Option, VehiclePassport
 
 
-class EnginePowerFilter(admin.SimpleListFilter):
-    title = 'Мощность двигателя'
-    parameter_name = 'engine_power_filter'
+class HistogramListFilter(admin.SimpleListFilter):
+    facet_name = None
+    # Поле модели админки, если оно отличается от поля фасета у автомобиля
+    field = None
+
+    def __init__(self, request, params, model, model_admin):
+        self.facet = HISTOGRAM_FACETS[self.facet_name]
+        self.title = self.facet.label
+        super().__init__(request, params, model, model_admin)
 
     def lookups(self, request, model_admin):
-        filter_list = [
-            ('0', '0-100'),
-            ('1', '101-200'),
-            ('2', '201-300')
-        ]
-        return filter_list
+        counts = facet_index.histogram(self.facet_name)
+        return [(value, f'{label} ({counts.get(int(value), 0)})') for value, label in self.facet.get_choices()]
 
     def queryset(self, request, queryset):
-        filter_value = self.value()
-        if filter_value == '0':
-            return queryset.filter(pts__engine_power__gte=0, pts__engine_power__lte=100)
-        elif filter_value == '1':
-            return queryset.filter(pts__engine_power__gte=101, pts__engine_power__lte=200)
-        elif filter_value == '2':
-            return queryset.filter(pts__engine_power__gte=201, pts__engine_power__lte=300)
-        return queryset
+        if self.value() is None or not self.value().isdigit() or int(self.value()) >= len(self.facet.buckets):
+            return queryset
+        return queryset.filter(self.facet.get_condition([int(self.value())], field=self.field))
+
+
+class EnginePowerFilter(HistogramListFilter):
+    facet_name = 'engine_power'
+    parameter_name = 'engine_power_filter'
+
+
+class EngineVolumeFilter(HistogramListFilter):
+    facet_name = 'engine_volume'
+    parameter_name = 'engine_volume_filter'
+
+
+class YearFilter(HistogramListFilter):
+    facet_name = 'year'
+    parameter_name = 'year_filter'
+
+
+class PassportEnginePowerFilter(EnginePowerFilter):
+    field = 'engine_power'
+
+
+class PassportEngineVolumeFilter(EngineVolumeFilter):
+    field = 'engine_volume'
 
 
 class AutoInstanceInline(admin.TabularInline):
@@ -36,12 +59,12 @@ class BrandAdmin(admin.ModelAdmin):
 
 
 @admin.register(Auto)
-class AutoAdmin(admin.ModelAdmin):
+class AutoAdmin(IndexedSearchMixin, admin.ModelAdmin):
     list_display = ['id', 'number', 'brand', 'year', 'auto_class', 'display_engine_power']
     list_select_related = ['brand', 'pts']
     list_display_links = ['id', 'number', 'brand', ]
-    list_filter = [EnginePowerFilter, 'auto_class', 'options', ]
-    search_fields = ['brand__title', 'number', ]
+    list_filter = [EnginePowerFilter, EngineVolumeFilter, YearFilter, 'auto_class', 'options', ]
+    search_fields = ['number', 'pts__vin', 'brand__title', ]
 
 
 @admin.register(Option)
@@ -50,7 +73,8 @@ class OptionAdmin(admin.ModelAdmin):
 
 
 @admin.register(VehiclePassport)
-class VehiclePassportAdmin(admin.ModelAdmin):
+class VehiclePassportAdmin(IndexedSearchMixin, admin.ModelAdmin):
     list_display = ['id', 'auto', 'vin', 'engine_volume', 'engine_power']
-    list_filter = ['auto__brand', ]
+    list_filter = [PassportEnginePowerFilter, PassportEngineVolumeFilter, 'auto__brand', ]
     list_select_related = ['auto__brand', ]
+    search_fields = ['vin', 'auto__number', 'auto__brand__title', ]
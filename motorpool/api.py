@@ -0,0 +1,227 @@
+import hashlib
+
+from django.conf import settings
+from django.http import JsonResponse, Http404
+from django.utils.cache import get_conditional_response, patch_vary_headers, quote_etag
+from django.views import View
+
+from motorpool.models import Brand, Auto, Option
+from utils.cache import get_versions
+from utils.pagination import CursorPaginator
+
+API_PAGE_SIZE = 20
+API_MAX_PAGE_SIZE = 100
+API_MAX_IDS = 100
+
+
+class ApiError(Exception):
+
+    def __init__(self, message, status=400):
+        super(ApiError, self).__init__(message)
+        self.status = status
+
+
+def parse_int_list(value, limit):
+    try:
+        values = [int(item) for item in value.split(',') if item.strip()]
+    except ValueError:
+        raise ApiError('Идентификаторы должны быть целыми числами')
+    if len(values) > limit:
+        raise ApiError(f'Можно запросить не более {limit} объектов')
+    return list(dict.fromkeys(values))
+
+
+class ApiResource:
+    model = None
+    # Имя поля в ответе -> путь для values()
+    fields = {}
+    computed_fields = {}
+    # Имя поля -> право, без которого поле не отдается
+    field_permissions = {}
+    related_versions = ()
+
+    def get_available_fields(self, request):
+        return [name for name in list(self.fields) + list(self.computed_fields)
+                if name not in self.field_permissions or request.user.has_perm(self.field_permissions[name])]
+
+    def get_field_names(self, request):
+        available = self.get_available_fields(request)
+        if not request.GET.get('fields'):
+            return available
+        names = [name.strip() for name in request.GET['fields'].split(',') if name.strip()]
+        unknown = [name for name in names if name not in available]
+        if unknown:
+            raise ApiError(f'Неизвестные поля: {", ".join(unknown)}')
+        return ['id'] + [name for name in names if name != 'id']
+
+    def get_dependencies(self, ids, field_names):
+        dependencies = [(self.model, None)] + [(self.model, pk) for pk in ids]
+        return dependencies + [dependency for name, dependency in self.related_versions if name in field_names]
+
+    def get_values_paths(self, field_names):
+        paths = {self.fields[name] for name in field_names if name in self.fields}
+        for name in field_names:
+            paths.update(self.computed_fields.get(name, {}).get('paths', ()))
+        return sorted(paths)
+
+    def get_rows(self, ids, field_names):
+        paths = self.get_values_paths(field_names)
+        rows = {row['id']: row for row in self.model.objects.filter(pk__in=ids).values('id', *paths)}
+        extra = {name: self.computed_fields[name]['rows'](self, list(rows))
+                 for name in field_names if 'rows' in self.computed_fields.get(name, {})}
+        result = []
+        for pk in ids:
+            row = rows.get(pk)
+            if row is None:
+                continue
+            item = {}
+            for name in field_names:
+                if name in self.fields:
+                    item[name] = row[self.fields[name]]
+                elif 'value' in self.computed_fields[name]:
+                    item[name] = self.computed_fields[name]['value'](row)
+                else:
+                    item[name] = extra[name].get(pk, [])
+            result.append(item)
+        return result
+
+
+def get_auto_rate(row):
+    count = row['rating__review_count']
+    return row['rating__rate_sum'] / count if count else None
+
+
+def get_auto_options(resource, auto_ids):
+    options = {}
+    rows = Auto.options.through.objects.filter(auto_id__in=auto_ids).values_list('auto_id', 'option__title')
+    for auto_id, title in rows.order_by('auto_id', 'option_id'):
+        options.setdefault(auto_id, []).append(title)
+    return options
+
+
+def get_brand_logo_url(row):
+    # Как Brand.logo_url в HTML: адрес через хранилище, а не путь внутри него
+    if not row['logo']:
+        return f'{settings.STATIC_URL}images/brand-car.png'
+    return Brand._meta.get_field('logo').storage.url(row['logo'])
+
+
+class BrandResource(ApiResource):
+    model = Brand
+    fields = {'id': 'id', 'title': 'title', 'slug': 'slug'}
+    computed_fields = {
+        'logo': {'paths': ('logo',), 'value': get_brand_logo_url},
+    }
+
+
+class AutoResource(ApiResource):
+    model = Auto
+    fields = {
+        'id': 'id',
+        'number': 'number',
+        'brand_id': 'brand_id',
+        'brand': 'brand__title',
+        'year': 'year',
+        'auto_class': 'auto_class',
+        'vin': 'pts__vin',
+        'engine_volume': 'pts__engine_volume',
+        'engine_power': 'pts__engine_power',
+        'review_count': 'rating__review_count',
+    }
+    computed_fields = {
+        'rate': {'paths': ('rating__rate_sum', 'rating__review_count'), 'value': get_auto_rate},
+        'options': {'rows': get_auto_options},
+    }
+    field_permissions = {'vin': 'motorpool.view_auto'}
+    # Отзывы меняют версию своего автомобиля, отдельная зависимость от них не нужна.
+    # Название бренда берется из связанной модели: его смена меняет только версии брендов
+    related_versions = (
+        ('brand', (Brand, None)),
+        ('options', (Option, None)),
+    )
+
+
+class ApiView(View):
+    resource_class = None
+
+    def get_etag(self, ids, field_names):
+        versions = get_versions(self.resource.get_dependencies(ids, field_names))
+        # Набор полей зависит от прав пользователя, поэтому входит в ETag
+        fingerprint = f'{self.request.get_full_path()}:{field_names}:{versions}'
+        return hashlib.md5(fingerprint.encode()).hexdigest()
+
+    def get_ids(self):
+        raise NotImplementedError
+
+    def get_payload(self, rows):
+        raise NotImplementedError
+
+    def get(self, request, *args, **kwargs):
+        self.resource = self.resource_class()
+        try:
+            field_names = self.resource.get_field_names(request)
+            ids = self.get_ids()
+            etag = quote_etag(self.get_etag(ids, field_names))
+            response = get_conditional_response(request, etag=etag)
+            if response is None:
+                response = JsonResponse(self.get_payload(self.resource.get_rows(ids, field_names)),
+                                        json_dumps_params={'ensure_ascii': False})
+        except ApiError as e:
+            return JsonResponse({'error': str(e)}, status=e.status, json_dumps_params={'ensure_ascii': False})
+        response['ETag'] = etag
+        patch_vary_headers(response, ['Cookie'])
+        return response
+
+
+class ApiListView(ApiView):
+    page = None
+
+    def get_ids(self):
+        if 'ids' in self.request.GET:
+            return parse_int_list(self.request.GET['ids'], API_MAX_IDS)
+        try:
+            page_size = min(int(self.request.GET.get('limit', API_PAGE_SIZE)), API_MAX_PAGE_SIZE)
+        except ValueError:
+            raise ApiError('Параметр limit должен быть целым числом')
+        if page_size < 1:
+            raise ApiError('Параметр limit должен быть положительным')
+        paginator = CursorPaginator(self.resource.model.objects.values('id'), page_size, ['id'])
+        try:
+            self.page = paginator.get_page(after=self.request.GET.get('after'), before=self.request.GET.get('before'))
+        except Http404:
+            raise ApiError('Неверный курсор страницы')
+        return [row['id'] for row in self.page]
+
+    def get_payload(self, rows):
+        payload = {'results': rows}
+        if self.page is not None:
+            payload['next'] = self.page.next_cursor
+            payload['previous'] = self.page.previous_cursor
+        return payload
+
+
+class ApiDetailView(ApiView):
+
+    def get_ids(self):
+        return [self.kwargs['pk']]
+
+    def get_payload(self, rows):
+        if not rows:
+            raise ApiError('Объект не найден', status=404)
+        return rows[0]
+
+
+class BrandApiList(ApiListView):
+    resource_class = BrandResource
+
+
+class BrandApiDetail(ApiDetailView):
+    resource_class = BrandResource
+
+
+class AutoApiList(ApiListView):
+    resource_class = AutoResource
+
+
+class AutoApiDetail(ApiDetailView):
+    resource_class = AutoResource
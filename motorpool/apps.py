@@ -4,3 +4,6 @@ from django.apps import AppConfig
 class MotorpoolConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'motorpool'
+
+    def ready(self):
+        import motorpool.signals
@@ -0,0 +1,84 @@
+from bisect import bisect_right, insort
+
+from motorpool.models import AutoRent
+from utils.bitset import Bitset
+from utils.indexes import InProcessIndex
+
+
+class AutoIntervals:
+    __slots__ = ('rents', 'starts', 'max_ends')
+
+    def __init__(self, rents=()):
+        self.rents = sorted(rents)
+        self.compile()
+
+    def compile(self):
+        self.starts = [start for start, _ in self.rents]
+        self.max_ends = []
+        max_end = None
+        for _, end in self.rents:
+            max_end = end if max_end is None or end > max_end else max_end
+            self.max_ends.append(max_end)
+
+    def add(self, start, end):
+        insort(self.rents, (start, end))
+        self.compile()
+
+    def remove(self, start, end):
+        if (start, end) in self.rents:
+            self.rents.remove((start, end))
+            self.compile()
+
+    def overlaps(self, start, end):
+        # Среди аренд, начавшихся не позже end, хотя бы одна заканчивается не раньше start
+        position = bisect_right(self.starts, end)
+        return bool(position) and self.max_ends[position - 1] >= start
+
+
+class AvailabilityIndex(InProcessIndex):
+    version_key = 'motorpool:availability_index_version'
+
+    def reset(self):
+        self.autos = {}
+
+    def fetch(self):
+        rents = {}
+        queryset = AutoRent.objects.filter(auto__isnull=False).values_list('auto_id', 'date_start', 'date_end')
+        for auto_id, date_start, date_end in queryset.iterator(chunk_size=10000):
+            rents.setdefault(auto_id, []).append((date_start.toordinal(), date_end.toordinal()))
+        return rents
+
+    def fill(self, rents):
+        for auto_id, intervals in rents.items():
+            self.autos[auto_id] = AutoIntervals(intervals)
+
+    def add_rent(self, auto_id, date_start, date_end):
+        if auto_id is None:
+            return
+        with self.lock:
+            self.autos.setdefault(auto_id, AutoIntervals()).add(date_start.toordinal(), date_end.toordinal())
+        self.touch()
+
+    def remove_rent(self, auto_id, date_start, date_end):
+        if auto_id is None:
+            return
+        with self.lock:
+            intervals = self.autos.get(auto_id)
+            if intervals is not None:
+                intervals.remove(date_start.toordinal(), date_end.toordinal())
+                if not intervals.rents:
+                    del self.autos[auto_id]
+        self.touch()
+
+    def busy(self, date_from, date_to):
+        self.ensure_loaded()
+        start, end = date_from.toordinal(), date_to.toordinal()
+        with self.lock:
+            return Bitset(auto_id for auto_id, intervals in self.autos.items() if intervals.overlaps(start, end))
+
+
+def get_overlapping_rents(auto, date_start, date_end):
+    return AutoRent.objects.filter(auto=auto, date_start__lte=date_end, date_end__gte=date_start)
+
+
+availability_index = AvailabilityIndex()
@@ -0,0 +1,96 @@
+import csv
+import json
+
+from django.db.models import prefetch_related_objects
+
+from motorpool.availability import availability_index
+from motorpool.facets import facet_index, get_facet_filters
+from motorpool.models import Auto
+
+EXPORT_FORMATS = {
+    'csv': 'text/csv; charset=utf-8',
+    'ndjson': 'application/x-ndjson; charset=utf-8',
+}
+EXPORT_COLUMNS = ('id', 'number', 'brand', 'year', 'auto_class', 'vin', 'engine_volume', 'engine_power',
+                  'options', 'rate', 'review_count')
+EXPORT_CHUNK_SIZE = 2000
+
+
+class Echo:
+
+    def write(self, value):
+        return value
+
+
+def get_export_queryset():
+    return Auto.objects.select_related('brand', 'pts', 'rating').order_by('pk')
+
+
+def get_export_ids(form):
+    # None - фильтры не заданы, выгружается весь автопарк; некорректная форма проверяется вызывающим кодом,
+    # чтобы ошибка в фильтре не превращалась в выгрузку всего автопарка
+    if not form.is_valid():
+        raise ValueError(form.errors.as_text())
+    facet_filters = get_facet_filters(form.cleaned_data)
+    date_from = form.cleaned_data['date_from']
+    date_to = form.cleaned_data['date_to']
+    if not any(facet_filters.values()) and not date_from:
+        return None
+    ids = facet_index.search(**facet_filters)
+    if date_from and date_to:
+        ids = ids - availability_index.busy(date_from, date_to)
+    return list(ids)
+
+
+def iter_chunks(queryset, ids=None, chunk_size=EXPORT_CHUNK_SIZE):
+    if ids is None:
+        chunk = []
+        for auto in queryset.iterator(chunk_size=chunk_size):
+            chunk.append(auto)
+            if len(chunk) >= chunk_size:
+                yield chunk
+                chunk = []
+        if chunk:
+            yield chunk
+        return
+    for start in range(0, len(ids), chunk_size):
+        yield list(queryset.filter(pk__in=ids[start:start + chunk_size]))
+
+
+def iter_export_rows(ids=None, chunk_size=EXPORT_CHUNK_SIZE):
+    for chunk in iter_chunks(get_export_queryset(), ids, chunk_size):
+        prefetch_related_objects(chunk, 'options')
+        for auto in chunk:
+            pts = getattr(auto, 'pts', None)
+            rating = getattr(auto, 'rating', None)
+            yield {
+                'id': auto.pk,
+                'number': auto.number,
+                'brand': auto.brand.title if auto.brand else None,
+                'year': auto.year,
+                'auto_class': auto.auto_class,
+                'vin': pts.vin if pts else None,
+                'engine_volume': pts.engine_volume if pts else None,
+                'engine_power': pts.engine_power if pts else None,
+                'options': [option.title for option in auto.options.all()],
+                'rate': rating.rate if rating else None,
+                'review_count': rating.review_count if rating else 0,
+            }
+
+
+def iter_csv(rows):
+    writer = csv.writer(Echo())
+    yield writer.writerow(EXPORT_COLUMNS)
+    for row in rows:
+        row['options'] = ';'.join(row['options'])
+        yield writer.writerow(['' if row[column] is None else row[column] for column in EXPORT_COLUMNS])
+
+
+def iter_ndjson(rows):
+    for row in rows:
+        yield json.dumps(row, ensure_ascii=False) + '\n'
+
+
+def iter_export(file_format, ids=None, chunk_size=EXPORT_CHUNK_SIZE):
+    rows = iter_export_rows(ids, chunk_size)
+    return iter_csv(rows) if file_format == 'csv' else iter_ndjson(rows)
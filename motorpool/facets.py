@@ -0,0 +1,236 @@
+from bisect import bisect_left, bisect_right
+from functools import reduce
+from operator import and_, or_
+
+from django.conf import settings
+from django.db.models import Q
+
+from motorpool.models import Auto
+from utils.bitset import Bitset
+from utils.indexes import InProcessIndex
+
+FACETS = ('brand', 'auto_class', 'options')
+# Внутри фасета значения brand и auto_class объединяются, опции - пересекаются
+CONJUNCTIVE_FACETS = ('options',)
+
+
+class HistogramFacet:
+
+    def __init__(self, name, field, label, edges):
+        self.name = name
+        self.field = field
+        self.label = label
+        # Корзины полуоткрытые: [edges[i], edges[i + 1])
+        self.edges = tuple(sorted(edges))
+
+    @property
+    def buckets(self):
+        return list(zip(self.edges, self.edges[1:]))
+
+    def get_bucket(self, value):
+        if value is None or not self.edges or not self.edges[0] <= value < self.edges[-1]:
+            return None
+        return bisect_right(self.edges, value) - 1
+
+    def get_bucket_label(self, bucket):
+        low, high = self.buckets[bucket]
+        return f'{low}-{high - 1}'
+
+    def get_choices(self):
+        return [(str(bucket), self.get_bucket_label(bucket)) for bucket in range(len(self.buckets))]
+
+    def get_condition(self, buckets, field=None):
+        field = field or self.field
+        condition = Q()
+        for bucket in buckets:
+            low, high = self.buckets[bucket]
+            condition |= Q(**{f'{field}__gte': low, f'{field}__lt': high})
+        return condition
+
+
+HISTOGRAM_EDGES = {
+    'engine_power': (0, 101, 201, 301),
+    'engine_volume': (0, 1001, 1601, 2001, 3001),
+    'year': (1990, 2000, 2010, 2015, 2020, 2030),
+}
+HISTOGRAM_EDGES.update(getattr(settings, 'AUTO_HISTOGRAM_EDGES', {}))
+
+HISTOGRAM_FACETS = {
+    'engine_power': HistogramFacet('engine_power', 'pts__engine_power', 'Мощность двигателя',
+                                   HISTOGRAM_EDGES['engine_power']),
+    'engine_volume': HistogramFacet('engine_volume', 'pts__engine_volume', 'Объем двигателя',
+                                    HISTOGRAM_EDGES['engine_volume']),
+    'year': HistogramFacet('year', 'year', 'Год выпуска', HISTOGRAM_EDGES['year']),
+}
+ALL_FACETS = FACETS + tuple(HISTOGRAM_FACETS)
+PASSPORT_FIELDS = ('engine_power', 'engine_volume')
+
+
+def get_facet_filters(cleaned_data):
+    brand = cleaned_data.get('brand')
+    filters = {
+        'brand': [brand.pk] if brand else [],
+        'auto_class': list(cleaned_data.get('auto_class') or []),
+        'options': [option.pk for option in cleaned_data.get('options') or []],
+    }
+    for name in HISTOGRAM_FACETS:
+        filters[name] = [int(bucket) for bucket in cleaned_data.get(name) or []]
+    return filters
+
+
+def get_record_values(record):
+    values = {'brand': [record['brand']], 'auto_class': [record['auto_class']], 'options': record['options']}
+    for name, facet in HISTOGRAM_FACETS.items():
+        values[name] = [facet.get_bucket(record[name])]
+    return values
+
+
+class AutoFacetIndex(InProcessIndex):
+    version_key = 'motorpool:facet_index_version'
+
+    def reset(self):
+        self.autos = {}
+        self.facets = {name: {} for name in ALL_FACETS}
+        self.all = Bitset()
+
+    def fetch(self):
+        autos = {}
+        rows = Auto.objects.values_list('pk', 'brand_id', 'auto_class', 'year',
+                                        'pts__engine_power', 'pts__engine_volume')
+        for pk, brand_id, auto_class, year, engine_power, engine_volume in rows.iterator():
+            autos[pk] = {'brand': brand_id, 'auto_class': auto_class, 'options': set(), 'year': year,
+                         'engine_power': engine_power, 'engine_volume': engine_volume}
+        for auto_id, option_id in Auto.options.through.objects.values_list('auto_id', 'option_id').iterator():
+            if auto_id in autos:
+                autos[auto_id]['options'].add(option_id)
+        return autos
+
+    def fill(self, autos):
+        for pk, record in autos.items():
+            self._index(pk, record)
+
+    def _index(self, pk, record):
+        record = dict(record, options=frozenset(record['options']))
+        self.autos[pk] = record
+        self.all.add(pk)
+        for name, facet_values in get_record_values(record).items():
+            for value in facet_values:
+                if value is not None:
+                    self.facets[name].setdefault(value, Bitset()).add(pk)
+
+    def _unindex(self, pk):
+        record = self.autos.pop(pk, None)
+        self.all.discard(pk)
+        if record is None:
+            return None
+        for name, facet_values in get_record_values(record).items():
+            for value in facet_values:
+                bitset = self.facets[name].get(value)
+                if bitset is not None:
+                    bitset.discard(pk)
+                    if not bitset:
+                        del self.facets[name][value]
+        return record
+
+    def _update(self, pk, **changes):
+        record = self._unindex(pk) or {'brand': None, 'auto_class': None, 'options': frozenset(), 'year': None,
+                                       'engine_power': None, 'engine_volume': None}
+        record.update(changes)
+        self._index(pk, record)
+
+    def update_auto(self, pk, brand_id, auto_class, year=None):
+        with self.lock:
+            self._update(pk, brand=brand_id, auto_class=auto_class, year=year)
+        self.touch()
+
+    def update_passport(self, pk, engine_power=None, engine_volume=None):
+        with self.lock:
+            if pk in self.autos:
+                self._update(pk, engine_power=engine_power, engine_volume=engine_volume)
+        self.touch()
+
+    def remove_auto(self, pk):
+        with self.lock:
+            self._unindex(pk)
+        self.touch()
+
+    def change_options(self, auto_ids, add=(), remove=(), clear=False):
+        with self.lock:
+            for pk in auto_ids:
+                if pk not in self.autos:
+                    continue
+                option_ids = (set() if clear else set(self.autos[pk]['options']) - set(remove)) | set(add)
+                self._update(pk, options=option_ids)
+        self.touch()
+
+    def remove_option(self, option_id):
+        with self.lock:
+            bitset = self.facets['options'].get(option_id, Bitset())
+        self.change_options(list(bitset), remove=[option_id])
+
+    def _select(self, name, values):
+        bitsets = [self.facets[name].get(value, Bitset()) for value in values]
+        return reduce(and_ if name in CONJUNCTIVE_FACETS else or_, bitsets)
+
+    def _search(self, filters, exclude=None):
+        result = self.all
+        for name, values in filters.items():
+            if values and name != exclude:
+                result = result & self._select(name, values)
+        return result
+
+    def search(self, **filters):
+        self.ensure_loaded()
+        with self.lock:
+            return self._search(filters)
+
+    def counts(self, excluded_ids=None, **filters):
+        self.ensure_loaded()
+        with self.lock:
+            counts = {}
+            for name in ALL_FACETS:
+                exclude = None if name in CONJUNCTIVE_FACETS else name
+                base = self._search(filters, exclude=exclude)
+                if excluded_ids:
+                    base = base - excluded_ids
+                counts[name] = {value: len(base & bitset) for value, bitset in self.facets[name].items()}
+            return counts
+
+    def histogram(self, name):
+        self.ensure_loaded()
+        with self.lock:
+            return {bucket: len(bitset) for bucket, bitset in self.facets[name].items()}
+
+
+class AutoIdSequence:
+
+    def __init__(self, queryset, ids):
+        self.queryset = queryset
+        self.model = queryset.model
+        self.ids = ids
+
+    def count(self):
+        return len(self.ids)
+
+    def __len__(self):
+        return len(self.ids)
+
+    def __iter__(self):
+        return iter(self[:])
+
+    def __getitem__(self, item):
+        if isinstance(item, slice):
+            ids = self.ids[item]
+            objects = self.queryset.in_bulk(ids)
+            return [objects[pk] for pk in ids if pk in objects]
+        return self[item:item + 1][0]
+
+    def cursor_slice(self, values, reverse, limit):
+        if reverse:
+            end = bisect_left(self.ids, values[0]) if values is not None else len(self.ids)
+            return self[max(end - limit, 0):end][::-1]
+        start = bisect_right(self.ids, values[0]) if values is not None else 0
+        return self[start:start + limit]
+
+
+facet_index = AutoFacetIndex()
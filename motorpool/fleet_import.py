@@ -0,0 +1,178 @@
+import csv
+import json
+import os
+import re
+
+from django.db import IntegrityError, transaction
+
+from motorpool.facets import facet_index
+from motorpool.fleet_summary import rebuild_summaries
+from motorpool.models import Brand, Option, Auto, VehiclePassport, AutoRating
+from utils.cache import bump_versions
+from utils.counts import invalidate_count
+from utils.models import generate_unique_slugs, reset_sequences
+
+IMPORT_MODELS = {
+    'motorpool.option': Option,
+    'motorpool.brand': Brand,
+    'motorpool.auto': Auto,
+    'motorpool.vehiclepassport': VehiclePassport,
+}
+FOREIGN_KEYS = {
+    'brand': 'brand_id',
+    'auto': 'auto_id',
+}
+SEPARATORS = re.compile(r'[\s,\[\]]*')
+
+
+class FleetImportError(Exception):
+    pass
+
+
+def iter_json_records(file, buffer_size=1 << 16):
+    # Потоковый разбор JSON-массива фикстуры или JSON Lines без загрузки файла целиком
+    decoder = json.JSONDecoder()
+    buffer = ''
+    position = 0
+    eof = False
+    while True:
+        position = SEPARATORS.match(buffer, position).end()
+        if position < len(buffer):
+            try:
+                record, position = decoder.raw_decode(buffer, position)
+            except json.JSONDecodeError:
+                if eof:
+                    raise FleetImportError(f'Некорректный JSON: {buffer[position:position + 100]}')
+            else:
+                yield record
+                continue
+        elif eof:
+            return
+        chunk = file.read(buffer_size)
+        eof = not chunk
+        buffer = buffer[position:] + chunk
+        position = 0
+
+
+def iter_csv_records(file):
+    for row in csv.DictReader(file):
+        fields = {key: value for key, value in row.items() if key not in ('model', 'pk') and value not in ('', None)}
+        if 'options' in fields:
+            fields['options'] = [int(option_id) for option_id in fields['options'].split(';') if option_id]
+        yield {'model': row['model'], 'pk': row.get('pk') or None, 'fields': fields}
+
+
+def iter_records(file, file_format):
+    return iter_csv_records(file) if file_format == 'csv' else iter_json_records(file)
+
+
+def build_object(record):
+    label = record.get('model', '').lower()
+    model = IMPORT_MODELS.get(label)
+    if model is None:
+        raise FleetImportError(f'Неизвестная модель: {label}')
+    fields = dict(record.get('fields', {}))
+    option_ids = fields.pop('options', None) or []
+    for name, attname in FOREIGN_KEYS.items():
+        if name in fields:
+            fields[attname] = fields.pop(name)
+    obj = model(pk=record.get('pk'), **fields)
+    if option_ids and obj.pk is None:
+        raise FleetImportError(f'Для назначения опций автомобилю {obj} нужен pk')
+    return obj, option_ids
+
+
+def get_touched_dependencies(objects):
+    # Версии страниц существующих брендов и автомобилей, которые меняет импорт
+    dependencies = {(Brand, brand.pk) for brand in objects[Brand] if brand.pk is not None}
+    dependencies.update((Brand, auto.brand_id) for auto in objects[Auto] if auto.brand_id is not None)
+    dependencies.update((Auto, passport.auto_id) for passport in objects[VehiclePassport]
+                        if passport.auto_id is not None)
+    return dependencies
+
+
+@transaction.atomic
+def import_chunk(records, batch_size, dependencies=None):
+    objects = {model: [] for model in IMPORT_MODELS.values()}
+    assignments = []
+    for record in records:
+        obj, option_ids = build_object(record)
+        objects[type(obj)].append(obj)
+        assignments.extend(Auto.options.through(auto_id=obj.pk, option_id=option_id) for option_id in option_ids)
+    if dependencies is not None:
+        dependencies.update(get_touched_dependencies(objects))
+
+    brands = objects[Brand]
+    for brand, slug in zip(brands, generate_unique_slugs(Brand, [brand.title for brand in brands])):
+        brand.slug = slug
+
+    for model, model_objects in objects.items():
+        model.objects.bulk_create(model_objects, batch_size=batch_size)
+    Auto.options.through.objects.bulk_create(assignments, batch_size=batch_size, ignore_conflicts=True)
+    AutoRating.objects.bulk_create([AutoRating(auto_id=auto.pk) for auto in objects[Auto] if auto.pk is not None],
+                                   batch_size=batch_size, ignore_conflicts=True)
+    return {model: len(model_objects) for model, model_objects in objects.items()}
+
+
+def read_progress(progress_path):
+    if not progress_path or not os.path.exists(progress_path):
+        return 0
+    with open(progress_path) as file:
+        return json.load(file).get('records', 0)
+
+
+def write_progress(progress_path, records):
+    if not progress_path:
+        return
+    tmp_path = f'{progress_path}.tmp'
+    with open(tmp_path, 'w') as file:
+        json.dump({'records': records}, file)
+    os.replace(tmp_path, progress_path)
+
+
+def import_fleet(file, file_format='json', chunk_size=5000, progress_path=None, resume=False, callback=None,
+                 attempts=3):
+    skip = read_progress(progress_path) if resume else 0
+    done = skip
+    totals = {model: 0 for model in IMPORT_MODELS.values()}
+    chunk = []
+    dependencies = {(Brand, None), (Auto, None)}
+
+    def flush():
+        nonlocal done
+        for attempt in range(attempts):
+            try:
+                counts = import_chunk(chunk, batch_size=min(chunk_size, 1000), dependencies=dependencies)
+                break
+            except IntegrityError:
+                # Слаги могли занять параллельно, пересчитываем их для всего чанка
+                if attempt == attempts - 1:
+                    raise
+        for model, count in counts.items():
+            totals[model] += count
+        done += len(chunk)
+        chunk.clear()
+        write_progress(progress_path, done)
+        if callback:
+            callback(done, counts)
+
+    try:
+        for position, record in enumerate(iter_records(file, file_format)):
+            if position < skip:
+                continue
+            chunk.append(record)
+            if len(chunk) >= chunk_size:
+                flush()
+        if chunk:
+            flush()
+    finally:
+        if done > skip:
+            reset_sequences(IMPORT_MODELS.values())
+            rebuild_summaries()
+            invalidate_count(Brand)
+            invalidate_count(Auto)
+            invalidate_count(VehiclePassport)
+            facet_index.touch()
+            # Массовая вставка не шлет сигналов, поэтому кэш страниц сбрасывается здесь
+            bump_versions(dependencies)
+    return totals
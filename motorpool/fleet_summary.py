@@ -0,0 +1,64 @@
+from django.db import IntegrityError, transaction
+from django.db.models import F
+
+from motorpool.models import Auto, Brand, BrandFleetSummary
+
+SUMMARY_FIELDS = ['car_count', 'total_engine_power', 'new_cars', 'old_cars']
+
+
+def get_auto_contribution(year, engine_power, count=1):
+    return {
+        'car_count': count,
+        'total_engine_power': engine_power or 0,
+        'new_cars': count if year is not None and year > BrandFleetSummary.NEW_CAR_YEAR else 0,
+        'old_cars': count if year is not None and year < BrandFleetSummary.NEW_CAR_YEAR else 0,
+    }
+
+
+def apply_summary_delta(brand_id, values, sign=1):
+    values = {field: sign * value for field, value in values.items() if value}
+    if brand_id is None or not values:
+        return
+    updated = BrandFleetSummary.objects.filter(brand_id=brand_id).update(
+        **{field: F(field) + value for field, value in values.items()}
+    )
+    # Вычитать из отсутствующей сводки нечего: при каскадном удалении бренда она удаляется раньше автомобилей
+    if updated or sign < 0:
+        return
+    try:
+        with transaction.atomic():
+            BrandFleetSummary.objects.create(brand_id=brand_id, **values)
+    except IntegrityError:
+        apply_summary_delta(brand_id, values)
+
+
+def calculate_summaries():
+    summaries = {}
+    rows = Auto.objects.filter(brand__isnull=False).values_list('brand_id', 'year', 'pts__engine_power')
+    for brand_id, year, engine_power in rows.iterator(chunk_size=10000):
+        summary = summaries.setdefault(brand_id, BrandFleetSummary(brand_id=brand_id))
+        for field, value in get_auto_contribution(year, engine_power).items():
+            setattr(summary, field, getattr(summary, field) + value)
+    return summaries
+
+
+def get_summary_values(summary):
+    return [getattr(summary, field) for field in SUMMARY_FIELDS]
+
+
+@transaction.atomic
+def rebuild_summaries(batch_size=1000):
+    summaries = calculate_summaries()
+    stale = []
+    for summary in BrandFleetSummary.objects.select_for_update().iterator(chunk_size=batch_size):
+        actual = summaries.get(summary.brand_id, BrandFleetSummary(brand_id=summary.brand_id))
+        if get_summary_values(summary) != get_summary_values(actual):
+            stale.append(actual)
+    BrandFleetSummary.objects.bulk_update(stale, SUMMARY_FIELDS, batch_size=batch_size)
+
+    missing = [
+        summaries.get(brand_id, BrandFleetSummary(brand_id=brand_id))
+        for brand_id in Brand.objects.filter(fleet_summary__isnull=True).values_list('pk', flat=True).iterator()
+    ]
+    BrandFleetSummary.objects.bulk_create(missing, batch_size=batch_size)
+    return len(missing), len(stale)
@@ -2,6 +2,8 @@ from django import forms
 from django.shortcuts import get_object_or_404
 from django.urls import reverse_lazy
 
+from motorpool.availability import get_overlapping_rents
+from motorpool.facets import HISTOGRAM_FACETS
 from motorpool.models import Brand, Auto, Favorite, AutoReview, AutoRent, Option
 
 
@@ -206,6 +208,14 @@ class AutoRentForm(forms.ModelForm):
         if AutoRent.objects.filter(user=cleaned_data['user'], auto=cleaned_data['auto']).exists():
             raise forms.ValidationError(f'Вы уже забронировали этот автомобиль')
 
+        date_start = cleaned_data.get('date_start')
+        date_end = cleaned_data.get('date_end')
+        if date_start and date_end:
+            if date_start > date_end:
+                raise forms.ValidationError('Дата окончания не может быть раньше даты начала')
+            if get_overlapping_rents(cleaned_data['auto'], date_start, date_end).exists():
+                raise forms.ValidationError('Автомобиль уже забронирован на выбранные даты')
+
         return cleaned_data
 
     def get_redirect_url(self):
@@ -219,12 +229,49 @@ class AutoFilterForm(forms.Form):
     brand = forms.ModelChoiceField(label='Бренд', queryset=Brand.objects.all(), required=False)
     auto_class = forms.MultipleChoiceField(label='Класс авто', choices=Auto.AUTO_CLASS_CHOICES, required=False)
     options = forms.ModelMultipleChoiceField(label='Опции', queryset=Option.objects.all(), required=False)
+    date_from = forms.DateField(label='Свободен с', required=False)
+    date_to = forms.DateField(label='Свободен по', required=False)
 
     def __init__(self, *args, **kwargs):
         super().__init__(*args, **kwargs)
+        for name, facet in HISTOGRAM_FACETS.items():
+            self.fields[name] = forms.MultipleChoiceField(label=facet.label, choices=facet.get_choices(),
+                                                          required=False)
+            self.fields[name].widget.attrs.update({'class': 'form-select', 'multiple': True})
         self.fields['brand'].widget.attrs.update({'class': 'form-select'})
         self.fields['auto_class'].widget.attrs.update({'class': 'form-select', 'multiple': True})
         self.fields['options'].widget.attrs.update({'class': 'form-select', 'multiple': True})
+        for field in ('date_from', 'date_to'):
+            self.fields[field].widget = forms.DateInput(format="%Y-%m-%d", attrs={'type': 'date'})
+            self.fields[field].widget.attrs.update({'class': 'form-control'})
+
+    def clean(self):
+        cleaned_data = super().clean()
+        date_from = cleaned_data.get('date_from')
+        date_to = cleaned_data.get('date_to')
+
+        if bool(date_from) != bool(date_to):
+            raise forms.ValidationError('Укажите обе даты периода')
+
+        if date_from and date_from > date_to:
+            raise forms.ValidationError('Дата окончания не может быть раньше даты начала')
+
+        return cleaned_data
+
+    def set_facet_counts(self, counts):
+        brand_counts = counts.get('brand', {})
+        option_counts = counts.get('options', {})
+        class_counts = counts.get('auto_class', {})
+        self.fields['brand'].label_from_instance = lambda obj: f'{obj} ({brand_counts.get(obj.pk, 0)})'
+        self.fields['options'].label_from_instance = lambda obj: f'{obj} ({option_counts.get(obj.pk, 0)})'
+        self.fields['auto_class'].choices = [
+            (value, f'{label} ({class_counts.get(value, 0)})') for value, label in Auto.AUTO_CLASS_CHOICES
+        ]
+        for name, facet in HISTOGRAM_FACETS.items():
+            bucket_counts = counts.get(name, {})
+            self.fields[name].choices = [
+                (value, f'{label} ({bucket_counts.get(int(value), 0)})') for value, label in facet.get_choices()
+            ]
 
 
 class AutoFilterFormAutoClass(forms.Form):
@@ -0,0 +1,58 @@
+import random
+import time
+from datetime import date
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db.models import Max, Min
+
+from motorpool.availability import availability_index
+from motorpool.models import AutoRent
+from utils.bitset import Bitset
+
+
+def get_busy_from_db(date_from, date_to):
+    queryset = AutoRent.objects.filter(auto__isnull=False, date_start__lte=date_to, date_end__gte=date_from)
+    return Bitset(queryset.values_list('auto_id', flat=True).distinct())
+
+
+class Command(BaseCommand):
+    help = 'Сравнивает поиск занятых автомобилей по индексу и запросом к базе (данные из seed_synthetic)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--queries', type=int, default=20)
+        parser.add_argument('--seed', type=int, default=0)
+
+    def handle(self, *args, **options):
+        if options['queries'] < 1:
+            raise CommandError('Число запросов должно быть положительным')
+        bounds = AutoRent.objects.aggregate(first=Min('date_start'), last=Max('date_end'))
+        if bounds['first'] is None:
+            raise CommandError('В базе нет аренд, запустите seed_synthetic')
+        rnd = random.Random(options['seed'])
+        first_day, last_day = bounds['first'].toordinal(), bounds['last'].toordinal()
+        ranges = []
+        for _ in range(options['queries']):
+            start = rnd.randint(first_day, last_day)
+            ranges.append((date.fromordinal(start), date.fromordinal(start + rnd.randint(1, 14))))
+
+        started = time.perf_counter()
+        availability_index.load()
+        build_time = time.perf_counter() - started
+
+        started = time.perf_counter()
+        for date_from, date_to in ranges:
+            busy = availability_index.busy(date_from, date_to)
+        index_time = (time.perf_counter() - started) / len(ranges)
+
+        started = time.perf_counter()
+        for date_from, date_to in ranges:
+            expected = get_busy_from_db(date_from, date_to)
+        db_time = (time.perf_counter() - started) / len(ranges)
+
+        if busy != expected:
+            self.stderr.write(self.style.ERROR('Результаты индекса и запроса к базе не совпадают'))
+        self.stdout.write(f'Аренд: {AutoRent.objects.count()}, автомобилей с арендами: {len(availability_index.autos)}')
+        self.stdout.write(f'Построение индекса: {build_time:.3f} с')
+        self.stdout.write(f'Запрос по индексу: {index_time * 1000:.1f} мс')
+        self.stdout.write(f'Запрос к базе: {db_time * 1000:.1f} мс')
+        self.stdout.write(f'Занято {len(busy)} автомобилей на период {ranges[-1][0]} - {ranges[-1][1]}')
@@ -0,0 +1,39 @@
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db.models import Sum
+
+from motorpool.models import Auto, VehiclePassport
+from motorpool.tax import FleetColumns, FleetTaxReport, get_tax_expression
+
+
+class Command(BaseCommand):
+    help = ('Сравнивает налог по брендам через NumPy с аннотированным запросом ORM на текущей базе '
+            '(например, после seed_synthetic --autos 1000000)')
+
+    def handle(self, *args, **options):
+        passports = VehiclePassport.objects.count()
+        if not passports:
+            raise CommandError('В базе нет паспортов, запустите seed_synthetic')
+
+        started = time.perf_counter()
+        queryset = Auto.objects.filter(pts__isnull=False).order_by().values('brand_id').annotate(
+            tax=Sum(get_tax_expression()))
+        expected = {row['brand_id']: row['tax'] or 0 for row in queryset}
+        orm_time = time.perf_counter() - started
+
+        started = time.perf_counter()
+        columns = FleetColumns.load()
+        load_time = time.perf_counter() - started
+        started = time.perf_counter()
+        by_brand = dict(FleetTaxReport(columns).by_brand())
+        vector_time = time.perf_counter() - started
+
+        if by_brand.keys() != expected.keys() or any(
+                abs(by_brand[brand_id] - total) > 1e-6 * max(total, 1) for brand_id, total in expected.items()):
+            self.stderr.write(self.style.ERROR('Расчет NumPy и запрос ORM не совпадают'))
+        self.stdout.write(f'Паспортов: {passports}, брендов: {len(expected)}')
+        self.stdout.write(f'ORM: {orm_time * 1000:.1f} мс')
+        self.stdout.write(f'NumPy: загрузка {load_time * 1000:.1f} мс, расчет {vector_time * 1000:.1f} мс, '
+                          f'всего {(load_time + vector_time) * 1000:.1f} мс')
+        self.stdout.write(f'Налог: {sum(by_brand.values()):.2f}')
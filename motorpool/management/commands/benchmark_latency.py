@@ -0,0 +1,89 @@
+import os
+import subprocess
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+from urllib.request import urlopen
+
+from django.core.management.base import BaseCommand, CommandError
+
+SERVERS = {
+    'wsgi': {'SERVER_APP': 'pstaxi.wsgi', 'SERVER_WORKER': 'sync', 'ASYNC_VIEWS': 'false'},
+    'asgi': {'SERVER_APP': 'pstaxi.asgi:application', 'SERVER_WORKER': 'uvicorn.workers.UvicornWorker',
+             'ASYNC_VIEWS': 'true'},
+}
+DEFAULT_PATHS = ('/motorpool/auto-detail/1/', '/motorpool/brand-detail/1/', '/motorpool/auto-list/')
+
+
+def get_percentile(values, percent):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * percent / 100))]
+
+
+class Command(BaseCommand):
+    help = 'Сравнивает задержки p50/p99 каталога под конкурентной нагрузкой для gunicorn (WSGI) и uvicorn (ASGI)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--server', choices=('wsgi', 'asgi', 'both'), default='both')
+        parser.add_argument('--url', default=None, help='Адрес уже запущенного сервера вместо запуска своего')
+        parser.add_argument('--path', action='append', dest='paths', default=[])
+        parser.add_argument('--requests', type=int, default=500)
+        parser.add_argument('--concurrency', type=int, default=20)
+        parser.add_argument('--workers', type=int, default=2)
+        parser.add_argument('--port', type=int, default=8765)
+
+    def measure(self, base_url, paths, requests, concurrency):
+        def fetch(index):
+            started = time.perf_counter()
+            with urlopen(base_url + paths[index % len(paths)]) as response:
+                response.read()
+            return time.perf_counter() - started
+
+        for path in paths:
+            fetch(paths.index(path))
+        started = time.perf_counter()
+        with ThreadPoolExecutor(concurrency) as executor:
+            latencies = list(executor.map(fetch, range(requests)))
+        return latencies, time.perf_counter() - started
+
+    def start_server(self, server, options):
+        env = dict(os.environ, **SERVERS[server])
+        bind = f'127.0.0.1:{options["port"]}'
+        process = subprocess.Popen(
+            [sys.executable, '-m', 'gunicorn', env['SERVER_APP'], '--worker-class', env['SERVER_WORKER'],
+             '--workers', str(options['workers']), '--bind', bind, '--log-level', 'warning'],
+            env=env,
+        )
+        base_url = f'http://{bind}'
+        for _ in range(100):
+            try:
+                urlopen(base_url + '/', timeout=5).close()
+                return process, base_url
+            except OSError:
+                if process.poll() is not None:
+                    raise CommandError(f'Сервер {server} не запустился')
+                time.sleep(0.1)
+        process.terminate()
+        raise CommandError(f'Сервер {server} не ответил')
+
+    def report(self, title, latencies, elapsed):
+        self.stdout.write(
+            f'{title}: p50 {get_percentile(latencies, 50) * 1000:.1f} мс, '
+            f'p99 {get_percentile(latencies, 99) * 1000:.1f} мс, '
+            f'{len(latencies) / elapsed:.0f} запр/с'
+        )
+
+    def handle(self, *args, **options):
+        paths = options['paths'] or list(DEFAULT_PATHS)
+        if options['url']:
+            self.report(options['url'], *self.measure(options['url'].rstrip('/'), paths, options['requests'],
+                                                      options['concurrency']))
+            return
+        servers = ('wsgi', 'asgi') if options['server'] == 'both' else (options['server'],)
+        for server in servers:
+            process, base_url = self.start_server(server, options)
+            try:
+                self.report(server, *self.measure(base_url, paths, options['requests'], options['concurrency']))
+            finally:
+                process.terminate()
+                process.wait()
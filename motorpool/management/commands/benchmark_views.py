@@ -0,0 +1,175 @@
+import json
+import subprocess
+import time
+import tracemalloc
+from datetime import datetime
+
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connections
+from django.db.models import Count
+from django.test import Client, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+
+from motorpool.facets import facet_index
+from motorpool.models import Auto, Brand
+from utils.cache import bump_versions
+from .benchmark_latency import get_percentile
+
+# Только GET-запросы: изменяющие представления исказили бы данные между прогонами
+CLIENT_DEFAULTS = {'HTTP_HOST': 'localhost', 'REMOTE_ADDR': '10.0.0.1'}
+
+
+def get_benchmark_views():
+    brand = Brand.objects.annotate(car_count=Count('cars')).order_by('-car_count').first()
+    auto = Auto.objects.order_by('pk').first()
+    if brand is None or auto is None:
+        raise CommandError('В базе нет брендов или автомобилей, запустите seed_synthetic')
+    # Третий элемент - версии кэша страницы, которые сбрасываются перед холодным запросом
+    return {
+        'index': (reverse('main:index'), {}, []),
+        'brand_list': (reverse('motorpool:brand_list'), {}, []),
+        'brand_detail': (reverse('motorpool:brand_detail', args=[brand.pk]), {}, [(Brand, brand.pk)]),
+        'auto_list': (reverse('motorpool:auto_list'), {}, []),
+        'auto_list_filtered': (reverse('motorpool:auto_list'), {'brand': brand.pk, 'auto_class': Auto.AUTO_CLASS_ECONOMY},
+                               []),
+        'auto_detail': (reverse('motorpool:auto_detail', args=[auto.pk]), {}, [(Auto, auto.pk)]),
+        'fleet_summary': (reverse('motorpool:fleet_summary'), {}, []),
+        'api_brand_list': (reverse('motorpool:api_brand_list'), {}, []),
+        'api_brand_detail': (reverse('motorpool:api_brand_detail', args=[brand.pk]), {}, []),
+        'api_auto_list': (reverse('motorpool:api_auto_list'), {}, []),
+        'api_auto_detail': (reverse('motorpool:api_auto_detail', args=[auto.pk]), {}, []),
+    }
+
+
+def get_commit():
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True,
+                              check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+class Command(BaseCommand):
+    help = 'Прогоняет представления через тестовый клиент и сохраняет p50/p95/p99, число запросов и пик памяти в JSON'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--iterations', type=int, default=50)
+        parser.add_argument('--warmup', type=int, default=3)
+        parser.add_argument('--view', action='append', dest='views', default=[])
+        parser.add_argument('--user', default=None, help='Имя пользователя, от которого выполняются запросы')
+        parser.add_argument('--cold', action='store_true',
+                            help='Сбрасывать версии кэша страницы и индекс фасетов перед каждым запросом')
+        parser.add_argument('--output', default=None, help='Файл для результатов, по умолчанию stdout')
+        parser.add_argument('--metrics-overhead', action='store_true',
+                            help='Дополнительно мерить p50 без RequestMetricsMiddleware и считать накладные расходы метрик')
+
+    def request(self, client, url, data, cold_dependencies=None):
+        # Весь кэш не очищается: в общем кэше лежат сессии, пользователи и версии, и прогон на живой
+        # базе разлогинил бы всех; новая версия дает промах только по этой странице
+        if cold_dependencies is not None:
+            bump_versions(cold_dependencies)
+            facet_index.loaded = False
+        contexts = [CaptureQueriesContext(connection) for connection in connections.all()]
+        for context in contexts:
+            context.__enter__()
+        try:
+            response = client.get(url, data)
+            if response.streaming:
+                b''.join(response.streaming_content)
+        finally:
+            for context in contexts:
+                context.__exit__(None, None, None)
+        return response, sum(len(context) for context in contexts)
+
+    def measure(self, client, url, data, dependencies, options):
+        cold_dependencies = dependencies if options['cold'] else None
+        for _ in range(options['warmup']):
+            client.get(url, data)
+            if self.plain_client:
+                self.plain_client.get(url, data)
+        latencies, plain_latencies, queries = [], [], []
+        for _ in range(options['iterations']):
+            started = time.perf_counter()
+            response, count = self.request(client, url, data, cold_dependencies)
+            latencies.append(time.perf_counter() - started)
+            queries.append(count)
+            # Прогоны с метриками и без чередуются, чтобы дрейф машины не попал в разницу
+            if self.plain_client:
+                started = time.perf_counter()
+                self.request(self.plain_client, url, data, cold_dependencies)
+                plain_latencies.append(time.perf_counter() - started)
+        # tracemalloc заметно замедляет выполнение, поэтому память меряется отдельным запросом
+        tracemalloc.start()
+        try:
+            self.request(client, url, data, cold_dependencies)
+            peak = tracemalloc.get_traced_memory()[1]
+        finally:
+            tracemalloc.stop()
+        result = {
+            'url': url,
+            'params': data,
+            'status': response.status_code,
+            'p50_ms': round(get_percentile(latencies, 50) * 1000, 2),
+            'p95_ms': round(get_percentile(latencies, 95) * 1000, 2),
+            'p99_ms': round(get_percentile(latencies, 99) * 1000, 2),
+            'queries': max(queries),
+            'peak_memory_kb': round(peak / 1024, 1),
+        }
+        if plain_latencies:
+            plain_p50 = get_percentile(plain_latencies, 50)
+            result['p50_without_metrics_ms'] = round(plain_p50 * 1000, 2)
+            result['metrics_overhead_pct'] = round((get_percentile(latencies, 50) / plain_p50 - 1) * 100, 2)
+        return result
+
+    def get_plain_client(self, user):
+        # Цепочка middleware собирается при первом запросе клиента, поэтому без метрик первый запрос идет
+        # с METRICS_ENABLED=False; обертка SQL остается, но без метрик запроса сразу передает вызов дальше
+        client = Client(**CLIENT_DEFAULTS)
+        if user:
+            client.force_login(user)
+        with override_settings(METRICS_ENABLED=False):
+            client.get(reverse('main:index'))
+        return client
+
+    def handle(self, *args, **options):
+        if options['iterations'] < 1:
+            raise CommandError('Число итераций должно быть положительным')
+        views = get_benchmark_views()
+        unknown = set(options['views']) - set(views)
+        if unknown:
+            raise CommandError(f'Неизвестные представления: {", ".join(sorted(unknown))}')
+        client = Client(**CLIENT_DEFAULTS)
+        user = None
+        if options['user']:
+            try:
+                user = User.objects.get(username=options['user'])
+            except User.DoesNotExist:
+                raise CommandError(f'Пользователь {options["user"]} не найден')
+            client.force_login(user)
+        self.plain_client = self.get_plain_client(user) if options['metrics_overhead'] else None
+        results = {}
+        for name in options['views'] or views:
+            url, data, dependencies = views[name]
+            results[name] = self.measure(client, url, data, dependencies, options)
+            message = f'{name}: p50 {results[name]["p50_ms"]} мс, запросов {results[name]["queries"]}'
+            if 'metrics_overhead_pct' in results[name]:
+                message += f', накладные расходы метрик {results[name]["metrics_overhead_pct"]}%'
+            self.stderr.write(message)
+        report = {
+            'commit': get_commit(),
+            'created': datetime.now().isoformat(timespec='seconds'),
+            'database': connections['default'].vendor,
+            'autos': Auto.objects.count(),
+            'iterations': options['iterations'],
+            'cold': options['cold'],
+            'user': options['user'],
+            'views': results,
+        }
+        output = json.dumps(report, ensure_ascii=False, indent=2)
+        if options['output']:
+            with open(options['output'], 'w', encoding='utf-8') as file:
+                file.write(output + '\n')
+        else:
+            self.stdout.write(output)
@@ -0,0 +1,36 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from motorpool.export import EXPORT_CHUNK_SIZE, get_export_ids, iter_export
+from motorpool.forms import AutoFilterForm
+
+
+class Command(BaseCommand):
+    help = 'Потоково выгружает автомобили с паспортами, опциями и рейтингом в CSV или NDJSON'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--format', choices=('csv', 'ndjson'), default='csv')
+        parser.add_argument('--output', default=None, help='Файл для выгрузки, по умолчанию stdout')
+        parser.add_argument('--chunk-size', type=int, default=EXPORT_CHUNK_SIZE)
+        parser.add_argument('--brand', default=None)
+        parser.add_argument('--auto-class', action='append', default=[])
+        parser.add_argument('--option', action='append', default=[])
+        parser.add_argument('--date-from', default=None)
+        parser.add_argument('--date-to', default=None)
+
+    def handle(self, *args, **options):
+        form = AutoFilterForm({
+            'brand': options['brand'],
+            'auto_class': options['auto_class'],
+            'options': options['option'],
+            'date_from': options['date_from'],
+            'date_to': options['date_to'],
+        })
+        if not form.is_valid():
+            raise CommandError(form.errors.as_text())
+        chunks = iter_export(options['format'], get_export_ids(form), options['chunk_size'])
+        if options['output']:
+            with open(options['output'], 'w', encoding='utf-8', newline='') as file:
+                file.writelines(chunks)
+        else:
+            for chunk in chunks:
+                self.stdout.write(chunk, ending='')
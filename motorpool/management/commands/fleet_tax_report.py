@@ -0,0 +1,19 @@
+from django.core.management.base import BaseCommand
+
+from motorpool.tax import FleetColumns, FleetTaxReport, REPORT_GROUPS, write_report_csv
+
+
+class Command(BaseCommand):
+    help = 'Рассчитывает налог по объему двигателя для всего автопарка и выводит его в CSV'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--group', choices=REPORT_GROUPS, default='brand')
+        parser.add_argument('--output', default=None, help='Файл для отчета, по умолчанию stdout')
+
+    def handle(self, *args, **options):
+        report = FleetTaxReport(FleetColumns.load())
+        if options['output']:
+            with open(options['output'], 'w', newline='', encoding='utf-8') as file:
+                write_report_csv(report, options['group'], file)
+        else:
+            write_report_csv(report, options['group'], self.stdout)
@@ -0,0 +1,32 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from motorpool.fleet_import import import_fleet, FleetImportError
+
+
+class Command(BaseCommand):
+    help = 'Потоково импортирует бренды, автомобили, паспорта и опции из JSON или CSV'
+
+    def add_arguments(self, parser):
+        parser.add_argument('path')
+        parser.add_argument('--format', choices=('json', 'csv'), default=None)
+        parser.add_argument('--chunk-size', type=int, default=5000)
+        parser.add_argument('--progress-file', default=None)
+        parser.add_argument('--resume', action='store_true')
+
+    def handle(self, *args, **options):
+        path = options['path']
+        file_format = options['format'] or ('csv' if path.lower().endswith('.csv') else 'json')
+        progress_path = options['progress_file'] or f'{path}.progress'
+
+        def report(done, counts):
+            self.stdout.write(f'Обработано записей: {done}')
+
+        try:
+            with open(path, encoding='utf-8', newline='') as file:
+                totals = import_fleet(file, file_format, chunk_size=options['chunk_size'],
+                                      progress_path=progress_path, resume=options['resume'], callback=report)
+        except FleetImportError as e:
+            raise CommandError(e)
+
+        summary = ', '.join(f'{model._meta.verbose_name_plural}: {count}' for model, count in totals.items())
+        self.stdout.write(self.style.SUCCESS(f'Импорт завершен. {summary}'))
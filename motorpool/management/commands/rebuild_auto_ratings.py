@@ -0,0 +1,14 @@
+from django.core.management.base import BaseCommand
+
+from motorpool.ratings import rebuild_ratings
+
+
+class Command(BaseCommand):
+    help = 'Пересчитывает рейтинги автомобилей по отзывам'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=1000)
+
+    def handle(self, *args, **options):
+        created, updated = rebuild_ratings(batch_size=options['batch_size'])
+        self.stdout.write(self.style.SUCCESS(f'Рейтинги пересчитаны: создано {created}, исправлено {updated}'))
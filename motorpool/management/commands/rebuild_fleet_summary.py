@@ -0,0 +1,14 @@
+from django.core.management.base import BaseCommand
+
+from motorpool.fleet_summary import rebuild_summaries
+
+
+class Command(BaseCommand):
+    help = 'Пересчитывает сводку автопарка по брендам'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=1000)
+
+    def handle(self, *args, **options):
+        created, updated = rebuild_summaries(batch_size=options['batch_size'])
+        self.stdout.write(self.style.SUCCESS(f'Сводка пересчитана: создано {created}, исправлено {updated}'))
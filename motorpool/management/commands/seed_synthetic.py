@@ -0,0 +1,27 @@
+from django.core.management.base import BaseCommand
+
+from motorpool.synthetic import seed_synthetic
+
+
+class Command(BaseCommand):
+    help = 'Заполняет базу синтетическим автопарком: бренды, автомобили, паспорта, опции, пользователи, отзывы, аренды'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--brands', type=int, default=100)
+        parser.add_argument('--autos', type=int, default=10000)
+        parser.add_argument('--users', type=int, default=1000)
+        parser.add_argument('--reviews-per-auto', type=float, default=3.0)
+        parser.add_argument('--rents-per-auto', type=float, default=5.0)
+        parser.add_argument('--favorites-per-user', type=float, default=2.0)
+        parser.add_argument('--seed', type=int, default=0)
+        parser.add_argument('--batch-size', type=int, default=5000)
+
+    def handle(self, *args, **options):
+        def report(label, count):
+            self.stdout.write(f'{label}: {count}')
+
+        seed_synthetic(brands=options['brands'], autos=options['autos'], users=options['users'],
+                       reviews_per_auto=options['reviews_per_auto'], rents_per_auto=options['rents_per_auto'],
+                       favorites_per_user=options['favorites_per_user'], seed=options['seed'],
+                       batch_size=options['batch_size'], callback=report)
+        self.stdout.write(self.style.SUCCESS('Синтетический автопарк создан'))
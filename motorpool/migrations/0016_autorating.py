@@ -0,0 +1,47 @@
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+def populate_ratings(apps, schema_editor):
+    Auto = apps.get_model('motorpool', 'Auto')
+    AutoRating = apps.get_model('motorpool', 'AutoRating')
+    AutoReview = apps.get_model('motorpool', 'AutoReview')
+    ratings = {pk: AutoRating(auto_id=pk) for pk in Auto.objects.values_list('pk', flat=True)}
+    rows = AutoReview.objects.filter(auto__isnull=False).order_by().values_list('auto_id', 'rate').annotate(
+        count=models.Count('id')
+    )
+    for auto_id, rate, count in rows:
+        rating = ratings[auto_id]
+        rating.review_count += count
+        rating.rate_sum += rate * count
+        if 0 <= rate <= 5:
+            setattr(rating, f'rate_{rate}', getattr(rating, f'rate_{rate}') + count)
+    AutoRating.objects.bulk_create(ratings.values(), batch_size=1000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('motorpool', '0015_autorent_autoreview'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='AutoRating',
+            fields=[
+                ('auto', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='rating', serialize=False, to='motorpool.auto')),
+                ('review_count', models.PositiveIntegerField(default=0, verbose_name='Количество отзывов')),
+                ('rate_sum', models.PositiveIntegerField(default=0, verbose_name='Сумма оценок')),
+                ('rate_0', models.PositiveIntegerField(default=0)),
+                ('rate_1', models.PositiveIntegerField(default=0)),
+                ('rate_2', models.PositiveIntegerField(default=0)),
+                ('rate_3', models.PositiveIntegerField(default=0)),
+                ('rate_4', models.PositiveIntegerField(default=0)),
+                ('rate_5', models.PositiveIntegerField(default=0)),
+            ],
+            options={
+                'verbose_name_plural': 'Рейтинги автомобилей',
+            },
+        ),
+        migrations.RunPython(populate_ratings, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,17 @@
+# Generated by Django 3.2.9 on 2026-10-17 20:52
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('motorpool', '0016_autorating'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='autorent',
+            index=models.Index(fields=['auto', 'date_start', 'date_end'], name='motorpool_a_auto_id_a5864b_idx'),
+        ),
+    ]
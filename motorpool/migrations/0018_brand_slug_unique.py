@@ -0,0 +1,61 @@
+# Generated by Django 3.2.9 on 2026-10-17 20:54
+
+import re
+
+from django.db import migrations, models
+from django.utils.text import slugify
+from unidecode import unidecode
+
+
+# Замороженная копия utils.models на момент миграции: изменения в коде приложения не должны менять ее результат
+def get_slug_base(value):
+    return slugify(unidecode(value if value else 'empty'), allow_unicode=True).lower()
+
+
+def get_slug_suffix(slug, base):
+    match = re.fullmatch(rf'{re.escape(base)}-(\d+)', slug)
+    return int(match.group(1)) if match else 0
+
+
+def allocate_slug(base, taken, sources):
+    if base not in taken:
+        slug = base
+    else:
+        suffix = max((get_slug_suffix(slug, base) for slug in taken if sources[slug] == base), default=0) + 1
+        while f'{base}-{suffix}' in taken:
+            suffix += 1
+        slug = f'{base}-{suffix}'
+    taken.add(slug)
+    sources[slug] = base
+    return slug
+
+
+def fix_brand_slugs(apps, schema_editor):
+    Brand = apps.get_model('motorpool', 'Brand')
+    sources = {}
+    broken = []
+    for brand in Brand.objects.order_by('pk'):
+        if not brand.slug or brand.slug in sources:
+            broken.append(brand)
+        else:
+            sources[brand.slug] = get_slug_base(brand.title)
+    taken = set(sources)
+    for brand in broken:
+        brand.slug = allocate_slug(get_slug_base(brand.title), taken, sources)
+    Brand.objects.bulk_update(broken, ['slug'], batch_size=1000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('motorpool', '0017_autorent_dates_index'),
+    ]
+
+    operations = [
+        migrations.RunPython(fix_brand_slugs, migrations.RunPython.noop),
+        migrations.AlterField(
+            model_name='brand',
+            name='slug',
+            field=models.SlugField(blank=True, max_length=210, unique=True),
+        ),
+    ]
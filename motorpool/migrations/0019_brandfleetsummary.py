@@ -0,0 +1,45 @@
+# Generated by Django 3.2.9 on 2026-10-17 20:59
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+def populate_summaries(apps, schema_editor):
+    Auto = apps.get_model('motorpool', 'Auto')
+    Brand = apps.get_model('motorpool', 'Brand')
+    BrandFleetSummary = apps.get_model('motorpool', 'BrandFleetSummary')
+    summaries = {pk: BrandFleetSummary(brand_id=pk) for pk in Brand.objects.values_list('pk', flat=True)}
+    rows = Auto.objects.filter(brand__isnull=False).values_list('brand_id', 'year', 'pts__engine_power')
+    for brand_id, year, engine_power in rows.iterator():
+        summary = summaries[brand_id]
+        summary.car_count += 1
+        summary.total_engine_power += engine_power or 0
+        if year is not None and year > 2010:
+            summary.new_cars += 1
+        if year is not None and year < 2010:
+            summary.old_cars += 1
+    BrandFleetSummary.objects.bulk_create(summaries.values(), batch_size=1000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('motorpool', '0018_brand_slug_unique'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='BrandFleetSummary',
+            fields=[
+                ('brand', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='fleet_summary', serialize=False, to='motorpool.brand')),
+                ('car_count', models.IntegerField(default=0, verbose_name='Количество автомобилей')),
+                ('total_engine_power', models.IntegerField(default=0, verbose_name='Суммарная мощность, л.с.')),
+                ('new_cars', models.IntegerField(default=0, verbose_name='Новых автомобилей')),
+                ('old_cars', models.IntegerField(default=0, verbose_name='Старых автомобилей')),
+            ],
+            options={
+                'verbose_name_plural': 'Сводка автопарка по брендам',
+            },
+        ),
+        migrations.RunPython(populate_summaries, migrations.RunPython.noop),
+    ]
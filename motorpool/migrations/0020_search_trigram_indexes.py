@@ -0,0 +1,36 @@
+from django.db import migrations
+
+TRIGRAM_INDEXES = (
+    ('motorpool_auto_number_trgm', 'motorpool_auto', 'number'),
+    ('motorpool_vehiclepassport_vin_trgm', 'motorpool_vehiclepassport', 'vin'),
+    ('motorpool_brand_title_trgm', 'motorpool_brand', 'title'),
+)
+
+
+def create_trigram_indexes(apps, schema_editor):
+    # Индексы нужны только PostgreSQL: icontains/istartswith там строятся как UPPER(col) LIKE
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    schema_editor.execute('CREATE EXTENSION IF NOT EXISTS pg_trgm')
+    for name, table, column in TRIGRAM_INDEXES:
+        schema_editor.execute(
+            f'CREATE INDEX IF NOT EXISTS {name} ON {table} USING gin (UPPER({column}::text) gin_trgm_ops)'
+        )
+
+
+def drop_trigram_indexes(apps, schema_editor):
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    for name, _, _ in TRIGRAM_INDEXES:
+        schema_editor.execute(f'DROP INDEX IF EXISTS {name}')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('motorpool', '0019_brandfleetsummary'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_trigram_indexes, drop_trigram_indexes),
+    ]
@@ -5,12 +5,12 @@ from django.urls import reverse
 from django.utils.text import slugify
 from unidecode import unidecode
 
-from utils.models import generate_unique_slug
+from utils.models import save_with_unique_slug
 
 
 class Brand(models.Model):
     title = models.CharField(max_length=100)
-    slug = models.SlugField(max_length=210, default='', blank=True)
+    slug = models.SlugField(max_length=210, unique=True, blank=True)
     logo = models.ImageField(upload_to='motorpool/brands/', blank=True, null=True)
 
     @property
@@ -32,9 +32,17 @@ class Brand(models.Model):
     def get_auto_create_url(self):
         return reverse('motorpool:auto_create', args=[str(self.pk)])
 
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        instance._loaded_title = instance.__dict__.get('title')
+        return instance
+
     def save(self, *args, **kwargs):
-        self.slug = generate_unique_slug(Brand, self.title)
-        super().save(*args, **kwargs)
+        if self.slug and self.title == getattr(self, '_loaded_title', None):
+            return super().save(*args, **kwargs)
+        save_with_unique_slug(self, self.title, lambda: super(Brand, self).save(*args, **kwargs))
+        self._loaded_title = self.title
 
     class Meta:
         verbose_name_plural = 'Бренды'
@@ -141,3 +149,52 @@ class AutoRent(models.Model):
 
     def __str__(self):
         return f'{self.user.username} - {self.auto.number}'
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['auto', 'date_start', 'date_end']),
+        ]
+
+
+class AutoRating(models.Model):
+    RATE_CHOICES = range(0, 6)
+
+    auto = models.OneToOneField(Auto, on_delete=models.CASCADE, primary_key=True, related_name='rating')
+    review_count = models.PositiveIntegerField(default=0, verbose_name='Количество отзывов')
+    rate_sum = models.PositiveIntegerField(default=0, verbose_name='Сумма оценок')
+    rate_0 = models.PositiveIntegerField(default=0)
+    rate_1 = models.PositiveIntegerField(default=0)
+    rate_2 = models.PositiveIntegerField(default=0)
+    rate_3 = models.PositiveIntegerField(default=0)
+    rate_4 = models.PositiveIntegerField(default=0)
+    rate_5 = models.PositiveIntegerField(default=0)
+
+    def __str__(self):
+        return f'{self.auto} - {self.rate}'
+
+    @property
+    def rate(self):
+        return self.rate_sum / self.review_count if self.review_count else None
+
+    @property
+    def histogram(self):
+        return {rate: getattr(self, f'rate_{rate}') for rate in self.RATE_CHOICES}
+
+    class Meta:
+        verbose_name_plural = 'Рейтинги автомобилей'
+
+
+class BrandFleetSummary(models.Model):
+    NEW_CAR_YEAR = 2010
+
+    brand = models.OneToOneField(Brand, on_delete=models.CASCADE, primary_key=True, related_name='fleet_summary')
+    car_count = models.IntegerField(default=0, verbose_name='Количество автомобилей')
+    total_engine_power = models.IntegerField(default=0, verbose_name='Суммарная мощность, л.с.')
+    new_cars = models.IntegerField(default=0, verbose_name='Новых автомобилей')
+    old_cars = models.IntegerField(default=0, verbose_name='Старых автомобилей')
+
+    def __str__(self):
+        return f'{self.brand} - {self.car_count}'
+
+    class Meta:
+        verbose_name_plural = 'Сводка автопарка по брендам'
@@ -0,0 +1,68 @@
+from django.db import IntegrityError, transaction
+from django.db.models import Count, F
+
+from motorpool.models import Auto, AutoRating, AutoReview
+
+RATING_FIELDS = ['review_count', 'rate_sum'] + [f'rate_{rate}' for rate in AutoRating.RATE_CHOICES]
+
+
+def get_rate_field(rate):
+    return f'rate_{rate}' if rate in AutoRating.RATE_CHOICES else None
+
+
+def get_rating_delta(rate, delta):
+    values = {'review_count': delta, 'rate_sum': delta * rate}
+    rate_field = get_rate_field(rate)
+    if rate_field:
+        values[rate_field] = delta
+    return values
+
+
+def apply_review_delta(auto_id, rate, delta):
+    if auto_id is None:
+        return
+    values = get_rating_delta(rate, delta)
+    updated = AutoRating.objects.filter(auto_id=auto_id).update(
+        **{field: F(field) + value for field, value in values.items()}
+    )
+    if updated or delta < 0:
+        return
+    try:
+        with transaction.atomic():
+            AutoRating.objects.create(auto_id=auto_id, **values)
+    except IntegrityError:
+        apply_review_delta(auto_id, rate, delta)
+
+
+def calculate_ratings():
+    ratings = {}
+    rows = AutoReview.objects.filter(auto__isnull=False).order_by().values_list('auto_id', 'rate').annotate(
+        count=Count('id')
+    )
+    for auto_id, rate, count in rows:
+        rating = ratings.setdefault(auto_id, AutoRating(auto_id=auto_id))
+        for field, value in get_rating_delta(rate, count).items():
+            setattr(rating, field, getattr(rating, field) + value)
+    return ratings
+
+
+def get_rating_values(rating):
+    return [getattr(rating, field) for field in RATING_FIELDS]
+
+
+@transaction.atomic
+def rebuild_ratings(batch_size=1000):
+    ratings = calculate_ratings()
+    stale = []
+    for rating in AutoRating.objects.select_for_update().iterator(chunk_size=batch_size):
+        actual = ratings.get(rating.auto_id, AutoRating(auto_id=rating.auto_id))
+        if get_rating_values(rating) != get_rating_values(actual):
+            stale.append(actual)
+    AutoRating.objects.bulk_update(stale, RATING_FIELDS, batch_size=batch_size)
+
+    missing = [
+        ratings.get(auto_id, AutoRating(auto_id=auto_id))
+        for auto_id in Auto.objects.filter(rating__isnull=True).values_list('pk', flat=True).iterator()
+    ]
+    AutoRating.objects.bulk_create(missing, batch_size=batch_size)
+    return len(missing), len(stale)
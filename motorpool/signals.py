@@ -0,0 +1,277 @@
+from django.db import transaction
+from django.db.models.signals import m2m_changed, post_delete, post_save, pre_save
+from django.dispatch import receiver
+from django_cleanup.signals import cleanup_pre_delete
+
+from utils.cache import bump_versions
+from utils.counts import invalidate_count
+from utils.images import delete_derivatives, schedule_derivatives
+from utils.models import generate_unique_slug
+from .availability import availability_index
+from .facets import facet_index
+from .fleet_summary import apply_summary_delta, get_auto_contribution
+from .models import (Auto, AutoRating, AutoRent, AutoReview, Brand, BrandFleetSummary, Option,
+                     VehiclePassport)
+from .ratings import apply_review_delta
+
+
+@receiver(pre_save, sender=Brand)
+def fill_raw_brand_slug(**kwargs):
+    instance = kwargs['instance']
+    if kwargs['raw'] and not instance.slug:
+        instance.slug = generate_unique_slug(Brand, instance.title, exclude_pk=instance.pk)
+
+
+@receiver(post_save, sender=Auto)
+def create_auto_rating(**kwargs):
+    if kwargs['created']:
+        AutoRating.objects.get_or_create(auto=kwargs['instance'])
+
+
+@receiver(pre_save, sender=AutoReview)
+def remember_review_rate(**kwargs):
+    instance = kwargs['instance']
+    if instance.pk:
+        instance._rating_origin = AutoReview.objects.filter(pk=instance.pk).values_list('auto_id', 'rate').first()
+
+
+@receiver(post_save, sender=AutoReview)
+def update_auto_rating(**kwargs):
+    instance = kwargs['instance']
+    origin = instance.__dict__.pop('_rating_origin', None)
+    current = (instance.auto_id, instance.rate)
+    if origin == current:
+        return
+    if origin:
+        apply_review_delta(*origin, -1)
+    apply_review_delta(*current, 1)
+
+
+@receiver(post_delete, sender=AutoReview)
+def delete_auto_rating(**kwargs):
+    instance = kwargs['instance']
+    apply_review_delta(instance.auto_id, instance.rate, -1)
+
+
+@receiver(post_save, sender=Auto)
+def index_auto_facets(**kwargs):
+    instance = kwargs['instance']
+    transaction.on_commit(lambda: facet_index.update_auto(instance.pk, instance.brand_id, instance.auto_class,
+                                                          instance.year))
+
+
+@receiver(post_delete, sender=Auto)
+def unindex_auto_facets(**kwargs):
+    pk = kwargs['instance'].pk
+    transaction.on_commit(lambda: facet_index.remove_auto(pk))
+
+
+@receiver(post_save, sender=VehiclePassport)
+def index_passport_facets(**kwargs):
+    instance = kwargs['instance']
+    transaction.on_commit(lambda: facet_index.update_passport(instance.auto_id, instance.engine_power,
+                                                              instance.engine_volume))
+
+
+@receiver(post_delete, sender=VehiclePassport)
+def unindex_passport_facets(**kwargs):
+    auto_id = kwargs['instance'].auto_id
+    transaction.on_commit(lambda: facet_index.update_passport(auto_id))
+
+
+@receiver(m2m_changed, sender=Auto.options.through)
+def index_auto_options(**kwargs):
+    action = kwargs['action']
+    if not action.startswith('post_'):
+        return
+    instance = kwargs['instance']
+    pk_set = set(kwargs['pk_set'] or ())
+    if not kwargs['reverse']:
+        changes = {'auto_ids': [instance.pk], 'clear': action == 'post_clear'}
+        changes['add' if action == 'post_add' else 'remove'] = pk_set
+    elif action == 'post_clear':
+        transaction.on_commit(lambda: facet_index.remove_option(instance.pk))
+        return
+    else:
+        changes = {'auto_ids': pk_set, 'add' if action == 'post_add' else 'remove': [instance.pk]}
+    transaction.on_commit(lambda: facet_index.change_options(**changes))
+
+
+@receiver(post_delete, sender=Option)
+def unindex_option_facets(**kwargs):
+    pk = kwargs['instance'].pk
+    transaction.on_commit(lambda: facet_index.remove_option(pk))
+
+
+@receiver(post_save, sender=Brand)
+@receiver(post_save, sender=Auto)
+@receiver(post_save, sender=VehiclePassport)
+def invalidate_created_count(**kwargs):
+    if kwargs['created']:
+        sender = kwargs['sender']
+        transaction.on_commit(lambda: invalidate_count(sender))
+
+
+@receiver(post_delete, sender=Brand)
+@receiver(post_delete, sender=Auto)
+@receiver(post_delete, sender=VehiclePassport)
+def invalidate_deleted_count(**kwargs):
+    sender = kwargs['sender']
+    transaction.on_commit(lambda: invalidate_count(sender))
+
+
+@receiver(pre_save, sender=AutoRent)
+def remember_rent_dates(**kwargs):
+    instance = kwargs['instance']
+    if instance.pk:
+        instance._availability_origin = AutoRent.objects.filter(pk=instance.pk).values_list(
+            'auto_id', 'date_start', 'date_end').first()
+
+
+@receiver(post_save, sender=AutoRent)
+def index_rent_dates(**kwargs):
+    instance = kwargs['instance']
+    origin = instance.__dict__.pop('_availability_origin', None)
+    current = (instance.auto_id, instance.date_start, instance.date_end)
+    if origin == current:
+        return
+
+    def update_index():
+        if origin:
+            availability_index.remove_rent(*origin)
+        availability_index.add_rent(*current)
+
+    transaction.on_commit(update_index)
+
+
+@receiver(post_delete, sender=AutoRent)
+def unindex_rent_dates(**kwargs):
+    instance = kwargs['instance']
+    current = (instance.auto_id, instance.date_start, instance.date_end)
+    transaction.on_commit(lambda: availability_index.remove_rent(*current))
+
+
+@receiver(post_save, sender=Brand)
+@receiver(post_save, sender=Auto)
+def create_logo_derivatives(**kwargs):
+    schedule_derivatives(kwargs['instance'].logo)
+
+
+@receiver(cleanup_pre_delete)
+def delete_file_derivatives(**kwargs):
+    file = kwargs['file']
+    delete_derivatives(file.storage, file.name)
+
+
+def bump_on_commit(dependencies):
+    dependencies = list(dependencies)
+    transaction.on_commit(lambda: bump_versions(dependencies))
+
+
+@receiver(post_save, sender=Brand)
+@receiver(post_delete, sender=Brand)
+def bump_brand_versions(**kwargs):
+    bump_on_commit([(Brand, kwargs['instance'].pk), (Brand, None)])
+
+
+@receiver(pre_save, sender=Auto)
+def remember_auto_origin(**kwargs):
+    instance = kwargs['instance']
+    if instance.pk:
+        instance._origin = Auto.objects.filter(pk=instance.pk).values_list(
+            'brand_id', 'year', 'pts__engine_power').first()
+
+
+@receiver(post_save, sender=Auto)
+@receiver(post_delete, sender=Auto)
+def bump_auto_versions(**kwargs):
+    instance = kwargs['instance']
+    origin = instance.__dict__.get('_origin') or (None, None, None)
+    brand_ids = {instance.brand_id, origin[0]} - {None}
+    bump_on_commit([(Auto, instance.pk), (Auto, None)] + [(Brand, pk) for pk in brand_ids])
+
+
+@receiver(m2m_changed, sender=Auto.options.through)
+def bump_auto_options_versions(**kwargs):
+    if kwargs['action'].startswith('post_'):
+        bump_on_commit([(Auto, None), (Option, None)])
+
+
+@receiver(post_save, sender=Option)
+@receiver(post_delete, sender=Option)
+def bump_option_versions(**kwargs):
+    bump_on_commit([(Option, None)])
+
+
+@receiver(post_save, sender=VehiclePassport)
+@receiver(post_delete, sender=VehiclePassport)
+def bump_passport_versions(**kwargs):
+    brand_id = Auto.objects.filter(pk=kwargs['instance'].auto_id).values_list('brand_id', flat=True).first()
+    bump_on_commit([(Auto, kwargs['instance'].auto_id), (Brand, brand_id)])
+
+
+@receiver(post_save, sender=AutoReview)
+@receiver(post_delete, sender=AutoReview)
+def bump_review_versions(**kwargs):
+    bump_on_commit([(AutoReview, None), (Auto, kwargs['instance'].auto_id)])
+
+
+@receiver(post_save, sender=AutoRent)
+@receiver(post_delete, sender=AutoRent)
+def bump_rent_versions(**kwargs):
+    bump_on_commit([(AutoRent, None), (Auto, kwargs['instance'].auto_id)])
+
+
+def get_auto_brand_id(auto_id):
+    return Auto.objects.filter(pk=auto_id).values_list('brand_id', flat=True).first()
+
+
+@receiver(post_save, sender=Brand)
+def create_fleet_summary(**kwargs):
+    if kwargs['created']:
+        BrandFleetSummary.objects.get_or_create(brand=kwargs['instance'])
+
+
+@receiver(post_save, sender=Auto)
+def update_fleet_summary(**kwargs):
+    instance = kwargs['instance']
+    origin = instance.__dict__.get('_origin') if not kwargs['created'] else None
+    engine_power = origin[2] if origin else None
+    if origin and origin[:2] == (instance.brand_id, instance.year):
+        return
+    if origin:
+        apply_summary_delta(origin[0], get_auto_contribution(origin[1], engine_power), -1)
+    apply_summary_delta(instance.brand_id, get_auto_contribution(instance.year, engine_power))
+
+
+@receiver(post_delete, sender=Auto)
+def delete_fleet_summary(**kwargs):
+    # Мощность вычитается при каскадном удалении паспорта, который удаляется раньше автомобиля
+    instance = kwargs['instance']
+    apply_summary_delta(instance.brand_id, get_auto_contribution(instance.year, None), -1)
+
+
+@receiver(pre_save, sender=VehiclePassport)
+def remember_passport_power(**kwargs):
+    instance = kwargs['instance']
+    if instance.pk:
+        instance._summary_origin = VehiclePassport.objects.filter(pk=instance.pk).values_list(
+            'auto_id', 'engine_power').first()
+
+
+@receiver(post_save, sender=VehiclePassport)
+def update_passport_fleet_summary(**kwargs):
+    instance = kwargs['instance']
+    origin = instance.__dict__.pop('_summary_origin', None)
+    current = (instance.auto_id, instance.engine_power)
+    if origin == current:
+        return
+    if origin:
+        apply_summary_delta(get_auto_brand_id(origin[0]), {'total_engine_power': origin[1]}, -1)
+    apply_summary_delta(get_auto_brand_id(instance.auto_id), {'total_engine_power': instance.engine_power})
+
+
+@receiver(post_delete, sender=VehiclePassport)
+def delete_passport_fleet_summary(**kwargs):
+    instance = kwargs['instance']
+    apply_summary_delta(get_auto_brand_id(instance.auto_id), {'total_engine_power': instance.engine_power}, -1)
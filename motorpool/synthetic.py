@@ -0,0 +1,155 @@
+import random
+from datetime import date, timedelta
+
+from django.contrib.auth.hashers import make_password
+from django.contrib.auth.models import User
+from django.db import transaction
+from django.db.models import Max
+from django.utils import timezone
+
+from accounts.models import Profile
+from motorpool.availability import availability_index
+from motorpool.facets import facet_index
+from motorpool.fleet_summary import rebuild_summaries
+from motorpool.models import Auto, AutoRent, AutoReview, Brand, Favorite, Option, VehiclePassport
+from motorpool.ratings import rebuild_ratings
+from utils.counts import invalidate_count
+from utils.models import reset_sequences
+
+SYNTHETIC_MODELS = (User, Profile, Option, Brand, Auto, VehiclePassport, AutoReview, AutoRent, Favorite)
+OPTION_TITLES = (
+    'Детское кресло', 'Кондиционер', 'Зарядка для телефона', 'Кожаный салон', 'Панорамная крыша',
+    'Wi-Fi', 'Багажник на крыше', 'Подогрев сидений', 'Тонировка', 'Водитель в деловом костюме',
+)
+PLATE_LETTERS = 'авекмнорстух'
+# Оценки смещены к высоким, как в настоящих отзывах
+RATE_WEIGHTS = (2, 3, 5, 12, 33, 45)
+
+
+def get_next_pk(model):
+    return (model.objects.aggregate(value=Max('pk'))['value'] or 0) + 1
+
+
+def get_brand_sizes(rnd, brands, autos):
+    # Размеры брендов по закону Парето: несколько крупных и длинный хвост мелких
+    weights = [rnd.paretovariate(1.2) for _ in range(brands)]
+    total = sum(weights)
+    sizes = [int(autos * weight / total) for weight in weights]
+    for index in range(autos - sum(sizes)):
+        sizes[index % brands] += 1
+    return sizes
+
+
+def make_plate(rnd, pk):
+    letters = ''.join(rnd.choice(PLATE_LETTERS) for _ in range(3))
+    return f'{letters[0]}{pk % 1000:03}{letters[1:]}{rnd.randint(1, 199)}rus'
+
+
+def make_passport(rnd, auto_pk):
+    volume = min(max(int(rnd.gauss(1800, 450)) // 100 * 100, 800), 6000)
+    power = max(int(volume * rnd.uniform(0.05, 0.09)), 50)
+    vin = ''.join(rnd.choice('ABCDEFGHJKLMNPRSTUVWXYZ0123456789') for _ in range(17))
+    return VehiclePassport(pk=auto_pk, auto_id=auto_pk, vin=vin, engine_volume=volume, engine_power=power)
+
+
+def bulk_insert(model, objects, batch_size):
+    model.objects.bulk_create(objects, batch_size=batch_size)
+    return len(objects)
+
+
+@transaction.atomic
+def seed_synthetic(brands=100, autos=10000, users=1000, reviews_per_auto=3.0, rents_per_auto=5.0,
+                   favorites_per_user=2.0, seed=0, batch_size=5000, callback=None):
+    rnd = random.Random(seed)
+    today = date.today()
+    now = timezone.now()
+    counts = {}
+
+    def report(model, count, label=None):
+        label = label or str(model._meta.verbose_name_plural)
+        counts[label] = count
+        if callback:
+            callback(label, count)
+
+    user_pk = get_next_pk(User)
+    password = make_password('password')
+    report(User, bulk_insert(User, [
+        User(pk=user_pk + index, username=f'synthetic{user_pk + index}', email=f'synthetic{user_pk + index}@example.com',
+             password=password, date_joined=now - timedelta(days=rnd.randint(0, 1500)))
+        for index in range(users)
+    ], batch_size))
+    user_ids = list(range(user_pk, user_pk + users))
+    profile_pk = get_next_pk(Profile)
+    bulk_insert(Profile, [Profile(pk=profile_pk + index, user_id=pk) for index, pk in enumerate(user_ids)], batch_size)
+
+    option_ids = list(Option.objects.values_list('pk', flat=True))
+    missing_titles = [title for title in OPTION_TITLES if not Option.objects.filter(title=title).exists()]
+    option_pk = get_next_pk(Option)
+    bulk_insert(Option, [Option(pk=option_pk + index, title=title) for index, title in enumerate(missing_titles)],
+                batch_size)
+    option_ids += list(range(option_pk, option_pk + len(missing_titles)))
+
+    brand_pk = get_next_pk(Brand)
+    report(Brand, bulk_insert(Brand, [
+        Brand(pk=brand_pk + index, title=f'Synthetic {brand_pk + index}', slug=f'synthetic-{brand_pk + index}')
+        for index in range(brands)
+    ], batch_size))
+
+    auto_pk = get_next_pk(Auto)
+    classes = [value for value, _ in Auto.AUTO_CLASS_CHOICES]
+    auto_objects, passports, options = [], [], []
+    pk = auto_pk
+    for brand_index, size in enumerate(get_brand_sizes(rnd, brands, autos)):
+        for _ in range(size):
+            year = int(rnd.triangular(1995, today.year, today.year - 3))
+            auto_objects.append(Auto(pk=pk, brand_id=brand_pk + brand_index, number=make_plate(rnd, pk), year=year,
+                                     auto_class=rnd.choices(classes, weights=(6, 3, 1))[0]))
+            passports.append(make_passport(rnd, pk))
+            option_count = min(int(rnd.expovariate(1 / 3)), len(option_ids))
+            options.extend(Auto.options.through(auto_id=pk, option_id=option_id)
+                           for option_id in rnd.sample(option_ids, option_count))
+            pk += 1
+    report(Auto, bulk_insert(Auto, auto_objects, batch_size))
+    report(VehiclePassport, bulk_insert(VehiclePassport, passports, batch_size))
+    report(Auto.options.through, bulk_insert(Auto.options.through, options, batch_size), 'опции автомобилей')
+    auto_ids = list(range(auto_pk, pk))
+
+    reviews = []
+    for auto_id in auto_ids:
+        reviewers = rnd.sample(user_ids, min(int(rnd.expovariate(1 / reviews_per_auto)), len(user_ids)))
+        reviews.extend(AutoReview(auto_id=auto_id, user_id=user_id, text='Синтетический отзыв',
+                                  rate=rnd.choices(range(6), weights=RATE_WEIGHTS)[0])
+                       for user_id in reviewers)
+    report(AutoReview, bulk_insert(AutoReview, reviews, batch_size))
+
+    rents = []
+    for auto_id in auto_ids:
+        # Аренды одного автомобиля идут друг за другом без пересечений
+        start = today - timedelta(days=rnd.randint(0, 365))
+        for _ in range(int(rnd.expovariate(1 / rents_per_auto))):
+            start += timedelta(days=rnd.randint(0, 20))
+            end = start + timedelta(days=min(int(rnd.expovariate(1 / 3)), 30))
+            rents.append(AutoRent(auto_id=auto_id, user_id=rnd.choice(user_ids), date_start=start, date_end=end))
+            start = end + timedelta(days=1)
+    report(AutoRent, bulk_insert(AutoRent, rents, batch_size))
+
+    brand_ids = list(range(brand_pk, brand_pk + brands))
+    favorites = []
+    for user_id in user_ids:
+        favorite_count = min(int(rnd.expovariate(1 / favorites_per_user)), len(brand_ids))
+        favorites.extend(Favorite(user_id=user_id, brand_id=brand_id)
+                         for brand_id in rnd.sample(brand_ids, favorite_count))
+    report(Favorite, bulk_insert(Favorite, favorites, batch_size))
+
+    reset_sequences(SYNTHETIC_MODELS)
+    rebuild_ratings(batch_size)
+    rebuild_summaries(batch_size)
+
+    def invalidate():
+        for model in (Brand, Auto, VehiclePassport):
+            invalidate_count(model)
+        facet_index.touch()
+        availability_index.touch()
+
+    transaction.on_commit(invalidate)
+    return counts
@@ -0,0 +1,101 @@
+import csv
+
+import numpy as np
+from django.conf import settings
+from django.db.models import Case, F, FloatField, When
+
+from motorpool.models import Auto, VehiclePassport
+
+AUTO_CLASS_CODES = {value: code for code, (value, _) in enumerate(Auto.AUTO_CLASS_CHOICES)}
+NO_BRAND = -1
+NO_CLASS = -1
+
+
+def get_tax_brackets():
+    # Пары (объем двигателя, ставка): ставка применяется, если объем строго больше порога
+    return sorted(getattr(settings, 'FLEET_TAX_BRACKETS', ((1600, 0.1), (2000, 0.2))))
+
+
+def get_tax_expression(brackets=None):
+    whens = [When(pts__engine_volume__gt=volume, then=rate) for volume, rate in reversed(brackets or get_tax_brackets())]
+    return F('pts__engine_volume') * Case(*whens, default=0, output_field=FloatField())
+
+
+class FleetColumns:
+
+    def __init__(self, auto_ids, brand_ids, class_codes, engine_volumes):
+        self.auto_ids = auto_ids
+        self.brand_ids = brand_ids
+        self.class_codes = class_codes
+        self.engine_volumes = engine_volumes
+
+    def __len__(self):
+        return len(self.auto_ids)
+
+    @classmethod
+    def load(cls, queryset=None, chunk_size=100000):
+        queryset = queryset if queryset is not None else VehiclePassport.objects.all()
+        rows = queryset.order_by().values_list('auto_id', 'auto__brand_id', 'auto__auto_class', 'engine_volume')
+        chunks = []
+        chunk = []
+        for auto_id, brand_id, auto_class, engine_volume in rows.iterator(chunk_size=chunk_size):
+            chunk.append((auto_id, NO_BRAND if brand_id is None else brand_id,
+                          AUTO_CLASS_CODES.get(auto_class, NO_CLASS), engine_volume))
+            if len(chunk) >= chunk_size:
+                chunks.append(np.array(chunk, dtype=np.int64))
+                chunk = []
+        if chunk:
+            chunks.append(np.array(chunk, dtype=np.int64))
+        data = np.concatenate(chunks) if chunks else np.empty((0, 4), dtype=np.int64)
+        return cls(*(np.ascontiguousarray(data[:, column]) for column in range(4)))
+
+
+def calculate_taxes(engine_volumes, brackets=None):
+    rates = np.zeros(len(engine_volumes), dtype=np.float64)
+    for volume, rate in brackets or get_tax_brackets():
+        rates[engine_volumes > volume] = rate
+    return engine_volumes * rates
+
+
+def group_totals(keys, taxes):
+    groups, inverse = np.unique(keys, return_inverse=True)
+    return groups, np.bincount(inverse, weights=taxes, minlength=len(groups))
+
+
+class FleetTaxReport:
+
+    def __init__(self, columns, brackets=None):
+        self.columns = columns
+        self.taxes = calculate_taxes(columns.engine_volumes, brackets)
+
+    @property
+    def total(self):
+        return float(self.taxes.sum())
+
+    def by_auto(self):
+        return zip(self.columns.auto_ids.tolist(), self.taxes.tolist())
+
+    def by_brand(self):
+        groups, totals = group_totals(self.columns.brand_ids, self.taxes)
+        return ((None if brand_id == NO_BRAND else brand_id, total)
+                for brand_id, total in zip(groups.tolist(), totals.tolist()))
+
+    def by_class(self):
+        classes = {code: value for value, code in AUTO_CLASS_CODES.items()}
+        groups, totals = group_totals(self.columns.class_codes, self.taxes)
+        return ((classes.get(code), total) for code, total in zip(groups.tolist(), totals.tolist()))
+
+
+REPORT_GROUPS = {
+    'auto': ('auto_id', FleetTaxReport.by_auto),
+    'brand': ('brand_id', FleetTaxReport.by_brand),
+    'class': ('auto_class', FleetTaxReport.by_class),
+}
+
+
+def write_report_csv(report, group, stream):
+    column, rows = REPORT_GROUPS[group]
+    writer = csv.writer(stream)
+    writer.writerow([column, 'tax'])
+    for key, total in rows(report):
+        writer.writerow([key if key is not None else '', f'{total:.2f}'])
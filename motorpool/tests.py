@@ -1,3 +1,1083 @@
-from django.test import TestCase
+import asyncio
+import json
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import threading
+from datetime import date, timedelta
+from io import BytesIO, StringIO
+from types import SimpleNamespace
+from unittest import mock
 
-# Create your tests here.
+import numpy as np
+from asgiref.sync import async_to_sync
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.core.files.base import ContentFile
+from django.core.files.storage import FileSystemStorage
+from django.core.management import CommandError, call_command
+from django.db import DEFAULT_DB_ALIAS, connections, router, transaction
+from django.db.models import Sum
+from django.db.models.fields.files import FieldFile
+from django.http import Http404, HttpResponse
+from django.test import RequestFactory, SimpleTestCase, TestCase, TransactionTestCase, override_settings
+from django.urls import resolve, reverse
+from django.utils import timezone
+from PIL import Image as PILImage
+
+from motorpool.availability import AutoIntervals, availability_index
+from motorpool.facets import HISTOGRAM_FACETS, facet_index
+from motorpool.fleet_import import import_fleet
+from motorpool.fleet_summary import calculate_summaries, get_summary_values, rebuild_summaries
+from motorpool.management.commands.benchmark_availability import get_busy_from_db
+from motorpool.models import (Auto, AutoRating, AutoRent, AutoReview, Brand, BrandFleetSummary, Option,
+                              VehiclePassport)
+from motorpool.ratings import RATING_FIELDS, get_rating_values, rebuild_ratings
+from motorpool.synthetic import seed_synthetic
+from motorpool.tax import FleetColumns, FleetTaxReport, calculate_taxes, get_tax_expression
+from motorpool.views import AsyncAutoDetailView, AutoDetailView
+from utils.bitset import Bitset
+from utils.cache import get_cache_stats, get_versions
+from utils.counts import CountingPaginator, get_count
+from utils.db import PIN_COOKIE_NAME, PrimaryStickinessMiddleware, ReplicaRouter, RequestDbState, request_state
+from utils.images import delete_derivatives, generate_derivatives, get_srcset, has_derivatives
+from utils.metrics import MetricsStore, RequestMetrics, RequestMetricsMiddleware, metrics_store
+from utils.models import SlugAllocator, generate_unique_slugs, get_slug_base
+from utils.pagination import CursorPaginator, encode_cursor
+from utils.profiling import (ASYNC_VIEW_NOTE, RequestProfile, RequestProfilerMiddleware, acquire_rate_limit,
+                             get_rate_limit, make_profile_token)
+from utils.slow_queries import SlowQueryLog, explain
+from utils.testing import QueryBudgetTestCase, get_full_scans, seed_fleet
+
+
+class MotorpoolQueryBudgetTest(QueryBudgetTestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = seed_fleet()[0]
+        cls.user.is_superuser = True
+        cls.user.save()
+        brands = list(Brand.objects.order_by('pk'))
+        cls.brand = brands[0]
+        cls.other_brand = brands[10]
+        autos = list(Auto.objects.order_by('pk'))
+        cls.auto = autos[0]
+        cls.unreviewed_auto = autos[1]
+
+    def test_brand_list(self):
+        self.assertQueryBudget(reverse('motorpool:brand_list'), 2)
+
+    def test_brand_detail(self):
+        self.assertQueryBudget(reverse('motorpool:brand_detail', args=[self.brand.pk]), 2)
+
+    def test_brand_detail_authenticated(self):
+        self.client.force_login(self.user)
+        self.assertQueryBudget(reverse('motorpool:brand_detail', args=[self.brand.pk]), 5)
+
+    def test_brand_create(self):
+        self.client.force_login(self.user)
+        self.assertQueryBudget(reverse('motorpool:brand_create'), 3)
+
+    def test_brand_update(self):
+        self.client.force_login(self.user)
+        self.assertQueryBudget(reverse('motorpool:brand_update', args=[self.brand.pk]), 4)
+
+    def test_brand_delete(self):
+        self.client.force_login(self.user)
+        self.assertQueryBudget(reverse('motorpool:brand_delete', args=[self.brand.pk]), 4)
+
+    def test_brand_add_to_favorite(self):
+        self.client.force_login(self.user)
+        self.assertQueryBudget(reverse('motorpool:brand_add_to_favorite'), 8, method='post', status_code=302,
+                               data={'user': self.user.pk, 'brand': self.other_brand.pk})
+
+    def test_brand_list_set_paginate(self):
+        self.assertQueryBudget(reverse('motorpool:brand_list_set_paginate'), 4, method='post', status_code=302,
+                               data={'item_count': 5})
+
+    def test_auto_create(self):
+        self.client.force_login(self.user)
+        self.assertQueryBudget(reverse('motorpool:auto_create', args=[self.brand.pk]), 6)
+
+    def test_auto_list(self):
+        self.assertQueryBudget(reverse('motorpool:auto_list'), 4)
+
+    def test_auto_list_filtered(self):
+        query = f'?brand={self.brand.pk}&engine_power=1&date_from=2030-01-01&date_to=2030-01-05'
+        self.assertQueryBudget(reverse('motorpool:auto_list') + query, 3)
+
+    def test_auto_list_authenticated(self):
+        self.client.force_login(self.user)
+        self.assertQueryBudget(reverse('motorpool:auto_list'), 7)
+
+    def test_auto_detail(self):
+        self.assertQueryBudget(reverse('motorpool:auto_detail', args=[self.auto.pk]), 4)
+
+    def test_auto_detail_authenticated(self):
+        self.client.force_login(self.user)
+        self.assertQueryBudget(reverse('motorpool:auto_detail', args=[self.auto.pk]), 7)
+
+    def test_auto_send_review(self):
+        self.client.force_login(self.user)
+        self.assertQueryBudget(reverse('motorpool:auto_send_review'), 7, method='post', status_code=302,
+                               data={'user': self.user.pk, 'auto': self.unreviewed_auto.pk, 'rate': 4, 'text': 'Отзыв'})
+
+    def test_auto_rent(self):
+        self.client.force_login(self.user)
+        self.assertQueryBudget(reverse('motorpool:auto_rent'), 7, method='post', status_code=302,
+                               data={'user': self.user.pk, 'auto': self.auto.pk,
+                                     'date_start': '2031-01-01', 'date_end': '2031-01-03'})
+
+    def test_auto_export(self):
+        self.client.force_login(self.user)
+        # Выгрузка читает весь автопарк по определению
+        self.assertQueryBudget(reverse('motorpool:auto_export', args=['csv']), 4,
+                               allowed_scans=['motorpool_auto'])
+
+    def test_fleet_summary(self):
+        self.assertQueryBudget(reverse('motorpool:fleet_summary'), 1)
+
+    def test_api_brand_list(self):
+        self.assertQueryBudget(reverse('motorpool:api_brand_list') + '?ids=1,2,3', 1)
+
+    def test_api_brand_detail(self):
+        self.assertQueryBudget(reverse('motorpool:api_brand_detail', args=[self.brand.pk]), 1)
+
+    def test_api_auto_list(self):
+        self.assertQueryBudget(reverse('motorpool:api_auto_list'), 3)
+
+    def test_api_auto_detail(self):
+        self.assertQueryBudget(reverse('motorpool:api_auto_detail', args=[self.auto.pk]), 2)
+
+
+class AutoRatingTest(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user('reviewer', 'reviewer@example.com', 'password')
+        cls.brand = Brand.objects.create(title='Рейтинг')
+        cls.auto = Auto.objects.create(brand=cls.brand, number='р001рр')
+        cls.other_auto = Auto.objects.create(brand=cls.brand, number='р002рр')
+
+    def get_rating(self, auto):
+        return AutoRating.objects.get(auto=auto)
+
+    def test_review_lifecycle(self):
+        review = AutoReview.objects.create(auto=self.auto, user=self.user, rate=4)
+        rating = self.get_rating(self.auto)
+        self.assertEqual((rating.review_count, rating.rate_sum, rating.rate_4), (1, 4, 1))
+
+        review.rate = 2
+        review.save()
+        rating = self.get_rating(self.auto)
+        self.assertEqual((rating.review_count, rating.rate_sum, rating.rate_4, rating.rate_2), (1, 2, 0, 1))
+
+        review.auto = self.other_auto
+        review.save()
+        self.assertEqual(self.get_rating(self.auto).review_count, 0)
+        self.assertEqual(self.get_rating(self.other_auto).rate_sum, 2)
+
+        review.delete()
+        self.assertEqual(get_rating_values(self.get_rating(self.other_auto)), [0] * len(RATING_FIELDS))
+
+    def test_missing_rating_row_is_created(self):
+        AutoRating.objects.filter(auto=self.auto).delete()
+        AutoReview.objects.create(auto=self.auto, user=self.user, rate=5)
+        self.assertEqual(self.get_rating(self.auto).rate_5, 1)
+
+    def test_rebuild_fixes_drift(self):
+        AutoReview.objects.create(auto=self.auto, user=self.user, rate=3)
+        AutoRating.objects.filter(auto=self.auto).update(review_count=10, rate_sum=0)
+        AutoRating.objects.filter(auto=self.other_auto).delete()
+        self.assertEqual(rebuild_ratings(), (1, 1))
+        rating = self.get_rating(self.auto)
+        self.assertEqual((rating.review_count, rating.rate_sum, rating.rate_3), (1, 3, 1))
+        self.assertTrue(AutoRating.objects.filter(auto=self.other_auto).exists())
+
+
+class FacetIndexTest(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        seed_fleet(brands=4, autos_per_brand=10, users=1)
+
+    def setUp(self):
+        facet_index.load()
+
+    def tearDown(self):
+        facet_index.loaded = False
+
+    def get_ids(self, queryset):
+        return set(queryset.values_list('pk', flat=True))
+
+    def test_search_matches_orm(self):
+        brand = Brand.objects.order_by('pk').first()
+        options = list(Option.objects.order_by('pk')[:2])
+        ids = facet_index.search(brand=[brand.pk], auto_class=['e', 'c'], options=[option.pk for option in options])
+        queryset = Auto.objects.filter(brand=brand, auto_class__in=['e', 'c'])
+        for option in options:
+            queryset = queryset.filter(options=option)
+        self.assertEqual(set(ids), self.get_ids(queryset))
+
+    def test_counts_exclude_own_facet(self):
+        brand = Brand.objects.order_by('pk').first()
+        counts = facet_index.counts(brand=[brand.pk], auto_class=['b'])
+        self.assertEqual(counts['brand'][brand.pk], Auto.objects.filter(brand=brand, auto_class='b').count())
+        self.assertEqual(counts['auto_class']['e'], Auto.objects.filter(brand=brand, auto_class='e').count())
+
+    def test_histogram_facet(self):
+        facet = HISTOGRAM_FACETS['engine_power']
+        ids = facet_index.search(engine_power=[1])
+        self.assertEqual(set(ids), self.get_ids(Auto.objects.filter(facet.get_condition([1]))))
+
+    def test_histogram_counts_match_orm(self):
+        for name, facet in HISTOGRAM_FACETS.items():
+            expected = {bucket: Auto.objects.filter(facet.get_condition([bucket])).count()
+                        for bucket in range(len(facet.buckets))}
+            expected = {bucket: count for bucket, count in expected.items() if count}
+            self.assertEqual(facet_index.histogram(name), expected, name)
+
+    def test_histogram_buckets(self):
+        facet = HISTOGRAM_FACETS['engine_power']
+        self.assertEqual([facet.get_bucket(value) for value in (None, -1, 0, 100, 101, 300, 301)],
+                         [None, None, 0, 0, 1, 2, None])
+        self.assertEqual(facet.get_choices()[1], ('1', '101-200'))
+
+    def test_passport_change_moves_bucket(self):
+        passport = VehiclePassport.objects.order_by('pk').first()
+        with self.captureOnCommitCallbacks(execute=True):
+            passport.engine_power = 250
+            passport.save()
+        self.assertIn(passport.auto_id, facet_index.search(engine_power=[2]))
+        self.assertNotIn(passport.auto_id, facet_index.search(engine_power=[0, 1]))
+        with self.captureOnCommitCallbacks(execute=True):
+            passport.delete()
+        self.assertNotIn(passport.auto_id, facet_index.search(engine_power=[0, 1, 2]))
+
+    def test_signals_update_index(self):
+        brand = Brand.objects.order_by('pk').first()
+        option = Option.objects.order_by('pk').first()
+        with self.captureOnCommitCallbacks(execute=True):
+            auto = Auto.objects.create(brand=brand, number='ф001фф', auto_class='b')
+        self.assertIn(auto.pk, facet_index.search(brand=[brand.pk], auto_class=['b']))
+        with self.captureOnCommitCallbacks(execute=True):
+            auto.options.add(option)
+        self.assertIn(auto.pk, facet_index.search(options=[option.pk]))
+        pk = auto.pk
+        with self.captureOnCommitCallbacks(execute=True):
+            auto.delete()
+        self.assertNotIn(pk, facet_index.search(brand=[brand.pk]))
+
+    @override_settings(SHARED_CACHE=False, IN_PROCESS_INDEX_MAX_AGE=0)
+    def test_reload_without_shared_cache(self):
+        # Изменение из другого процесса: ни сигналов, ни счетчика версии
+        Auto.objects.filter(auto_class='b').update(auto_class='e')
+        self.assertFalse(facet_index.search(auto_class=['b']))
+
+
+class BitsetTest(SimpleTestCase):
+
+    def test_operations(self):
+        left = Bitset([1, 5, 70000, 200000])
+        right = Bitset([5, 70000, 3])
+        self.assertEqual(sorted(left & right), [5, 70000])
+        self.assertEqual(sorted(left | right), [1, 3, 5, 70000, 200000])
+        self.assertEqual(sorted(left - right), [1, 200000])
+        self.assertEqual(len(left), 4)
+        left.discard(200000)
+        self.assertNotIn(200000, left)
+        self.assertFalse(Bitset() & right)
+
+
+@override_settings(STATICFILES_STORAGE='django.contrib.staticfiles.storage.StaticFilesStorage')
+class CursorPaginatorTest(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        Brand.objects.bulk_create([Brand(title=f'Бренд {index % 4}', slug=f'cursor-{index}') for index in range(23)])
+
+    def walk(self, paginator):
+        pages, page = [], paginator.get_page()
+        while True:
+            pages.append([brand.pk for brand in page])
+            if not page.has_next():
+                return pages, page
+            page = paginator.get_page(after=page.next_cursor)
+
+    def test_forward_and_backward_with_duplicate_keys(self):
+        queryset = Brand.objects.all()
+        # Ключ pk добавляется в направлении последнего поля сортировки
+        expected = list(queryset.order_by('-title', '-pk').values_list('pk', flat=True))
+        paginator = CursorPaginator(queryset, 5, ['-title'])
+        pages, last_page = self.walk(paginator)
+        self.assertEqual([pk for page in pages for pk in page], expected)
+        self.assertEqual(len(pages), 5)
+        self.assertFalse(paginator.get_page().has_previous())
+
+        previous = paginator.get_page(before=last_page.previous_cursor)
+        self.assertEqual([brand.pk for brand in previous], pages[-2])
+        self.assertTrue(previous.has_next())
+
+    def test_invalid_cursor(self):
+        paginator = CursorPaginator(Brand.objects.all(), 5, ['pk'])
+        with self.assertRaises(Http404):
+            paginator.get_page(after='broken')
+        with self.assertRaises(Http404):
+            paginator.get_page(after=encode_cursor([1, 2, 3]))
+
+    def test_brand_list_view(self):
+        url = reverse('motorpool:brand_list')
+        response = self.client.get(url, {'after': encode_cursor([Brand.objects.order_by('-pk')[4].pk])})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(response.context['object_list']), min(Brand.objects.count() - 5,
+                                                                    response.context['paginator'].per_page))
+
+
+class CountingTest(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.brand = Brand.objects.create(title='Счетчик')
+        Auto.objects.bulk_create([Auto(brand=cls.brand, number=f'с{index:03}сс') for index in range(3)])
+
+    def setUp(self):
+        cache.clear()
+
+    def test_unfiltered_count_is_cached_and_invalidated(self):
+        self.assertEqual(get_count(Auto.objects.all()), 3)
+        with self.assertNumQueries(0):
+            self.assertEqual(CountingPaginator(Auto.objects.all(), 2).count, 3)
+        with self.captureOnCommitCallbacks(execute=True):
+            auto = Auto.objects.create(brand=self.brand, number='с999сс')
+        self.assertEqual(get_count(Auto.objects.all()), 4)
+        with self.captureOnCommitCallbacks(execute=True):
+            auto.delete()
+        self.assertEqual(get_count(Auto.objects.all()), 3)
+
+    def test_passport_count_is_invalidated(self):
+        self.assertEqual(get_count(VehiclePassport.objects.all()), 0)
+        with self.captureOnCommitCallbacks(execute=True):
+            passport = VehiclePassport.objects.create(auto=Auto.objects.first(), vin='VIN', engine_volume=1600,
+                                                      engine_power=100)
+        self.assertEqual(get_count(VehiclePassport.objects.all()), 1)
+        with self.captureOnCommitCallbacks(execute=True):
+            passport.delete()
+        self.assertEqual(get_count(VehiclePassport.objects.all()), 0)
+
+    def test_seed_synthetic_invalidates_counts(self):
+        get_count(VehiclePassport.objects.all())
+        with self.captureOnCommitCallbacks(execute=True):
+            seed_synthetic(brands=2, autos=5, users=2)
+        self.assertEqual(get_count(VehiclePassport.objects.all()), VehiclePassport.objects.count())
+        self.assertEqual(get_count(Auto.objects.all()), 8)
+
+    def test_filtered_count_is_exact(self):
+        Auto.objects.create(brand=None, number='с998сс')
+        self.assertEqual(get_count(Auto.objects.filter(brand=self.brand)), 3)
+        self.assertEqual(get_count([1, 2]), 2)
+
+
+class AvailabilityTest(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create(username='renter')
+        brand = Brand.objects.create(title='Аренда')
+        cls.autos = [Auto.objects.create(brand=brand, number=f'а{index:03}аа') for index in range(4)]
+        AutoRent.objects.bulk_create([
+            AutoRent(user=cls.user, auto=cls.autos[0], date_start=date(2023, 1, 1), date_end=date(2023, 1, 5)),
+            AutoRent(user=cls.user, auto=cls.autos[0], date_start=date(2023, 3, 1), date_end=date(2023, 3, 2)),
+            AutoRent(user=cls.user, auto=cls.autos[1], date_start=date(2023, 1, 10), date_end=date(2023, 2, 10)),
+            AutoRent(user=cls.user, auto=cls.autos[2], date_start=date(2023, 1, 5), date_end=date(2023, 1, 5)),
+        ])
+
+    def setUp(self):
+        cache.clear()
+        availability_index.load()
+
+    def tearDown(self):
+        availability_index.loaded = False
+
+    def test_intervals_overlap_inclusive(self):
+        intervals = AutoIntervals([(10, 20), (1, 3)])
+        self.assertTrue(intervals.overlaps(3, 5))
+        self.assertTrue(intervals.overlaps(20, 30))
+        self.assertTrue(intervals.overlaps(12, 13))
+        self.assertFalse(intervals.overlaps(4, 9))
+        self.assertFalse(intervals.overlaps(21, 30))
+        intervals.remove(10, 20)
+        self.assertFalse(intervals.overlaps(12, 13))
+
+    def test_index_matches_db(self):
+        for date_from in (date(2022, 12, 25), date(2023, 1, 5), date(2023, 1, 20), date(2023, 2, 11),
+                          date(2023, 3, 2)):
+            for days in (0, 3, 30):
+                date_to = date_from + timedelta(days=days)
+                self.assertEqual(availability_index.busy(date_from, date_to), get_busy_from_db(date_from, date_to),
+                                 (date_from, date_to))
+
+    def test_signals_update_index(self):
+        period = (date(2023, 6, 1), date(2023, 6, 3))
+        with self.captureOnCommitCallbacks(execute=True):
+            rent = AutoRent.objects.create(user=self.user, auto=self.autos[3], date_start=period[0], date_end=period[1])
+        self.assertEqual(set(availability_index.busy(*period)), {self.autos[3].pk})
+        with self.captureOnCommitCallbacks(execute=True):
+            rent.date_start, rent.date_end = date(2023, 7, 1), date(2023, 7, 2)
+            rent.save()
+        self.assertEqual(set(availability_index.busy(*period)), set())
+        with self.captureOnCommitCallbacks(execute=True):
+            rent.delete()
+        self.assertEqual(set(availability_index.busy(date(2023, 7, 1), date(2023, 7, 1))), set())
+
+    def test_benchmark_command(self):
+        with self.assertRaises(CommandError):
+            call_command('benchmark_availability', queries=0, stdout=StringIO())
+        output = StringIO()
+        call_command('benchmark_availability', queries=5, stdout=output, stderr=output)
+        self.assertIn('Запрос к базе', output.getvalue())
+        self.assertNotIn('не совпадают', output.getvalue())
+
+
+class FleetImportTest(TestCase):
+
+    def test_import_many_distinct_brands(self):
+        Brand.objects.create(title='Марка 7')
+        records = [{'model': 'motorpool.brand', 'fields': {'title': f'Марка {index}'}} for index in range(1200)]
+        records.append({'model': 'motorpool.brand', 'fields': {'title': 'Марка 7'}})
+        import_fleet(StringIO(json.dumps(records)))
+        self.assertEqual(Brand.objects.count(), 1202)
+        self.assertEqual(Brand.objects.filter(slug__in=['marka-7', 'marka-7-1', 'marka-7-2']).count(), 3)
+
+    def test_import_bumps_page_versions(self):
+        cache.clear()
+        brand = Brand.objects.create(title='Импорт')
+        other = Brand.objects.create(title='Другой')
+        auto = Auto.objects.create(brand=other, number='и001ии')
+        dependencies = [(Brand, None), (Auto, None), (Brand, brand.pk), (Auto, auto.pk), (Brand, other.pk)]
+        versions = get_versions(dependencies)
+        records = [
+            {'model': 'motorpool.auto', 'pk': auto.pk + 100, 'fields': {'brand': brand.pk, 'number': 'и002ии'}},
+            {'model': 'motorpool.vehiclepassport', 'fields': {'auto': auto.pk, 'vin': 'IMPORTVIN', 'engine_volume': 1600,
+                                                           'engine_power': 100}},
+        ]
+        import_fleet(StringIO(json.dumps(records)))
+        changed = [old != new for old, new in zip(versions, get_versions(dependencies))]
+        self.assertEqual(changed, [True, True, True, True, False])
+
+
+class SlugAllocatorTest(SimpleTestCase):
+
+    def test_allocate(self):
+        allocator = SlugAllocator(['kia', 'kia-1', 'kia-5', 'kia-rio'])
+        self.assertEqual([allocator.allocate(base) for base in ('kia', 'kia', 'lada', 'lada', 'kia-rio')],
+                         ['kia-6', 'kia-7', 'lada', 'lada-1', 'kia-rio-1'])
+
+    def test_number_in_title_is_not_suffix(self):
+        allocator = SlugAllocator(['toyota', 'toyota-2019', 'toyota-2'], {'toyota-2019': 'toyota-2019'})
+        self.assertEqual([allocator.allocate(base) for base in ('toyota', 'toyota-2019')], ['toyota-3', 'toyota-2019-1'])
+
+    def test_slug_base(self):
+        self.assertEqual(get_slug_base('Лада Веста'), 'lada-vesta')
+        self.assertEqual(get_slug_base(''), 'empty')
+
+
+class UniqueSlugTest(TestCase):
+
+    def test_brand_save_gets_unique_slug(self):
+        first = Brand.objects.create(title='Лада')
+        second = Brand.objects.create(title='Лада')
+        self.assertEqual((first.slug, second.slug), ('lada', 'lada-1'))
+        second.title = 'Лада'
+        second.save()
+        self.assertEqual(second.slug, 'lada-1')
+
+    def test_title_ending_with_number(self):
+        Brand.objects.create(title='Toyota 2019')
+        self.assertEqual([Brand.objects.create(title='Toyota').slug for _ in range(2)], ['toyota', 'toyota-1'])
+        self.assertEqual(generate_unique_slugs(Brand, ['Toyota', 'Toyota 2019']), ['toyota-2', 'toyota-2019-1'])
+
+    def test_many_distinct_titles(self):
+        Brand.objects.bulk_create([Brand(title=f'Марка {index}', slug=f'marka-{index}') for index in range(0, 1200, 7)])
+        titles = [f'Марка {index}' for index in range(1200)] + ['Марка 0', 'Марка 1199']
+        slugs = generate_unique_slugs(Brand, titles)
+        self.assertEqual(len(set(slugs)), len(titles))
+        self.assertEqual(slugs[:2], ['marka-0-1', 'marka-1'])
+        self.assertEqual(slugs[-2:], ['marka-0-2', 'marka-1199-1'])
+        self.assertEqual(slugs[7], 'marka-7-1')
+
+
+class CountingStorage(FileSystemStorage):
+
+    def __init__(self, *args, **kwargs):
+        super(CountingStorage, self).__init__(*args, **kwargs)
+        self.calls = 0
+
+    def exists(self, name):
+        self.calls += 1
+        return super(CountingStorage, self).exists(name)
+
+    def open(self, name, mode='rb'):
+        self.calls += 1
+        return super(CountingStorage, self).open(name, mode)
+
+
+@override_settings(IMAGE_DERIVATIVE_WIDTHS=(160, 320))
+class ImageDerivativesTest(SimpleTestCase):
+
+    def setUp(self):
+        cache.clear()
+        self.directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.directory)
+        self.storage = CountingStorage(location=self.directory, base_url='/media/')
+
+    def save_image(self, name, width):
+        buffer = BytesIO()
+        PILImage.new('RGB', (width, width // 2), 'red').save(buffer, format='PNG')
+        name = self.storage.save(name, ContentFile(buffer.getvalue()))
+        return FieldFile(None, SimpleNamespace(storage=self.storage), name)
+
+    def test_srcset_from_manifest(self):
+        field_file = self.save_image('logo.png', 400)
+        self.assertFalse(has_derivatives(field_file))
+        self.assertEqual(generate_derivatives(self.storage, field_file.name), 4)
+        self.assertTrue(has_derivatives(field_file))
+        self.storage.calls = 0
+        self.assertEqual(get_srcset(field_file, 'webp'),
+                         '/media/logo.160w.webp 160w, /media/logo.320w.webp 320w, /media/logo.png 400w')
+        self.assertEqual(get_srcset(field_file, 'jpeg').split(', ')[0], '/media/logo.160w.jpeg 160w')
+        self.assertEqual(self.storage.calls, 0)
+        cache.clear()
+        get_srcset(field_file, 'webp')
+        get_srcset(field_file, 'webp')
+        self.assertEqual(self.storage.calls, 1)
+        self.assertEqual(generate_derivatives(self.storage, field_file.name), 0)
+
+    def test_small_image_is_processed_once(self):
+        field_file = self.save_image('small.png', 100)
+        self.assertEqual(generate_derivatives(self.storage, field_file.name), 0)
+        self.assertTrue(has_derivatives(field_file))
+        self.assertEqual(get_srcset(field_file, 'webp'), '')
+
+    def test_delete_derivatives(self):
+        field_file = self.save_image('logo.png', 400)
+        generate_derivatives(self.storage, field_file.name)
+        delete_derivatives(self.storage, field_file.name)
+        self.assertEqual(os.listdir(self.directory), ['logo.png'])
+        self.assertFalse(has_derivatives(field_file))
+
+
+class BackfillDerivativesTest(TestCase):
+
+    def setUp(self):
+        cache.clear()
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory)
+        override = override_settings(MEDIA_ROOT=directory)
+        override.enable()
+        self.addCleanup(override.disable)
+
+    def test_broken_images_do_not_stop_backfill(self):
+        buffer = BytesIO()
+        PILImage.new('RGB', (400, 200), 'red').save(buffer, format='PNG')
+        good = Brand.objects.create(title='Хороший')
+        good.logo.save('good.png', ContentFile(buffer.getvalue()))
+        broken = Brand.objects.create(title='Битый')
+        broken.logo.save('broken.png', ContentFile(b'not an image'))
+        missing = Brand.objects.create(title='Пропавший', logo='motorpool/brands/missing.png')
+        out, err = StringIO(), StringIO()
+        with self.assertLogs('main.management.commands.backfill_image_derivatives', 'ERROR'):
+            call_command('backfill_image_derivatives', stdout=out, stderr=err)
+        self.assertTrue(has_derivatives(Brand.objects.get(pk=good.pk).logo))
+        self.assertIn(f'pk={broken.pk}: {broken.logo.name}', err.getvalue())
+        self.assertIn(f'pk={missing.pk}: motorpool/brands/missing.png', err.getvalue())
+        self.assertIn('создано копий 4, ошибок 2', out.getvalue())
+        self.assertIn('не обработано изображений: 2', out.getvalue())
+
+
+@override_settings(STATICFILES_STORAGE='django.contrib.staticfiles.storage.StaticFilesStorage')
+class PageCacheTest(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.brand = Brand.objects.create(title='Кэш')
+        cls.auto = Auto.objects.create(brand=cls.brand, number='к001кк')
+
+    def setUp(self):
+        cache.clear()
+
+    def test_cache_timeout(self):
+        with self.settings(SHARED_CACHE=False, VIEW_CACHE_LOCAL_TIMEOUT=30):
+            self.assertEqual(AutoDetailView().get_cache_timeout(), 30)
+        with self.settings(SHARED_CACHE=True):
+            self.assertIsNone(AutoDetailView().get_cache_timeout())
+
+    def test_brand_change_invalidates_auto_detail(self):
+        url = reverse('motorpool:auto_detail', args=[self.auto.pk])
+        self.assertContains(self.client.get(url), 'Кэш')
+        with self.assertNumQueries(0):
+            self.client.get(url)
+        with self.captureOnCommitCallbacks(execute=True):
+            self.brand.title = 'Новый кэш'
+            self.brand.save()
+        self.assertContains(self.client.get(url), 'Новый кэш')
+
+    def test_personal_fragments_are_not_shared(self):
+        url = reverse('motorpool:brand_detail', args=[self.brand.pk])
+        first = User.objects.create_user(username='first', password='secret')
+        second = User.objects.create_user(username='second', password='secret')
+        self.client.force_login(first)
+        response = self.client.get(url)
+        self.assertContains(response, 'first')
+        self.assertNotContains(response, '<!-- personal:')
+        self.client.force_login(second)
+        response = self.client.get(url)
+        self.assertContains(response, 'second')
+        self.assertNotContains(response, 'first')
+        self.assertEqual(get_cache_stats()['hits'], 1)
+        self.client.logout()
+        self.assertContains(self.client.get(url), 'Войти')
+
+
+class FleetSummaryTest(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.brand = Brand.objects.create(title='Сводка')
+        cls.other = Brand.objects.create(title='Другая сводка')
+        for index, (brand, year, power) in enumerate([(cls.brand, 2022, 100), (cls.brand, 2001, 150),
+                                                      (cls.other, 2022, 90)]):
+            auto = Auto.objects.create(brand=brand, number=f'с{index:03}вв', year=year)
+            VehiclePassport.objects.create(auto=auto, vin=f'VIN{index}', engine_volume=1600, engine_power=power)
+
+    def assertSummaryActual(self):
+        summaries = calculate_summaries()
+        for summary in BrandFleetSummary.objects.all():
+            actual = summaries.get(summary.brand_id, BrandFleetSummary(brand_id=summary.brand_id))
+            self.assertEqual(get_summary_values(summary), get_summary_values(actual), summary.brand)
+
+    def test_signals_keep_summary_actual(self):
+        self.assertSummaryActual()
+        self.assertEqual(get_summary_values(BrandFleetSummary.objects.get(brand=self.brand)), [2, 250, 1, 1])
+        auto = self.brand.cars.get(year=2001)
+        auto.brand = self.other
+        auto.save()
+        auto.pts.engine_power = 200
+        auto.pts.save()
+        self.assertSummaryActual()
+        auto.delete()
+        self.assertSummaryActual()
+
+    def test_delete_brand_with_autos_and_passports(self):
+        self.brand.delete()
+        self.assertFalse(BrandFleetSummary.objects.filter(brand_id=self.brand.pk).exists())
+        self.assertEqual(get_summary_values(BrandFleetSummary.objects.get(brand=self.other)), [1, 90, 1, 0])
+        self.assertFalse(VehiclePassport.objects.filter(auto__brand__isnull=True).exists())
+
+    def test_rebuild_summaries(self):
+        BrandFleetSummary.objects.filter(brand=self.brand).update(car_count=10)
+        BrandFleetSummary.objects.filter(brand=self.other).delete()
+        self.assertEqual(rebuild_summaries(), (1, 1))
+        self.assertSummaryActual()
+
+
+@override_settings(FLEET_TAX_BRACKETS=((1600, 0.1), (2000, 0.2)))
+class FleetTaxTest(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        seed_fleet(brands=3, autos_per_brand=4, users=1)
+        auto = Auto.objects.create(brand=None, number='н001нн')
+        VehiclePassport.objects.create(auto=auto, vin='VINN', engine_volume=2500, engine_power=150)
+
+    def test_report_matches_orm(self):
+        report = FleetTaxReport(FleetColumns.load())
+        queryset = Auto.objects.filter(pts__isnull=False).order_by().values('brand_id').annotate(
+            tax=Sum(get_tax_expression()))
+        expected = {row['brand_id']: row['tax'] for row in queryset}
+        self.assertEqual(dict(report.by_brand()).keys(), expected.keys())
+        for brand_id, total in report.by_brand():
+            self.assertAlmostEqual(total, expected[brand_id])
+        self.assertAlmostEqual(report.total, sum(expected.values()))
+
+    def test_calculate_taxes_brackets(self):
+        taxes = calculate_taxes(np.array([1600, 1601, 2000, 2001], dtype=np.int64))
+        self.assertEqual(np.round(taxes, 2).tolist(), [0, 160.1, 200, 400.2])
+
+    def test_benchmark_command(self):
+        output = StringIO()
+        call_command('benchmark_fleet_tax', stdout=output, stderr=output)
+        self.assertIn('ORM', output.getvalue())
+        self.assertNotIn('не совпадают', output.getvalue())
+
+
+class AutoExportTest(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_superuser(username='exporter', password='secret')
+        cls.brand = Brand.objects.create(title='Выгрузка')
+        cls.autos = [Auto.objects.create(brand=cls.brand, number=f'в{index:03}вв',
+                                         auto_class=Auto.AUTO_CLASS_ECONOMY if index else Auto.AUTO_CLASS_COMFORT)
+                     for index in range(3)]
+
+    def setUp(self):
+        cache.clear()
+        facet_index.load()
+        self.client.force_login(self.user)
+
+    def tearDown(self):
+        facet_index.loaded = False
+
+    def export(self, data=None):
+        response = self.client.get(reverse('motorpool:auto_export', args=['ndjson']), data)
+        if response.status_code != 200:
+            return response, None
+        return response, [json.loads(line)['id'] for line in b''.join(response.streaming_content).splitlines()]
+
+    def test_filtered_export(self):
+        response, ids = self.export({'auto_class': Auto.AUTO_CLASS_ECONOMY})
+        self.assertEqual(sorted(ids), [auto.pk for auto in self.autos[1:]])
+
+    def test_invalid_filter_is_rejected(self):
+        for data in ({'brand': 'x'}, {'date_from': '2030-01-02'}, {'date_from': '2030-01-02', 'date_to': '2030-01-01'}):
+            response, ids = self.export(data)
+            self.assertEqual(response.status_code, 400, data)
+
+    def test_unfiltered_export(self):
+        response, ids = self.export()
+        self.assertEqual(len(ids), 3)
+
+
+class AutoApiTest(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user(username='reviewer', password='secret')
+        cls.staff = User.objects.create_superuser(username='manager', password='secret')
+        cls.auto = Auto.objects.create(brand=Brand.objects.create(title='Апи'), number='а001пп')
+        cls.other = Auto.objects.create(brand=None, number='а002пп')
+        VehiclePassport.objects.create(auto=cls.auto, vin='SECRETVIN', engine_volume=1600, engine_power=100)
+
+    def setUp(self):
+        cache.clear()
+
+    def test_vin_requires_permission(self):
+        url = reverse('motorpool:api_auto_detail', args=[self.auto.pk])
+        response = self.client.get(url)
+        self.assertNotIn('vin', response.json())
+        self.assertEqual(self.client.get(url, {'fields': 'vin'}).status_code, 400)
+        self.client.force_login(self.staff)
+        staff_response = self.client.get(url, HTTP_IF_NONE_MATCH=response['ETag'])
+        self.assertEqual(staff_response.json()['vin'], 'SECRETVIN')
+        self.assertIn('Cookie', staff_response['Vary'])
+
+    def test_review_changes_only_its_auto_etag(self):
+        urls = [reverse('motorpool:api_auto_detail', args=[auto.pk]) for auto in (self.auto, self.other)]
+        etags = [self.client.get(url)['ETag'] for url in urls]
+        with self.captureOnCommitCallbacks(execute=True):
+            AutoReview.objects.create(auto=self.auto, user=self.user, rate=5, text='Отлично')
+        response = self.client.get(urls[0], HTTP_IF_NONE_MATCH=etags[0])
+        self.assertEqual(response.json()['review_count'], 1)
+        self.assertEqual(self.client.get(urls[1], HTTP_IF_NONE_MATCH=etags[1]).status_code, 304)
+
+    def test_brand_rename_changes_auto_etag(self):
+        url = reverse('motorpool:api_auto_detail', args=[self.auto.pk])
+        etag = self.client.get(url)['ETag']
+        brand = self.auto.brand
+        brand.title = 'Апи новый'
+        with self.captureOnCommitCallbacks(execute=True):
+            brand.save()
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()['brand'], 'Апи новый')
+
+    def test_brand_logo_is_url(self):
+        url = reverse('motorpool:api_brand_detail', args=[self.auto.brand_id])
+        self.assertEqual(self.client.get(url).json()['logo'], '/static/images/brand-car.png')
+        Brand.objects.filter(pk=self.auto.brand_id).update(logo='motorpool/brands/api.png')
+        self.assertEqual(self.client.get(url).json()['logo'], Brand.objects.get(pk=self.auto.brand_id).logo.url)
+
+    def test_errors_are_json(self):
+        response = self.client.get(reverse('motorpool:api_auto_detail', args=[self.other.pk + 100]))
+        self.assertEqual(response.status_code, 404)
+        self.assertEqual(response.json(), {'error': 'Объект не найден'})
+        response = self.client.get(reverse('motorpool:api_auto_list'), {'after': 'broken'})
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(response.json(), {'error': 'Неверный курсор страницы'})
+
+
+
+@override_settings(STATICFILES_STORAGE='django.contrib.staticfiles.storage.StaticFilesStorage')
+class AdminSearchTest(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.staff = User.objects.create_superuser(username='admin', password='secret')
+        cls.auto = Auto.objects.create(brand=Brand.objects.create(title='Поиск'), number='а123вс')
+        Auto.objects.create(brand=None, number='к777кк')
+        VehiclePassport.objects.create(auto=cls.auto, vin='XTA21099012345678', engine_volume=1600, engine_power=100)
+
+    def setUp(self):
+        self.client.force_login(self.staff)
+
+    def search(self, model_name, term):
+        response = self.client.get(reverse(f'admin:motorpool_{model_name}_changelist'), {'q': term})
+        return list(response.context['cl'].result_list)
+
+    def test_infix_search(self):
+        self.assertEqual(self.search('auto', '123'), [self.auto])
+        self.assertEqual(self.search('auto', '9901234'), [self.auto])
+        self.assertEqual([passport.auto_id for passport in self.search('vehiclepassport', '123в')], [self.auto.pk])
+
+
+class AsyncViewTest(SimpleTestCase):
+
+    def test_view_is_coroutine_function(self):
+        view = AsyncAutoDetailView.as_view()
+        self.assertTrue(asyncio.iscoroutinefunction(view))
+        self.assertIs(view.view_class, AsyncAutoDetailView)
+
+    def test_method_not_allowed(self):
+        request = RequestFactory().post('/')
+        response = async_to_sync(AsyncAutoDetailView.as_view())(request, pk=1)
+        self.assertEqual(response.status_code, 405)
+        self.assertEqual(response['Allow'], 'GET, HEAD')
+
+
+@override_settings(STATICFILES_STORAGE='django.contrib.staticfiles.storage.StaticFilesStorage')
+class ReplicaRouterTest(TransactionTestCase):
+    # Реплика - второй алиас на том же соединении: проверяется выбор базы, а не репликация
+
+    def setUp(self):
+        self.replica_router = next(item for item in router.routers if isinstance(item, ReplicaRouter))
+        replicas = self.replica_router.replicas
+        self.replica_router.replicas = ['replica_0']
+        self.addCleanup(setattr, self.replica_router, 'replicas', replicas)
+        connections['replica_0'] = connections[DEFAULT_DB_ALIAS]
+        self.addCleanup(connections.__delitem__, 'replica_0')
+        self.addCleanup(self.replica_router.health.down_until.clear)
+        self.brand = Brand.objects.create(title='Реплика')
+
+    def in_request(self, func, pinned=False):
+        token = request_state.set(RequestDbState(pinned=pinned))
+        try:
+            return func(), request_state.get()
+        finally:
+            request_state.reset(token)
+
+    def test_reads_go_to_replica(self):
+        brand, state = self.in_request(lambda: Brand.objects.get(pk=self.brand.pk))
+        self.assertEqual(brand._state.db, 'replica_0')
+        self.assertEqual(self.in_request(lambda: User.objects.all().db)[0], DEFAULT_DB_ALIAS)
+        self.assertEqual(Brand.objects.all().db, DEFAULT_DB_ALIAS)
+        self.assertEqual(self.in_request(lambda: Brand.objects.all().db, pinned=True)[0], DEFAULT_DB_ALIAS)
+
+    def test_read_your_writes(self):
+        def write_then_read():
+            Auto.objects.create(brand=self.brand, number='р001рр')
+            return Auto.objects.filter(brand=self.brand).db
+
+        db, state = self.in_request(write_then_read)
+        self.assertEqual(db, DEFAULT_DB_ALIAS)
+        self.assertTrue(state.written)
+
+    def test_session_write_does_not_pin(self):
+        user = User.objects.create_user(username='replica', password='secret')
+
+        def login():
+            User.objects.filter(pk=user.pk).update(last_login=timezone.now())
+            return Brand.objects.all().db
+
+        db, state = self.in_request(login)
+        self.assertEqual(db, 'replica_0')
+        self.assertFalse(state.written)
+        response = self.client.post(reverse('accounts:sign_in'), {'login': 'replica', 'password': 'secret'})
+        self.assertEqual(response.status_code, 302)
+        self.assertNotIn(PIN_COOKIE_NAME, response.cookies)
+
+    def test_write_sets_pin_cookie(self):
+        self.client.force_login(User.objects.create_user(username='writer', password='secret'))
+        response = self.client.post(reverse('motorpool:brand_create'), {'title': 'Новая реплика'})
+        self.assertEqual(response.status_code, 302)
+        self.assertIn(PIN_COOKIE_NAME, response.cookies)
+
+        def get_response(request):
+            return HttpResponse(Brand.objects.all().db)
+
+        request = RequestFactory().get('/')
+        request.COOKIES[PIN_COOKIE_NAME] = '1'
+        self.assertEqual(PrimaryStickinessMiddleware(get_response)(request).content.decode(), DEFAULT_DB_ALIAS)
+        self.assertEqual(PrimaryStickinessMiddleware(get_response)(RequestFactory().get('/')).content.decode(),
+                         'replica_0')
+
+    def test_unavailable_replica_falls_back_to_primary(self):
+        self.replica_router.health.mark_down('replica_0')
+        self.assertEqual(self.in_request(lambda: Brand.objects.all().db)[0], DEFAULT_DB_ALIAS)
+
+
+class FullScanCheckTest(TestCase):
+
+    def get_scans(self, queryset):
+        sql, params = queryset.query.sql_with_params()
+        return get_full_scans(sql, params)
+
+    def test_full_scans(self):
+        self.assertEqual(self.get_scans(Auto.objects.order_by('pk')[:5]), [])
+        self.assertEqual(self.get_scans(Auto.objects.filter(brand_id=1)), [])
+        self.assertEqual(self.get_scans(Auto.objects.all()), ['motorpool_auto'])
+        self.assertEqual(self.get_scans(Auto.objects.filter(number__contains='1')[:5]), ['motorpool_auto'])
+        self.assertEqual(self.get_scans(Auto.objects.order_by('number')[:5]), ['motorpool_auto'])
+
+
+def run_in_threads(func, count=8):
+    errors = []
+
+    def target():
+        try:
+            func()
+        except Exception as error:
+            errors.append(error)
+
+    threads = [threading.Thread(target=target) for _ in range(count)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return errors
+
+
+class SlowQueryLogTest(SimpleTestCase):
+
+    def setUp(self):
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory)
+        override = override_settings(SLOW_QUERY_DIR=directory)
+        override.enable()
+        self.addCleanup(override.disable)
+        self.log = SlowQueryLog()
+
+    def test_concurrent_flush(self):
+        self.log.entries['abc'] = {'fingerprint': 'abc', 'count': 1}
+
+        def flush():
+            for _ in range(50):
+                self.log.flush()
+
+        self.assertEqual(run_in_threads(flush), [])
+        self.assertEqual(len(self.log.get_paths()), 1)
+
+    def test_no_files_without_directory(self):
+        self.log.entries['abc'] = {'fingerprint': 'abc', 'count': 1}
+        with override_settings(SLOW_QUERY_DIR=None):
+            self.log.flush()
+            self.assertEqual(self.log.get_paths(), [])
+        self.assertEqual(self.log.get_paths(), [])
+
+
+class SlowQueryExplainTest(TestCase):
+
+    def test_failed_explain_keeps_transaction(self):
+        connection = connections[DEFAULT_DB_ALIAS]
+        self.assertTrue(connection.in_atomic_block)
+        with mock.patch('utils.slow_queries.transaction.atomic', wraps=transaction.atomic) as atomic:
+            result = explain(connection, 'SELECT * FROM missing_table', [])
+        self.assertTrue(result.startswith('EXPLAIN не выполнен'))
+        atomic.assert_called_once_with(using=DEFAULT_DB_ALIAS)
+        self.assertFalse(connection.needs_rollback)
+        self.assertEqual(Brand.objects.count(), 0)
+
+
+class MetricsStoreTest(SimpleTestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.directory)
+        override = override_settings(METRICS_DIR=self.directory, METRICS_FLUSH_SECONDS=0)
+        override.enable()
+        self.addCleanup(override.disable)
+        self.store = MetricsStore()
+
+    def test_concurrent_observe(self):
+        def observe():
+            for _ in range(50):
+                self.store.observe('view', 'GET', 200, 0.01, RequestMetrics())
+
+        self.assertEqual(run_in_threads(observe), [])
+        counters, histograms = self.store.collect()
+        self.assertEqual(counters[('requests_total', ('view', 'GET', 200))], 400)
+        self.assertEqual(histograms['view'][-1], 400)
+
+    def test_dead_worker_files_are_removed(self):
+        process = subprocess.Popen([sys.executable, '-c', ''])
+        process.wait()
+        stale = os.path.join(self.directory, f'metrics_{process.pid}_deadbeef.json')
+        with open(stale, 'w') as file:
+            json.dump({'counters': [['requests_total', ['view', 'GET', 200], 7]], 'histograms': []}, file)
+        self.store.observe('view', 'GET', 200, 0.01, RequestMetrics())
+        counters, histograms = self.store.collect()
+        self.assertEqual(counters[('requests_total', ('view', 'GET', 200))], 1)
+        self.assertFalse(os.path.exists(stale))
+
+    def test_observe_errors_do_not_break_response(self):
+        middleware = RequestMetricsMiddleware(lambda request: HttpResponse('ok'))
+        with mock.patch.object(metrics_store, 'observe', side_effect=OSError('disk full')):
+            with self.assertLogs('utils.metrics', 'ERROR'):
+                response = middleware(RequestFactory().get('/'))
+        self.assertEqual(response.status_code, 200)
+
+
+class ProfilingTest(SimpleTestCase):
+
+    def setUp(self):
+        cache.clear()
+
+    @override_settings(PROFILE_RATE_LIMIT=10, PROFILE_WORKERS=4)
+    def test_rate_limit_is_split_without_shared_cache(self):
+        with self.settings(SHARED_CACHE=False):
+            self.assertEqual([acquire_rate_limit() for _ in range(3)], [True, True, False])
+        cache.clear()
+        with self.settings(SHARED_CACHE=True):
+            self.assertEqual(get_rate_limit(), 10)
+
+    def test_async_view_note(self):
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory)
+        request = RequestFactory().get('/')
+        request.resolver_match = resolve(reverse('motorpool:auto_detail', args=[1]))
+        request.resolver_match.func = AsyncAutoDetailView.as_view()
+        with self.settings(PROFILE_DIR=directory):
+            name = RequestProfile(request).save(HttpResponse())
+        with open(os.path.join(directory, f'{name}.json')) as file:
+            self.assertEqual(json.load(file)['notes'], [ASYNC_VIEW_NOTE])
+
+    def get_profiled_request(self):
+        return RequestFactory().get('/', HTTP_X_PROFILE=make_profile_token())
+
+    def test_save_error_keeps_response(self):
+        middleware = RequestProfilerMiddleware(lambda request: HttpResponse('ok'))
+        with mock.patch.object(RequestProfile, 'save', side_effect=OSError('диск заполнен')), \
+                self.assertLogs('utils.profiling', 'ERROR'):
+            response = middleware(self.get_profiled_request())
+        self.assertEqual(response.content, b'ok')
+        self.assertNotIn('X-Profile', response)
+
+    def test_save_error_keeps_view_exception(self):
+        def get_response(request):
+            raise KeyError('view')
+
+        middleware = RequestProfilerMiddleware(get_response)
+        with mock.patch.object(RequestProfile, 'save', side_effect=OSError('диск заполнен')), \
+                self.assertLogs('utils.profiling', 'ERROR'), self.assertRaises(KeyError):
+            middleware(self.get_profiled_request())
+
+    def test_rate_limited_request_releases_lock(self):
+        def get_response(request):
+            self.assertFalse(middleware.lock.locked())
+            return HttpResponse()
+
+        middleware = RequestProfilerMiddleware(get_response)
+        with mock.patch('utils.profiling.acquire_rate_limit', return_value=False):
+            response = middleware(self.get_profiled_request())
+        self.assertEqual(response['X-Profile'], 'rate-limited')
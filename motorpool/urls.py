@@ -1,14 +1,21 @@
+from django.conf import settings
 from django.urls import path
 from django.views.decorators.http import require_POST
 
-from . import views
+from . import api, views
 
 app_name = 'motorpool'
 
+if settings.ASYNC_VIEWS:
+    BrandDetailView, AutoDetailView, AutoListView = (views.AsyncBrandDetailView, views.AsyncAutoDetailView,
+                                                     views.AsyncAutoListView)
+else:
+    BrandDetailView, AutoDetailView, AutoListView = views.BrandDetailView, views.AutoDetailView, views.AutoListView
+
 urlpatterns = [
     # Brand
     path('brand-list/', views.BrandList.as_view(), name='brand_list'),
-    path('brand-detail/<int:pk>/', views.BrandDetailView.as_view(), name='brand_detail'),
+    path('brand-detail/<int:pk>/', BrandDetailView.as_view(), name='brand_detail'),
     path('brand-create/', views.BrandCreateView.as_view(), name='brand_create'),
     path('brand-update/<int:pk>/', views.BrandUpdateView.as_view(), name='brand_update'),
     path('brand-delete/<int:pk>/', views.BrandDeleteView.as_view(), name='brand_delete'),
@@ -16,8 +23,15 @@ urlpatterns = [
     path('brand-set-paginate/', views.set_paginate_view, name='brand_list_set_paginate'),
     # Auto
     path('auto-create/<int:brand_pk>/', views.AutoCreateView.as_view(), name='auto_create'),
-    path('auto-list/', views.AutoListView.as_view(), name='auto_list'),
-    path('auto-detail/<int:pk>/', views.AutoDetailView.as_view(), name='auto_detail'),
+    path('auto-list/', AutoListView.as_view(), name='auto_list'),
+    path('auto-detail/<int:pk>/', AutoDetailView.as_view(), name='auto_detail'),
     path('auto-send-review/', require_POST(views.AutoSendReview.as_view()), name='auto_send_review'),
     path('auto-rent/', require_POST(views.AutoRentView.as_view()), name='auto_rent'),
+    path('auto-export.<str:file_format>', views.auto_export, name='auto_export'),
+    path('fleet-summary/', views.auto_list, name='fleet_summary'),
+    # API
+    path('api/brands/', api.BrandApiList.as_view(), name='api_brand_list'),
+    path('api/brands/<int:pk>/', api.BrandApiDetail.as_view(), name='api_brand_detail'),
+    path('api/autos/', api.AutoApiList.as_view(), name='api_auto_list'),
+    path('api/autos/<int:pk>/', api.AutoApiDetail.as_view(), name='api_auto_detail'),
 ]
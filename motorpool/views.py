@@ -1,7 +1,9 @@
+from asgiref.sync import sync_to_async
 from django.contrib import messages
+from django.contrib.auth.decorators import permission_required
 from django.contrib.auth.mixins import LoginRequiredMixin
-from django.db.models import Count, Sum, Q, Prefetch, F, Case, When, IntegerField, Avg
-from django.http import HttpResponseRedirect
+from django.core.cache import cache
+from django.http import HttpResponseBadRequest, HttpResponseRedirect, StreamingHttpResponse, Http404
 from django.shortcuts import render, get_object_or_404
 from django.urls import reverse_lazy
 from django.views.decorators.http import require_POST
@@ -9,8 +11,14 @@ from django.views.generic import (ListView, DetailView, CreateView,
                                   UpdateView, DeleteView, TemplateView)
 from django.views.generic.edit import ProcessFormView
 
-from motorpool.models import Brand, Favorite, Auto, AutoReview, AutoRent
-from utils.cache import CacheMixin
+from motorpool.availability import availability_index
+from motorpool.export import EXPORT_FORMATS, get_export_ids, iter_export
+from motorpool.facets import facet_index, get_facet_filters, AutoIdSequence
+from motorpool.models import Brand, Favorite, Auto, AutoReview, AutoRent, Option, BrandFleetSummary
+from utils.aio import AsyncCacheViewMixin, AsyncViewMixin, gather_queries, load_user
+from utils.cache import CacheMixin, get_versions
+from utils.counts import CountingPaginator, get_count
+from utils.pagination import CursorPaginationMixin
 from .forms import (BrandCreationForm, BrandUpdateForm,
                     AutoFormSet, BrandAddToFavoriteForm, AutoReviewForm, AutoRentForm, AutoFilterForm)
 
@@ -53,13 +61,14 @@ class BrandDeleteView(DeleteView):
         return result
 
 
-class BrandList(ListView):
+class BrandList(CursorPaginationMixin, ListView):
     model = Brand
     paginate_by = 15
+    paginator_class = CountingPaginator
 
     def get_context_data(self, **kwargs):
         context = super().get_context_data(**kwargs)
-        context['brand_number'] = Brand.objects.count()
+        context['brand_number'] = get_count(Brand.objects.all())
         return context
 
     def get_queryset(self):
@@ -78,12 +87,19 @@ class BrandList(ListView):
 class BrandDetailView(CacheMixin, DetailView):
     model = Brand
 
+    def get_cache_dependencies(self):
+        return [(Brand, self.kwargs['pk'])]
+
     def get_context_data(self, **kwargs):
         context = super().get_context_data(**kwargs)
-        context['cars'] = self.object.cars.all()
-        context['favorite_form'] = BrandAddToFavoriteForm(initial={'user': self.request.user, 'brand': self.object})
+        context['cars'] = self.object.cars.select_related('pts')
         return context
 
+    def get_personal_context(self):
+        return {
+            'favorite_form': BrandAddToFavoriteForm(initial={'user': self.request.user, 'brand': self.kwargs['pk']}),
+        }
+
 
 class AutoCreateView(LoginRequiredMixin, ProcessFormView, TemplateView):
 
@@ -129,43 +145,40 @@ class BrandAddToFavoriteView(LoginRequiredMixin, CreateView):
 
 
 def auto_list(request):
-    whens = [
-        When(pts__engine_volume__gt=2000, then=0.2),
-        When(pts__engine_volume__gt=1600, then=0.1),
-    ]
-
-    cars_qs = Auto.objects.select_related('pts').annotate(
-        tax=F('pts__engine_volume') * Case(*whens,
-                                           default=0,
-                                           output_field=IntegerField()
-                                           ))
-
-    prefetch_all_cars = Prefetch('cars', queryset=cars_qs.all(), to_attr='all_cars_list')
-    prefetch_new_cars = Prefetch('cars', queryset=cars_qs.filter(year__gt=2010), to_attr='new_cars_list')
-    prefetch_old_cars = Prefetch('cars', queryset=cars_qs.filter(year__lt=2010), to_attr='old_cars_list')
-    qs = Brand.objects.prefetch_related(prefetch_all_cars, prefetch_new_cars, prefetch_old_cars).annotate(
-        car_count=Count('cars'),
-        total_engine_power=Sum('cars__pts__engine_power'),
-        new_cars=Count('cars', Q(cars__year__gt=2010)),
-        old_cars=Count('cars', Q(cars__year__lt=2010))
-    )
-    return render(request, 'motorpool/auto_list.html', {'object_list': qs})
+    qs = BrandFleetSummary.objects.select_related('brand').order_by('brand__title')
+    return render(request, 'motorpool/fleet_summary.html', {'object_list': qs})
 
 
 class AutoDetailView(CacheMixin, DetailView):
     model = Auto
     template_name = 'motorpool/auto_detail.html'
 
+    def get_cache_dependencies(self):
+        # Версия бренда вместо сброса версий всех его автомобилей при изменении бренда
+        return [(Auto, self.kwargs['pk']), (Brand, self.get_brand_id()), (Option, None)]
+
+    def get_brand_id(self):
+        # Смена бренда меняет версию автомобиля, поэтому бренд кэшируется под этой версией
+        pk = self.kwargs['pk']
+        version = get_versions([(Auto, pk)])[0]
+        return cache.get_or_set(f'auto_brand:{pk}:{version}',
+                                lambda: Auto.objects.filter(pk=pk).values_list('brand_id', flat=True).first())
+
     def get_context_data(self, **kwargs):
         context = super().get_context_data(**kwargs)
         context['reviews'] = self.object.reviews.select_related('user')
-        context['review_form'] = AutoReviewForm(initial={'user': self.request.user, 'auto': self.object})
-        context['rent_form'] = AutoRentForm(initial={'user': self.request.user, 'auto': self.object})
         return context
 
+    def get_personal_context(self):
+        initial = {'user': self.request.user, 'auto': self.kwargs['pk']}
+        return {
+            'review_form': AutoReviewForm(initial=initial),
+            'rent_form': AutoRentForm(initial=initial),
+        }
+
     def get_queryset(self):
         qs = super().get_queryset()
-        qs = qs.select_related('brand').annotate(review_count=Count('reviews'), rate=Avg('reviews__rate'))
+        qs = qs.select_related('brand', 'rating')
         return qs
 
 
@@ -197,34 +210,125 @@ class AutoRentView(CreateView):
         return super().form_valid(form)
 
 
-class AutoListView(ListView):
+class AutoListView(CursorPaginationMixin, ListView):
     model = Auto
     template_name = 'motorpool/auto_list.html'
     paginate_by = 20
+    ordering = 'pk'
+    paginator_class = CountingPaginator
 
     def get_context_data(self, **kwargs):
         context = super().get_context_data(**kwargs)
-        context['count'] = self.object_list.count()
-        context['filter_form'] = AutoFilterForm(self.request.GET)
-        is_filter_used = bool(self.request.GET)
+        paginator = context['paginator']
+        context['count'] = paginator.count if isinstance(paginator, CountingPaginator) else get_count(self.object_list)
+        self.filter_form.set_facet_counts(facet_index.counts(excluded_ids=self.busy_ids, **self.facet_filters))
+        context['filter_form'] = self.filter_form
+        query = self.request.GET.copy()
+        for key in (self.page_kwarg, self.cursor_after_kwarg, self.cursor_before_kwarg):
+            query.pop(key, None)
+        is_filter_used = bool(query)
         if is_filter_used:
-            context['query'] = '&'.join(['='.join(item) for item in self.request.GET.items()])
+            context['query'] = query.urlencode()
         context['is_filter_used'] = is_filter_used
         return context
 
     def get_queryset(self):
-        queryset = super().get_queryset()
-        form = AutoFilterForm(self.request.GET)
-        if form.is_valid():
-            filter_brand = form.cleaned_data['brand']
-            filter_class = form.cleaned_data['auto_class']
-            filter_options = form.cleaned_data['options']
-            if filter_brand:
-                queryset = queryset.filter(brand=filter_brand)
-            if filter_class:
-                queryset = queryset.filter(auto_class__in=filter_class)
-            if filter_options:
-                for option in filter_options:
-                    queryset = queryset.filter(options__in=[option])
-        queryset = queryset.select_related('brand').annotate(review_count=Count('reviews'), rate=Avg('reviews__rate'))
+        queryset = super().get_queryset().select_related('brand', 'rating')
+        self.filter_form = AutoFilterForm(self.request.GET)
+        self.facet_filters = {}
+        self.busy_ids = None
+        if self.filter_form.is_valid():
+            self.facet_filters = get_facet_filters(self.filter_form.cleaned_data)
+            date_from = self.filter_form.cleaned_data['date_from']
+            date_to = self.filter_form.cleaned_data['date_to']
+            if date_from and date_to:
+                self.busy_ids = availability_index.busy(date_from, date_to)
+        if any(self.facet_filters.values()) or self.busy_ids is not None:
+            ids = facet_index.search(**self.facet_filters)
+            if self.busy_ids is not None:
+                ids = ids - self.busy_ids
+            return AutoIdSequence(queryset, list(ids))
         return queryset
+
+
+@permission_required('motorpool.view_auto', raise_exception=True)
+def auto_export(request, file_format):
+    if file_format not in EXPORT_FORMATS:
+        raise Http404
+    form = AutoFilterForm(request.GET)
+    if not form.is_valid():
+        return HttpResponseBadRequest(form.errors.as_text(), content_type='text/plain; charset=utf-8')
+    ids = get_export_ids(form)
+    response = StreamingHttpResponse(iter_export(file_format, ids), content_type=EXPORT_FORMATS[file_format])
+    response['Content-Disposition'] = f'attachment; filename="autos.{file_format}"'
+    return response
+
+
+def evaluated(queryset):
+    # Запрос выполняется сразу, а шаблон получает QuerySet с заполненным кешем результатов
+    len(queryset)
+    return queryset
+
+
+class AsyncBrandDetailView(AsyncCacheViewMixin, BrandDetailView):
+
+    def get_async_queries(self):
+        pk = self.kwargs['pk']
+        return {
+            'object': lambda: get_object_or_404(self.get_queryset(), pk=pk),
+            'cars': lambda: evaluated(Auto.objects.filter(brand_id=pk).select_related('pts')),
+        }
+
+    def get_context_data(self, **kwargs):
+        context = super().get_context_data(**kwargs)
+        context['cars'] = self.prefetched['cars']
+        return context
+
+    def render_page(self):
+        self.object = self.prefetched['object']
+        return self.render_to_response(self.get_context_data(object=self.object))
+
+
+class AsyncAutoDetailView(AsyncCacheViewMixin, AutoDetailView):
+
+    def get_async_queries(self):
+        pk = self.kwargs['pk']
+        return {
+            'object': lambda: get_object_or_404(self.get_queryset(), pk=pk),
+            'options': lambda: evaluated(Option.objects.filter(cars__id=pk)),
+            'reviews': lambda: evaluated(AutoReview.objects.filter(auto_id=pk).select_related('user')),
+        }
+
+    def get_context_data(self, **kwargs):
+        context = super().get_context_data(**kwargs)
+        context['reviews'] = self.prefetched['reviews']
+        return context
+
+    def render_page(self):
+        self.object = self.prefetched['object']
+        self.object._prefetched_objects_cache = {'options': self.prefetched['options']}
+        return self.render_to_response(self.get_context_data(object=self.object))
+
+
+class AsyncAutoListView(AsyncViewMixin, AutoListView):
+
+    def get_page_context(self):
+        self.object_list = self.get_queryset()
+        return self.get_context_data()
+
+    def render_page(self, context):
+        # Варианты выбора уже загружены параллельно со страницей, форма не выполняет своих запросов
+        for name in ('brand', 'options'):
+            field = self.filter_form.fields[name]
+            choices = [(obj.pk, field.label_from_instance(obj)) for obj in self.prefetched[name]]
+            field.choices = ([('', field.empty_label)] if field.empty_label is not None else []) + choices
+        return self.render_to_response(context)
+
+    async def get_async(self, request, *args, **kwargs):
+        self.prefetched = await gather_queries(
+            user=lambda: load_user(request),
+            brand=lambda: list(Brand.objects.all()),
+            options=lambda: list(Option.objects.all()),
+            context=self.get_page_context,
+        )
+        return await sync_to_async(self.render_page)(self.prefetched['context'])
@@ -31,6 +31,9 @@ SECRET_KEY = env('SECRET_KEY')
 # SECURITY WARNING: don't run with debug turned on in production!
 DEBUG = True
 
+# Панель отладки подключается только явно: в продакшене вместо нее работают метрики RequestMetricsMiddleware
+DEBUG_TOOLBAR = env.bool('DEBUG_TOOLBAR', default=DEBUG)
+
 ALLOWED_HOSTS = []
 
 # Application definition
@@ -48,28 +51,34 @@ INSTALLED_APPS = [
     'allauth.account',
     'allauth.socialaccount',
     'allauth.socialaccount.providers.github',
-    'debug_toolbar',
     'main.apps.MainConfig',
     'motorpool.apps.MotorpoolConfig',
     'accounts.apps.AccountsConfig',
 ]
 
 MIDDLEWARE = [
-    'debug_toolbar.middleware.DebugToolbarMiddleware',
+    'utils.metrics.RequestMetricsMiddleware',
+    'utils.slow_queries.SlowQueryMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
-    'django.contrib.auth.middleware.AuthenticationMiddleware',
+    'accounts.user_cache.CachedAuthenticationMiddleware',
+    'utils.db.PrimaryStickinessMiddleware',
+    'utils.profiling.RequestProfilerMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
 ]
 
+if DEBUG_TOOLBAR:
+    INSTALLED_APPS.append('debug_toolbar')
+    MIDDLEWARE.insert(2, 'debug_toolbar.middleware.DebugToolbarMiddleware')
+
 ROOT_URLCONF = 'pstaxi.urls'
 
 TEMPLATES = [
     {
-        'BACKEND': 'django.template.backends.django.DjangoTemplates',
+        'BACKEND': 'utils.metrics.InstrumentedTemplates',
         'DIRS': [os.path.join(BASE_DIR, 'templates')],
         'APP_DIRS': True,
         'OPTIONS': {
@@ -98,6 +107,21 @@ DATABASES = {
     }
 }
 
+CACHES = {
+    'default': env.cache('CACHE_URL', default='locmemcache://'),
+}
+
+# locmem у каждого процесса свой: версии, индексы, сессии и кэш пользователей согласованы между воркерами
+# gunicorn только при общем кэше (CACHE_URL=redis://... или memcache://...)
+SHARED_CACHE = env.bool('SHARED_CACHE', default=CACHES['default']['BACKEND'] not in (
+    'django.core.cache.backends.locmem.LocMemCache',
+    'django.core.cache.backends.dummy.DummyCache',
+))
+
+IN_PROCESS_INDEX_MAX_AGE = 60
+
+VIEW_CACHE_LOCAL_TIMEOUT = 60
+
 # Password validation
 # https://docs.djangoproject.com/en/3.2/ref/settings/#auth-password-validators
 
@@ -145,6 +169,12 @@ DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
 
 MEDIA_ROOT = BASE_DIR / 'media'
 
+# Сессии читаются из кэша только при общем кэше: в locmem выход или смена пароля в одном воркере
+# не видны остальным, поэтому без него используются штатные сессии в базе
+SESSION_ENGINE = 'accounts.sessions' if SHARED_CACHE else 'django.contrib.sessions.backends.db'
+
+USER_CACHE_TIMEOUT = 15 * 60
+
 LOGIN_REDIRECT_URL = '/'
 
 LOGOUT_REDIRECT_URL = '/'
@@ -160,6 +190,18 @@ EMAIL_USE_SSL = True
 
 django_heroku.settings(locals())
 
+# Реплики для чтения каталога: DATABASE_REPLICA_URLS=postgres://...,postgres://...
+for index, url in enumerate(env.list('DATABASE_REPLICA_URLS', default=[])):
+    DATABASES[f'replica_{index}'] = dict(env.db_url_config(url), TEST={'MIRROR': 'default'})
+
+DATABASE_ROUTERS = ['utils.db.ReplicaRouter']
+
+REPLICA_APPS = ('motorpool',)
+
+REPLICA_PIN_SECONDS = 15
+
+REPLICA_RETRY_SECONDS = 30
+
 AUTHENTICATION_BACKENDS = (
     'django.contrib.auth.backends.ModelBackend',
     'allauth.account.auth_backends.AuthenticationBackend',
@@ -173,3 +215,59 @@ ACCOUNT_AUTHENTICATION_METHOD = 'username_email'
 INTERNAL_IPS = [
     '127.0.0.1',
 ]
+
+CURSOR_PAGINATION = env.bool('CURSOR_PAGINATION', default=False)
+
+COUNT_CACHE_TIMEOUT = 60 * 60
+
+COUNT_ESTIMATE_THRESHOLD = 10000
+
+IMAGE_DERIVATIVE_WIDTHS = (160, 320, 640)
+
+IMAGE_DERIVATIVES_ASYNC = True
+
+IMAGE_DERIVATIVE_WORKERS = 2
+
+IMAGE_MANIFEST_CACHE_TIMEOUT = 60 * 60
+
+FLEET_TAX_BRACKETS = ((1600, 0.1), (2000, 0.2))
+
+# Асинхронные представления каталога: имеет смысл включать при запуске через ASGI (uvicorn)
+ASYNC_VIEWS = env.bool('ASYNC_VIEWS', default=False)
+
+METRICS_ENABLED = env.bool('METRICS_ENABLED', default=True)
+
+# Число воркеров gunicorn: от него зависят проверка METRICS_DIR и лимит профилирования без общего кэша
+WEB_WORKERS = env.int('WEB_CONCURRENCY', default=1)
+
+# Общий каталог для метрик всех воркеров gunicorn; без него эндпоинт показывает только текущий процесс,
+# поэтому при нескольких воркерах проверка main.E001 требует его задать
+METRICS_DIR = env('METRICS_DIR', default=None)
+
+METRICS_FLUSH_SECONDS = 1
+
+METRICS_ALLOWED_IPS = env.list('METRICS_ALLOWED_IPS', default=INTERNAL_IPS)
+
+# Профилирование отдельных запросов: каталог для стеков и SQL, частота выборки и лимит профилей на все воркеры
+PROFILE_DIR = env('PROFILE_DIR', default=None)
+
+PROFILE_INTERVAL = 0.005
+
+PROFILE_TOKEN_MAX_AGE = 600
+
+PROFILE_RATE_LIMIT = 10
+
+PROFILE_RATE_PERIOD = 60
+
+# Без общего кэша лимит считается в каждом воркере отдельно и делится на их число
+PROFILE_WORKERS = WEB_WORKERS
+
+# Журнал медленных запросов: все, что дольше порога, пишется в лог и в сводку по отпечаткам (manage.py slow_queries).
+# Включается заданием общего для воркеров каталога SLOW_QUERY_DIR
+SLOW_QUERY_DIR = env('SLOW_QUERY_DIR', default=None)
+
+SLOW_QUERY_ENABLED = env.bool('SLOW_QUERY_ENABLED', default=bool(SLOW_QUERY_DIR))
+
+SLOW_QUERY_THRESHOLD_MS = env.int('SLOW_QUERY_THRESHOLD_MS', default=100)
+
+SLOW_QUERY_TOP_N = 20
@@ -1,17 +1,23 @@
-import debug_toolbar
 from django.conf import settings
 from django.contrib import admin
 from django.urls import path, include
 
+from utils.metrics import metrics_view
+
 urlpatterns = [
     path('', include('main.urls')),
     path('admin/', admin.site.urls),
     path('motorpool/', include('motorpool.urls')),
     path('accounts/', include('accounts.urls')),
     path('allauth/accounts/', include('allauth.urls')),
-    path('__debug__/', include(debug_toolbar.urls))
+    path('metrics/', metrics_view, name='metrics'),
 ]
 
+if settings.DEBUG_TOOLBAR:
+    import debug_toolbar
+
+    urlpatterns.append(path('__debug__/', include(debug_toolbar.urls)))
+
 if settings.DEBUG:
     from django.conf.urls.static import static
 
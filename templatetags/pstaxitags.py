@@ -1,6 +1,8 @@
 from django import template
 from django.template import defaultfilters
 
+from utils.cache import get_personal_placeholder
+from utils.images import get_srcset
 from utils.text import plural_form
 
 register = template.Library()
@@ -14,3 +16,15 @@ def pstaxidate(date):
 @register.simple_tag
 def plural(value, form1, form2, form5):
     return plural_form(value, form1, form2, form5)
+
+
+@register.simple_tag
+def srcset(field_file, extension='webp'):
+    return get_srcset(field_file, extension)
+
+
+@register.simple_tag(takes_context=True)
+def personal(context, template_name):
+    if context.get('punch_holes'):
+        return get_personal_placeholder(template_name)
+    return context.template.engine.get_template(template_name).render(context)
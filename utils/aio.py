@@ -0,0 +1,83 @@
+import asyncio
+import inspect
+from functools import update_wrapper
+
+from asgiref.sync import sync_to_async
+from django.db import connections
+from django.http import HttpResponseNotAllowed
+
+
+def close_broken_connections():
+    # Закрытие после каждого запроса заставляло бы открывать соединение заново на каждый вызов
+    for connection in connections.all():
+        if connection.connection is None or not connection.errors_occurred:
+            continue
+        if connection.is_usable():
+            connection.errors_occurred = False
+        else:
+            connection.close()
+
+
+def run_query(func):
+    # Запросы из пула потоков: у каждого потока свое соединение с БД, которое живет вместе с потоком,
+    # так что соединений не больше, чем потоков в пуле; закрываются только сломанные
+    def call():
+        close_broken_connections()
+        return func()
+
+    return sync_to_async(call, thread_sensitive=False)()
+
+
+async def gather_queries(**queries):
+    # Корутины (например, методы async ORM в Django 4.1+) выполняются как есть, функции - в пуле потоков
+    awaitables = [query if inspect.isawaitable(query) else run_query(query) for query in queries.values()]
+    return dict(zip(queries, await asyncio.gather(*awaitables)))
+
+
+def load_user(request):
+    user = request.user
+    user.is_authenticated
+    return user.pk
+
+
+class AsyncViewMixin:
+    async_methods = ('get', 'head')
+
+    @classmethod
+    def as_view(cls, **initkwargs):
+        view = super().as_view(**initkwargs)
+
+        # Django 3.2 определяет асинхронное представление через asyncio.iscoroutinefunction
+        async def async_view(request, *args, **kwargs):
+            return await view(request, *args, **kwargs)
+
+        return update_wrapper(async_view, view)
+
+    def get_async_queries(self):
+        return {}
+
+    async def get_async(self, request, *args, **kwargs):
+        raise NotImplementedError
+
+    async def dispatch(self, request, *args, **kwargs):
+        if request.method.lower() not in self.async_methods:
+            return HttpResponseNotAllowed([method.upper() for method in self.async_methods])
+        return await self.get_async(request, *args, **kwargs)
+
+
+class AsyncCacheViewMixin(AsyncViewMixin):
+    prefetched = None
+
+    def render_page(self):
+        raise NotImplementedError
+
+    async def get_async(self, request, *args, **kwargs):
+        results = await gather_queries(cached=lambda: self.get_cached_response(request),
+                                       user=lambda: load_user(request))
+        key, response = results['cached']
+        if response is not None:
+            return await sync_to_async(self.fill_personal_fragments)(response)
+        self.punch_holes = True
+        self.prefetched = await gather_queries(**self.get_async_queries())
+        response = await sync_to_async(self.render_page)()
+        return self.cache_response(key, response)
@@ -0,0 +1,75 @@
+CHUNK_BITS = 16
+CHUNK_MASK = (1 << CHUNK_BITS) - 1
+
+
+def popcount(value):
+    return bin(value).count('1')
+
+
+class Bitset:
+
+    __slots__ = ('chunks',)
+
+    def __init__(self, values=()):
+        self.chunks = {}
+        for value in values:
+            self.add(value)
+
+    @classmethod
+    def from_chunks(cls, chunks):
+        bitset = cls()
+        bitset.chunks = {key: chunk for key, chunk in chunks.items() if chunk}
+        return bitset
+
+    def add(self, value):
+        key = value >> CHUNK_BITS
+        self.chunks[key] = self.chunks.get(key, 0) | (1 << (value & CHUNK_MASK))
+
+    def discard(self, value):
+        key = value >> CHUNK_BITS
+        chunk = self.chunks.get(key, 0) & ~(1 << (value & CHUNK_MASK))
+        if chunk:
+            self.chunks[key] = chunk
+        else:
+            self.chunks.pop(key, None)
+
+    def copy(self):
+        return Bitset.from_chunks(self.chunks)
+
+    def __contains__(self, value):
+        return bool(self.chunks.get(value >> CHUNK_BITS, 0) >> (value & CHUNK_MASK) & 1)
+
+    def __len__(self):
+        return sum(popcount(chunk) for chunk in self.chunks.values())
+
+    def __bool__(self):
+        return bool(self.chunks)
+
+    def __and__(self, other):
+        if len(self.chunks) > len(other.chunks):
+            self, other = other, self
+        return Bitset.from_chunks({key: chunk & other.chunks.get(key, 0) for key, chunk in self.chunks.items()})
+
+    def __or__(self, other):
+        chunks = dict(self.chunks)
+        for key, chunk in other.chunks.items():
+            chunks[key] = chunks.get(key, 0) | chunk
+        return Bitset.from_chunks(chunks)
+
+    def __sub__(self, other):
+        return Bitset.from_chunks({key: chunk & ~other.chunks.get(key, 0) for key, chunk in self.chunks.items()})
+
+    def __eq__(self, other):
+        return isinstance(other, Bitset) and self.chunks == other.chunks
+
+    def __iter__(self):
+        for key in sorted(self.chunks):
+            chunk = self.chunks[key]
+            base = key << CHUNK_BITS
+            while chunk:
+                low = chunk & -chunk
+                yield base + low.bit_length() - 1
+                chunk ^= low
+
+    def __repr__(self):
+        return f'Bitset({len(self)})'
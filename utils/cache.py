@@ -1,11 +1,147 @@
-from django.views.decorators.cache import cache_page
+import hashlib
+import re
+import time
+
+from django.conf import settings
+from django.core.cache import cache
+from django.http.cookie import SimpleCookie
+from django.template.loader import render_to_string
+from django.utils.safestring import mark_safe
+
+from utils.metrics import record_request_metric
+
+CACHE_STATS = ('hits', 'misses', 'invalidations')
+PERSONAL_PLACEHOLDER_RE = re.compile(r'<!-- personal:([\w/.-]+) -->')
+
+
+def is_shared_cache():
+    return getattr(settings, 'SHARED_CACHE', False)
+
+
+def increment(key, delta=1):
+    try:
+        return cache.incr(key, delta)
+    except ValueError:
+        cache.add(key, 0, None)
+        return cache.incr(key, delta)
+
+
+def record_cache_stat(name, delta=1):
+    increment(f'cache_stats:{name}', delta)
+
+
+def get_cache_stats():
+    values = cache.get_many([f'cache_stats:{name}' for name in CACHE_STATS])
+    return {name: values.get(f'cache_stats:{name}', 0) for name in CACHE_STATS}
+
+
+def get_version_key(model, pk=None):
+    key = f'version:{model._meta.label_lower}'
+    return key if pk is None else f'{key}:{pk}'
+
+
+def get_versions(dependencies):
+    keys = [get_version_key(model, pk) for model, pk in dependencies]
+    versions = cache.get_many(keys)
+    missing = [key for key in keys if key not in versions]
+    if missing:
+        # Начальное значение от времени: после вытеснения ключа версия не совпадет ни с одной прежней
+        initial = int(time.time() * 1000)
+        for key in missing:
+            cache.add(key, initial, None)
+        versions.update(cache.get_many(missing))
+    return [versions.get(key) for key in keys]
+
+
+def bump_versions(dependencies):
+    dependencies = list(dependencies)
+    for model, pk in dependencies:
+        key = get_version_key(model, pk)
+        try:
+            cache.incr(key)
+        except ValueError:
+            pass
+    if dependencies:
+        record_cache_stat('invalidations', len(dependencies))
+
+
+def get_personal_placeholder(template_name):
+    return mark_safe(f'<!-- personal:{template_name} -->')
 
 
 class CacheMixin(object):
-    cache_timeout = 60
+    cache_timeout = None
+    punch_holes = False
 
     def get_cache_timeout(self):
-        return self.cache_timeout
+        if is_shared_cache():
+            return self.cache_timeout
+        # Версии в locmem сбрасываются только в том воркере, где произошло изменение, поэтому
+        # остальные воркеры отдают устаревшую страницу не дольше VIEW_CACHE_LOCAL_TIMEOUT секунд
+        local_timeout = getattr(settings, 'VIEW_CACHE_LOCAL_TIMEOUT', 60)
+        return local_timeout if self.cache_timeout is None else min(self.cache_timeout, local_timeout)
+
+    def get_cache_dependencies(self):
+        return []
+
+    def get_personal_context(self):
+        return {}
+
+    def get_context_data(self, **kwargs):
+        context = super(CacheMixin, self).get_context_data(**kwargs)
+        context.update(self.get_personal_context())
+        context['punch_holes'] = self.punch_holes
+        return context
+
+    def is_cacheable(self, request):
+        return request.method in ('GET', 'HEAD')
+
+    def get_cache_key(self, request):
+        versions = get_versions(self.get_cache_dependencies())
+        fingerprint = hashlib.md5(f'{request.get_full_path()}:{versions}'.encode()).hexdigest()
+        return f'view:{self.__class__.__name__}:{fingerprint}'
+
+    def fill_personal_fragments(self, response):
+        context = self.get_personal_context()
+
+        def render(match):
+            return render_to_string(match.group(1), context, request=self.request)
+
+        content = response.content.decode(response.charset)
+        response.content = PERSONAL_PLACEHOLDER_RE.sub(render, content)
+        return response
+
+    def get_cached_response(self, request):
+        key = self.get_cache_key(request)
+        response = cache.get(key)
+        record_cache_stat('hits' if response is not None else 'misses')
+        record_request_metric('cache_hits' if response is not None else 'cache_misses')
+        return key, response
+
+    def cache_response(self, key, response):
+        if response.status_code != 200:
+            return response
+
+        def store(response):
+            cookies = response.cookies
+            response.cookies = SimpleCookie()
+            cache.set(key, response, self.get_cache_timeout())
+            response.cookies = cookies
+            return self.fill_personal_fragments(response)
+
+        if hasattr(response, 'render') and not response.is_rendered:
+            response.add_post_render_callback(store)
+        else:
+            store(response)
+        return response
 
-    def dispatch(self, *args, **kwargs):
-        return cache_page(self.get_cache_timeout())(super(CacheMixin, self).dispatch)(*args, **kwargs)
+    def dispatch(self, request, *args, **kwargs):
+        if not self.is_cacheable(request):
+            return super(CacheMixin, self).dispatch(request, *args, **kwargs)
+        key, response = self.get_cached_response(request)
+        if response is not None:
+            return self.fill_personal_fragments(response)
+        # Общая часть страницы рендерится с метками вместо персональных фрагментов
+        self.punch_holes = True
+        response = super(CacheMixin, self).dispatch(request, *args, **kwargs)
+        return self.cache_response(key, response)
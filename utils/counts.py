@@ -0,0 +1,54 @@
+import json
+
+from django.conf import settings
+from django.core.cache import cache
+from django.core.paginator import Paginator
+from django.db import connections
+from django.db.models import QuerySet
+from django.utils.functional import cached_property
+
+
+def get_count_cache_key(model):
+    return f'count:{model._meta.label_lower}'
+
+
+def invalidate_count(model):
+    cache.delete(get_count_cache_key(model))
+
+
+def get_cached_count(model):
+    return cache.get_or_set(get_count_cache_key(model), model._default_manager.count,
+                            getattr(settings, 'COUNT_CACHE_TIMEOUT', 60 * 60))
+
+
+def estimate_count(queryset):
+    connection = connections[queryset.db]
+    if connection.vendor != 'postgresql':
+        return None
+    sql, params = queryset.query.sql_with_params()
+    with connection.cursor() as cursor:
+        cursor.execute(f'EXPLAIN (FORMAT JSON) {sql}', params)
+        plan = cursor.fetchone()[0]
+    if isinstance(plan, str):
+        plan = json.loads(plan)
+    return int(plan[0]['Plan']['Plan Rows'])
+
+
+def get_count(object_list):
+    if not isinstance(object_list, QuerySet):
+        return len(object_list)
+    query = object_list.query
+    is_unfiltered = not query.has_filters() and not query.distinct and query.low_mark == 0 and query.high_mark is None
+    if is_unfiltered:
+        return get_cached_count(object_list.model)
+    estimate = estimate_count(object_list)
+    if estimate is not None and estimate > getattr(settings, 'COUNT_ESTIMATE_THRESHOLD', 10000):
+        return estimate
+    return object_list.count()
+
+
+class CountingPaginator(Paginator):
+
+    @cached_property
+    def count(self):
+        return get_count(self.object_list)
@@ -0,0 +1,112 @@
+import itertools
+import threading
+import time
+from contextvars import ContextVar
+
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS, connections
+from django.db.utils import DatabaseError
+
+PIN_COOKIE_NAME = 'pin_primary'
+
+# Состояние текущего запроса: изменяемый объект, чтобы запись из пула потоков была видна middleware
+request_state = ContextVar('request_db_state', default=None)
+
+
+class RequestDbState:
+
+    def __init__(self, pinned=False):
+        self.pinned = pinned
+        self.written = False
+
+
+def get_replica_aliases():
+    return [alias for alias in settings.DATABASES if alias.startswith('replica')]
+
+
+def is_pinned():
+    # Вне запроса (команды, фоновые задачи) и внутри транзакции чтения всегда идут в основную базу
+    state = request_state.get()
+    if state is None or state.pinned or state.written:
+        return True
+    return connections[DEFAULT_DB_ALIAS].in_atomic_block
+
+
+class ReplicaHealth:
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.down_until = {}
+
+    def is_available(self, alias):
+        with self.lock:
+            if self.down_until.get(alias, 0) > time.monotonic():
+                return False
+        try:
+            connections[alias].ensure_connection()
+        except DatabaseError:
+            self.mark_down(alias)
+            return False
+        return True
+
+    def mark_down(self, alias):
+        with self.lock:
+            self.down_until[alias] = time.monotonic() + getattr(settings, 'REPLICA_RETRY_SECONDS', 30)
+
+
+class ReplicaRouter:
+
+    def __init__(self):
+        self.replicas = get_replica_aliases()
+        self.apps = set(getattr(settings, 'REPLICA_APPS', ('motorpool',)))
+        self.counter = itertools.count()
+        self.health = ReplicaHealth()
+
+    def get_replica(self):
+        # Round-robin, недоступные реплики пропускаются до истечения REPLICA_RETRY_SECONDS
+        start = next(self.counter)
+        for offset in range(len(self.replicas)):
+            alias = self.replicas[(start + offset) % len(self.replicas)]
+            if self.health.is_available(alias):
+                return alias
+        return DEFAULT_DB_ALIAS
+
+    def db_for_read(self, model, **hints):
+        if not self.replicas or model._meta.app_label not in self.apps or is_pinned():
+            return DEFAULT_DB_ALIAS
+        return self.get_replica()
+
+    def db_for_write(self, model, **hints):
+        # Закрепляет чтения только запись в данные, которые читаются с реплик; сессии и last_login не в счет
+        state = request_state.get()
+        if state is not None and model._meta.app_label in self.apps:
+            state.written = True
+        return DEFAULT_DB_ALIAS
+
+    def allow_relation(self, obj1, obj2, **hints):
+        databases = {DEFAULT_DB_ALIAS, *self.replicas}
+        if obj1._state.db in databases and obj2._state.db in databases:
+            return True
+        return None
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        return db == DEFAULT_DB_ALIAS
+
+
+class PrimaryStickinessMiddleware:
+    # После записи чтения пользователя идут в основную базу, пока жива кука PIN_COOKIE_NAME
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        state = RequestDbState(pinned=PIN_COOKIE_NAME in request.COOKIES or request.method not in ('GET', 'HEAD'))
+        token = request_state.set(state)
+        try:
+            response = self.get_response(request)
+        finally:
+            request_state.reset(token)
+        if state.written:
+            response.set_cookie(PIN_COOKIE_NAME, '1', max_age=getattr(settings, 'REPLICA_PIN_SECONDS', 15),
+                                httponly=True, samesite='Lax')
+        return response
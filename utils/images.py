@@ -0,0 +1,148 @@
+import hashlib
+import json
+import logging
+import os
+from concurrent.futures import ThreadPoolExecutor
+from io import BytesIO
+
+from django.conf import settings
+from django.core.cache import cache
+from django.core.files.base import ContentFile
+from django.db import transaction
+from PIL import Image, ImageOps
+
+logger = logging.getLogger(__name__)
+
+DERIVATIVE_FORMATS = {
+    'webp': 'WEBP',
+    'jpeg': 'JPEG',
+}
+
+_executor = None
+
+
+def get_derivative_widths():
+    return getattr(settings, 'IMAGE_DERIVATIVE_WIDTHS', (160, 320, 640))
+
+
+def get_derivative_name(name, width, extension):
+    root, _ = os.path.splitext(name)
+    return f'{root}.{width}w.{extension}'
+
+
+def get_derivative_names(name):
+    return [get_derivative_name(name, width, extension)
+            for width in get_derivative_widths() for extension in DERIVATIVE_FORMATS]
+
+
+def get_manifest_name(name):
+    root, _ = os.path.splitext(name)
+    return f'{root}.derivatives.json'
+
+
+def get_manifest_cache_key(name):
+    return f'image_derivatives:{hashlib.md5(name.encode()).hexdigest()}'
+
+
+def get_manifest(storage, name):
+    # Какие копии созданы, записывается в файл рядом с оригиналом при генерации; при рендеринге
+    # он читается один раз и дальше берется из кэша, без storage.exists() на каждую ширину
+    key = get_manifest_cache_key(name)
+    manifest = cache.get(key)
+    if manifest is None:
+        try:
+            with storage.open(get_manifest_name(name)) as file:
+                manifest = json.load(file)
+        except (OSError, ValueError):
+            manifest = {}
+        # Отсутствие манифеста кэшируется ненадолго: копии могут создаваться в соседнем воркере
+        cache.set(key, manifest, getattr(settings, 'IMAGE_MANIFEST_CACHE_TIMEOUT', 60 * 60) if manifest else 60)
+    return manifest or None
+
+
+def save_manifest(storage, name, manifest):
+    manifest_name = get_manifest_name(name)
+    if storage.exists(manifest_name):
+        storage.delete(manifest_name)
+    storage.save(manifest_name, ContentFile(json.dumps(manifest).encode()))
+    cache.set(get_manifest_cache_key(name), manifest, getattr(settings, 'IMAGE_MANIFEST_CACHE_TIMEOUT', 60 * 60))
+
+
+def generate_derivatives(storage, name, force=False):
+    if not force and get_manifest(storage, name) is not None:
+        return 0
+    # Ошибки открытия не глушатся: их учитывают вызывающие (run_derivatives, backfill_image_derivatives)
+    with storage.open(name) as file:
+        image = Image.open(file)
+        image.load()
+    image = ImageOps.exif_transpose(image)
+    created = 0
+    # Изображения уже самой маленькой ширины тоже получают манифест, иначе их обрабатывали бы при каждом сохранении
+    manifest = {'width': image.width, 'widths': []}
+    for width in get_derivative_widths():
+        if width >= image.width:
+            continue
+        manifest['widths'].append(width)
+        resized = image.resize((width, round(image.height * width / image.width)), Image.LANCZOS)
+        for extension, image_format in DERIVATIVE_FORMATS.items():
+            derivative_name = get_derivative_name(name, width, extension)
+            if storage.exists(derivative_name):
+                if not force:
+                    continue
+                storage.delete(derivative_name)
+            output = resized if extension == 'webp' or resized.mode == 'RGB' else resized.convert('RGB')
+            buffer = BytesIO()
+            output.save(buffer, format=image_format, quality=80)
+            storage.save(derivative_name, ContentFile(buffer.getvalue()))
+            created += 1
+    save_manifest(storage, name, manifest)
+    return created
+
+
+def delete_derivatives(storage, name):
+    for derivative_name in get_derivative_names(name) + [get_manifest_name(name)]:
+        if storage.exists(derivative_name):
+            storage.delete(derivative_name)
+    cache.delete(get_manifest_cache_key(name))
+
+
+def has_derivatives(field_file):
+    return not get_derivative_widths() or get_manifest(field_file.storage, field_file.name) is not None
+
+
+def get_executor():
+    global _executor
+    if _executor is None:
+        _executor = ThreadPoolExecutor(max_workers=getattr(settings, 'IMAGE_DERIVATIVE_WORKERS', 2),
+                                       thread_name_prefix='image-derivatives')
+    return _executor
+
+
+def run_derivatives(storage, name):
+    try:
+        generate_derivatives(storage, name)
+    except Exception:
+        logger.exception('Ошибка при обработке изображения %s', name)
+
+
+def schedule_derivatives(field_file):
+    if not field_file or has_derivatives(field_file):
+        return
+    storage, name = field_file.storage, field_file.name
+    if getattr(settings, 'IMAGE_DERIVATIVES_ASYNC', True):
+        transaction.on_commit(lambda: get_executor().submit(run_derivatives, storage, name))
+    else:
+        transaction.on_commit(lambda: run_derivatives(storage, name))
+
+
+def get_srcset(field_file, extension):
+    if not field_file:
+        return ''
+    manifest = get_manifest(field_file.storage, field_file.name)
+    if not manifest or not manifest['widths']:
+        return ''
+    candidates = [f'{field_file.storage.url(get_derivative_name(field_file.name, width, extension))} {width}w'
+                  for width in manifest['widths']]
+    # Оригинал шире всех копий и нужен браузеру для широких экранов и плотных дисплеев
+    candidates.append(f'{field_file.url} {manifest["width"]}w')
+    return ', '.join(candidates)
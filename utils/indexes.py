@@ -0,0 +1,64 @@
+import threading
+import time
+
+from django.conf import settings
+from django.core.cache import cache
+
+from utils.cache import is_shared_cache
+
+
+class InProcessIndex:
+    version_key = None
+
+    def __init__(self):
+        self.lock = threading.RLock()
+        self.loaded = False
+        self.loaded_at = None
+        self.version = None
+        self.reset()
+
+    def reset(self):
+        raise NotImplementedError
+
+    def fetch(self):
+        raise NotImplementedError
+
+    def fill(self, data):
+        raise NotImplementedError
+
+    def load(self):
+        version = cache.get(self.version_key)
+        data = self.fetch()
+        with self.lock:
+            self.reset()
+            self.fill(data)
+            self.version = version
+            self.loaded = True
+            self.loaded_at = time.monotonic()
+
+    def get_max_age(self):
+        # Счетчик версии в locmem виден только своему процессу, поэтому без общего кэша индекс
+        # других воркеров перечитывается не реже раза в IN_PROCESS_INDEX_MAX_AGE секунд
+        if is_shared_cache():
+            return None
+        return getattr(settings, 'IN_PROCESS_INDEX_MAX_AGE', 60)
+
+    def is_expired(self):
+        max_age = self.get_max_age()
+        return max_age is not None and time.monotonic() - self.loaded_at > max_age
+
+    def ensure_loaded(self):
+        if not self.loaded or self.is_expired() or cache.get(self.version_key) != self.version:
+            self.load()
+
+    def touch(self):
+        cache.add(self.version_key, 0, None)
+        try:
+            version = cache.incr(self.version_key)
+        except ValueError:
+            version = None
+        with self.lock:
+            if self.loaded and self.version is not None and version == self.version + 1:
+                self.version = version
+            else:
+                self.loaded = False
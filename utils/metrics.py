@@ -0,0 +1,305 @@
+import json
+import logging
+import os
+import threading
+import time
+import uuid
+from contextvars import ContextVar
+
+from django.conf import settings
+from django.core.exceptions import MiddlewareNotUsed
+from django.db import connections
+from django.db.backends.signals import connection_created
+from django.http import Http404, HttpResponse
+from django.template.backends.django import DjangoTemplates, Template
+
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+COUNTERS = (
+    ('requests_total', 'Количество запросов'),
+    ('sql_queries_total', 'Количество SQL-запросов'),
+    ('sql_seconds_total', 'Время выполнения SQL, с'),
+    ('template_seconds_total', 'Время рендеринга шаблонов, с'),
+    ('cache_hits_total', 'Попадания в кэш представлений'),
+    ('cache_misses_total', 'Промахи кэша представлений'),
+)
+PREFIX = 'pstaxi_'
+
+logger = logging.getLogger(__name__)
+
+request_metrics = ContextVar('request_metrics', default=None)
+
+
+def get_buckets():
+    return tuple(getattr(settings, 'METRICS_BUCKETS', DEFAULT_BUCKETS))
+
+
+class RequestMetrics:
+
+    def __init__(self):
+        self.sql_queries = 0
+        self.sql_seconds = 0.0
+        self.template_seconds = 0.0
+        self.cache_hits = 0
+        self.cache_misses = 0
+
+
+def record_request_metric(name, value=1):
+    metrics = request_metrics.get()
+    if metrics is not None:
+        setattr(metrics, name, getattr(metrics, name) + value)
+
+
+def sql_wrapper(execute, sql, params, many, context):
+    metrics = request_metrics.get()
+    if metrics is None:
+        return execute(sql, params, many, context)
+    started = time.perf_counter()
+    try:
+        return execute(sql, params, many, context)
+    finally:
+        metrics.sql_queries += 1
+        metrics.sql_seconds += time.perf_counter() - started
+
+
+def install_sql_wrapper(connection, **kwargs):
+    if sql_wrapper not in connection.execute_wrappers:
+        connection.execute_wrappers.append(sql_wrapper)
+
+
+def get_file_pid(name):
+    try:
+        return int(name.split('_')[1])
+    except (IndexError, ValueError):
+        return None
+
+
+def is_process_alive(pid):
+    if pid is None:
+        return False
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    return True
+
+
+def remove_file(path):
+    try:
+        os.remove(path)
+    except OSError:
+        pass
+
+
+class MetricsStore:
+    # Каждый процесс (воркер gunicorn) копит счетчики у себя и периодически сбрасывает их в свой файл
+    # в METRICS_DIR; эндпоинт суммирует файлы всех воркеров
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.flush_lock = threading.Lock()
+        self.pid = None
+        self.reset()
+
+    def reset(self):
+        self.pid = os.getpid()
+        self.token = uuid.uuid4().hex[:8]
+        self.counters = {}
+        self.histograms = {}
+        self.flushed = 0
+
+    @property
+    def directory(self):
+        return getattr(settings, 'METRICS_DIR', None)
+
+    def get_path(self):
+        return os.path.join(self.directory, f'metrics_{self.pid}_{self.token}.json')
+
+    def observe(self, view, method, status, duration, metrics):
+        buckets = get_buckets()
+        with self.lock:
+            if self.pid != os.getpid():
+                # Унаследованное от мастер-процесса состояние после fork не считается
+                self.reset()
+            for name, labels, value in (
+                ('requests_total', (view, method, status), 1),
+                ('sql_queries_total', (view,), metrics.sql_queries),
+                ('sql_seconds_total', (view,), metrics.sql_seconds),
+                ('template_seconds_total', (view,), metrics.template_seconds),
+                ('cache_hits_total', (view,), metrics.cache_hits),
+                ('cache_misses_total', (view,), metrics.cache_misses),
+            ):
+                key = (name, labels)
+                self.counters[key] = self.counters.get(key, 0) + value
+            histogram = self.histograms.get(view)
+            if histogram is None:
+                histogram = self.histograms[view] = [0] * (len(buckets) + 2)
+            for index, bound in enumerate(buckets):
+                if duration <= bound:
+                    histogram[index] += 1
+                    break
+            histogram[-2] += duration
+            histogram[-1] += 1
+            flush = self.directory and time.monotonic() - self.flushed >= getattr(settings, 'METRICS_FLUSH_SECONDS', 1)
+        if flush:
+            self.flush()
+
+    def dump(self):
+        with self.lock:
+            return {
+                'counters': [[name, list(labels), value] for (name, labels), value in self.counters.items()],
+                'histograms': [[view, list(values)] for view, values in self.histograms.items()],
+            }
+
+    def flush(self):
+        # Временный файл общий для процесса, поэтому сбрасывает только один поток за раз
+        if not self.flush_lock.acquire(blocking=False):
+            return
+        try:
+            self.flushed = time.monotonic()
+            path = self.get_path()
+            temp_path = f'{path}.tmp'
+            os.makedirs(self.directory, exist_ok=True)
+            with open(temp_path, 'w') as file:
+                json.dump(self.dump(), file)
+            os.replace(temp_path, path)
+        finally:
+            self.flush_lock.release()
+
+    def load_dumps(self):
+        if not self.directory:
+            return [self.dump()]
+        self.flush()
+        dumps = []
+        for name in os.listdir(self.directory):
+            if not name.startswith('metrics_') or not name.endswith('.json'):
+                continue
+            path = os.path.join(self.directory, name)
+            if not is_process_alive(get_file_pid(name)):
+                # Файлы перезапущенных воркеров удаляются, иначе их счетчики суммировались бы вечно
+                remove_file(path)
+                continue
+            try:
+                with open(path) as file:
+                    dumps.append(json.load(file))
+            except (OSError, ValueError):
+                continue
+        return dumps
+
+    def collect(self):
+        counters, histograms = {}, {}
+        for dump in self.load_dumps():
+            for name, labels, value in dump['counters']:
+                key = (name, tuple(labels))
+                counters[key] = counters.get(key, 0) + value
+            for view, values in dump['histograms']:
+                total = histograms.setdefault(view, [0] * len(values))
+                for index, value in enumerate(values):
+                    total[index] += value
+        return counters, histograms
+
+
+metrics_store = MetricsStore()
+
+
+def escape_label(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def format_labels(**labels):
+    values = ','.join(f'{name}="{escape_label(value)}"' for name, value in labels.items())
+    return f'{{{values}}}'
+
+
+def format_value(value):
+    return str(value) if isinstance(value, int) else repr(round(value, 6))
+
+
+def render_metrics(counters, histograms):
+    lines = []
+    for metric, help_text in COUNTERS:
+        lines.append(f'# HELP {PREFIX}{metric} {help_text}')
+        lines.append(f'# TYPE {PREFIX}{metric} counter')
+        for (name, labels), value in sorted(counters.items()):
+            if name != metric:
+                continue
+            if name == 'requests_total':
+                label_text = format_labels(view=labels[0], method=labels[1], status=labels[2])
+            else:
+                label_text = format_labels(view=labels[0])
+            lines.append(f'{PREFIX}{name}{label_text} {format_value(value)}')
+    metric = f'{PREFIX}request_duration_seconds'
+    lines.append(f'# HELP {metric} Время обработки запроса, с')
+    lines.append(f'# TYPE {metric} histogram')
+    buckets = get_buckets()
+    for view, values in sorted(histograms.items()):
+        cumulative = 0
+        for bound, count in zip(buckets, values):
+            cumulative += count
+            lines.append(f'{metric}_bucket{format_labels(view=view, le=bound)} {cumulative}')
+        lines.append(f'{metric}_bucket{format_labels(view=view, le="+Inf")} {values[-1]}')
+        lines.append(f'{metric}_sum{format_labels(view=view)} {format_value(values[-2])}')
+        lines.append(f'{metric}_count{format_labels(view=view)} {values[-1]}')
+    return '\n'.join(lines) + '\n'
+
+
+def metrics_view(request):
+    if request.META.get('REMOTE_ADDR') not in getattr(settings, 'METRICS_ALLOWED_IPS', settings.INTERNAL_IPS):
+        raise Http404
+    return HttpResponse(render_metrics(*metrics_store.collect()), content_type='text/plain; version=0.0.4')
+
+
+class InstrumentedTemplate(Template):
+
+    def render(self, context=None, request=None):
+        metrics = request_metrics.get()
+        if metrics is None:
+            return super(InstrumentedTemplate, self).render(context, request)
+        started = time.perf_counter()
+        try:
+            return super(InstrumentedTemplate, self).render(context, request)
+        finally:
+            metrics.template_seconds += time.perf_counter() - started
+
+
+class InstrumentedTemplates(DjangoTemplates):
+    # Бэкенд шаблонов Django, который учитывает время рендеринга в метриках текущего запроса
+
+    def from_string(self, template_code):
+        return InstrumentedTemplate(self.engine.from_string(template_code), self)
+
+    def get_template(self, template_name):
+        template = super(InstrumentedTemplates, self).get_template(template_name)
+        return InstrumentedTemplate(template.template, self)
+
+
+class RequestMetricsMiddleware:
+
+    def __init__(self, get_response):
+        if not getattr(settings, 'METRICS_ENABLED', True):
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+        connection_created.connect(install_sql_wrapper)
+        for connection in connections.all():
+            install_sql_wrapper(connection)
+
+    def __call__(self, request):
+        metrics = RequestMetrics()
+        token = request_metrics.set(metrics)
+        started = time.perf_counter()
+        status = 500
+        try:
+            response = self.get_response(request)
+            status = response.status_code
+            return response
+        finally:
+            duration = time.perf_counter() - started
+            request_metrics.reset(token)
+            match = getattr(request, 'resolver_match', None)
+            view = match.view_name if match else 'unresolved'
+            try:
+                metrics_store.observe(view, request.method, status, duration, metrics)
+            except Exception:
+                # Ошибка учета метрик не должна превращать готовый ответ в 500
+                logger.exception('Не удалось записать метрики запроса')
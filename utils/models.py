@@ -1,12 +1,100 @@
+import re
+
+from django.core.management.color import no_style
+from django.db import IntegrityError, connection, transaction
+from django.db.models import Q
 from django.utils.text import slugify
 from unidecode import unidecode
 
+# Каждая основа дает два условия OR; SQLite ограничивает глубину дерева выражения 1000 узлами
+SLUG_QUERY_BATCH_SIZE = 200
+
+
+def get_slug_base(value):
+    return slugify(unidecode(value if value else 'empty'), allow_unicode=True).lower()
+
+
+def get_slug_query(bases):
+    query = Q()
+    for base in bases:
+        query |= Q(slug=base) | Q(slug__startswith=f'{base}-')
+    return query
+
+
+def get_taken_slugs(model, bases, exclude_pk=None, source_field='title'):
+    # Слаг и основа исходного значения, из которого он получен
+    bases = sorted(bases)
+    for index in range(0, len(bases), SLUG_QUERY_BATCH_SIZE):
+        queryset = model._default_manager.filter(get_slug_query(bases[index:index + SLUG_QUERY_BATCH_SIZE]))
+        if exclude_pk is not None:
+            queryset = queryset.exclude(pk=exclude_pk)
+        for slug, value in queryset.values_list('slug', source_field):
+            yield slug, get_slug_base(value)
+
+
+def get_slug_suffix(slug, base):
+    match = re.fullmatch(rf'{re.escape(base)}-(\d+)', slug)
+    return int(match.group(1)) if match else 0
+
+
+class SlugAllocator:
+
+    def __init__(self, taken, sources=None):
+        self.taken = set(taken)
+        # Слаг -> основа, для которой он выдан; без записи слаг считается выданным для своей основы с суффиксом
+        self.sources = dict(sources or {})
+        self.last_suffixes = {}
+
+    def get_last_suffix(self, base):
+        # Число в конце чужого слага не счетчик: toyota-2019 у бренда «Toyota 2019» не делает новый «Toyota» toyota-2020
+        return max((get_slug_suffix(slug, base) for slug in self.taken if self.sources.get(slug, base) == base),
+                   default=0)
+
+    def allocate(self, base):
+        if base not in self.taken:
+            self.taken.add(base)
+            self.sources[base] = base
+            return base
+        if base not in self.last_suffixes:
+            self.last_suffixes[base] = self.get_last_suffix(base)
+        suffix = self.last_suffixes[base] + 1
+        while f'{base}-{suffix}' in self.taken:
+            suffix += 1
+        self.last_suffixes[base] = suffix
+        slug = f'{base}-{suffix}'
+        self.taken.add(slug)
+        self.sources[slug] = base
+        return slug
+
+
+def generate_unique_slugs(model, values, exclude_pk=None, source_field='title'):
+    bases = [get_slug_base(value) for value in values]
+    if not bases:
+        return []
+    sources = dict(get_taken_slugs(model, set(bases), exclude_pk, source_field))
+    allocator = SlugAllocator(sources, sources)
+    return [allocator.allocate(base) for base in bases]
+
+
+def generate_unique_slug(model, value, exclude_pk=None, source_field='title'):
+    return generate_unique_slugs(model, [value], exclude_pk=exclude_pk, source_field=source_field)[0]
+
+
+def save_with_unique_slug(instance, value, save, attempts=3, source_field='title'):
+    for attempt in range(attempts):
+        instance.slug = generate_unique_slug(type(instance), value, exclude_pk=instance.pk, source_field=source_field)
+        try:
+            with transaction.atomic():
+                return save()
+        except IntegrityError:
+            if attempt == attempts - 1:
+                raise
 
-def generate_unique_slug(model, value):
-    unique_slug = slugify(unidecode(value if value else 'empty'), allow_unicode=True).lower()
-    count = 1
-    while model.objects.filter(slug=unique_slug).exists():
-        unique_slug = f'{unique_slug}-{count}'
-        count += 1
 
-    return unique_slug
+def reset_sequences(models):
+    # После вставки с явными первичными ключами последовательности PostgreSQL нужно сдвинуть вручную
+    statements = connection.ops.sequence_reset_sql(no_style(), list(models))
+    if statements:
+        with connection.cursor() as cursor:
+            for sql in statements:
+                cursor.execute(sql)
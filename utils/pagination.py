@@ -0,0 +1,127 @@
+from django.conf import settings
+from django.core import signing
+from django.db.models import Q
+from django.http import Http404
+
+CURSOR_SALT = 'utils.pagination.cursor'
+
+
+def encode_cursor(values):
+    return signing.dumps(list(values), salt=CURSOR_SALT, compress=True)
+
+
+def decode_cursor(token):
+    try:
+        return signing.loads(token, salt=CURSOR_SALT)
+    except signing.BadSignature:
+        raise Http404('Неверный курсор страницы')
+
+
+def get_keyset_fields(ordering):
+    fields = [(field.lstrip('-'), field.startswith('-')) for field in ordering]
+    if not any(name in ('pk', 'id') for name, _ in fields):
+        fields.append(('pk', fields[-1][1] if fields else False))
+    return fields
+
+
+def get_keyset_condition(fields, values, reverse=False):
+    condition = Q()
+    for index, (name, descending) in enumerate(fields):
+        lookup = 'lt' if descending != reverse else 'gt'
+        step = Q(**{f'{name}__{lookup}': values[index]})
+        for (previous_name, _), value in zip(fields[:index], values):
+            step &= Q(**{previous_name: value})
+        condition |= step
+    return condition
+
+
+class CursorPage:
+    is_cursor = True
+
+    def __init__(self, object_list, next_cursor=None, previous_cursor=None):
+        self.object_list = object_list
+        self.next_cursor = next_cursor
+        self.previous_cursor = previous_cursor
+
+    def __iter__(self):
+        return iter(self.object_list)
+
+    def __len__(self):
+        return len(self.object_list)
+
+    def has_next(self):
+        return self.next_cursor is not None
+
+    def has_previous(self):
+        return self.previous_cursor is not None
+
+    def has_other_pages(self):
+        return self.has_next() or self.has_previous()
+
+
+class CursorPaginator:
+    is_cursor = True
+
+    def __init__(self, object_list, per_page, ordering):
+        self.object_list = object_list
+        self.per_page = int(per_page)
+        self.fields = get_keyset_fields(ordering)
+
+    def get_key(self, obj):
+        if isinstance(obj, dict):
+            return [obj[name] for name, _ in self.fields]
+        return [getattr(obj, name) for name, _ in self.fields]
+
+    def fetch(self, values, reverse, limit):
+        if hasattr(self.object_list, 'cursor_slice'):
+            return self.object_list.cursor_slice(values, reverse, limit)
+        queryset = self.object_list
+        if values is not None:
+            queryset = queryset.filter(get_keyset_condition(self.fields, values, reverse))
+        ordering = [f"{'-' if descending != reverse else ''}{name}" for name, descending in self.fields]
+        return list(queryset.order_by(*ordering)[:limit])
+
+    def get_page(self, after=None, before=None):
+        reverse = bool(before) and not after
+        token = before if reverse else after
+        values = decode_cursor(token) if token else None
+        if values is not None and len(values) != len(self.fields):
+            raise Http404('Неверный курсор страницы')
+        object_list = self.fetch(values, reverse, self.per_page + 1)
+        has_more = len(object_list) > self.per_page
+        object_list = object_list[:self.per_page]
+        if reverse:
+            object_list.reverse()
+        has_next = has_more if not reverse else True
+        has_previous = values is not None if not reverse else has_more
+        next_cursor = encode_cursor(self.get_key(object_list[-1])) if object_list and has_next else None
+        previous_cursor = encode_cursor(self.get_key(object_list[0])) if object_list and has_previous else None
+        return CursorPage(object_list, next_cursor, previous_cursor)
+
+
+class CursorPaginationMixin:
+    cursor_pagination = None
+    cursor_after_kwarg = 'after'
+    cursor_before_kwarg = 'before'
+
+    def is_cursor_pagination(self):
+        if self.cursor_after_kwarg in self.request.GET or self.cursor_before_kwarg in self.request.GET:
+            return True
+        if self.cursor_pagination is None:
+            return getattr(settings, 'CURSOR_PAGINATION', False)
+        return self.cursor_pagination
+
+    def get_cursor_ordering(self, queryset):
+        query = getattr(queryset, 'query', None)
+        ordering = query.order_by if query is not None else self.get_ordering()
+        if isinstance(ordering, str):
+            ordering = (ordering,)
+        return list(ordering or ())
+
+    def paginate_queryset(self, queryset, page_size):
+        if not self.is_cursor_pagination():
+            return super().paginate_queryset(queryset, page_size)
+        paginator = CursorPaginator(queryset, page_size, self.get_cursor_ordering(queryset))
+        page = paginator.get_page(after=self.request.GET.get(self.cursor_after_kwarg),
+                                  before=self.request.GET.get(self.cursor_before_kwarg))
+        return paginator, page, page.object_list, page.has_other_pages()
@@ -0,0 +1,218 @@
+import asyncio
+import json
+import logging
+import os
+import sys
+import tempfile
+import threading
+import time
+import uuid
+from collections import Counter
+from contextvars import ContextVar
+
+from django.conf import settings
+from django.core import signing
+from django.core.cache import cache
+from django.db import connections
+from django.db.backends.signals import connection_created
+
+from utils.cache import is_shared_cache
+
+PROFILE_SALT = 'utils.profiling'
+PROFILE_TOKEN_VALUE = 'profile'
+PROFILE_QUERY_PARAM = '_profile'
+ASYNC_VIEW_NOTE = ('Асинхронное представление выполняется в потоке event loop, а стек снимался с потока middleware: '
+                   'время view видно как ожидание, SQL записан полностью')
+
+logger = logging.getLogger(__name__)
+
+request_profile = ContextVar('request_profile', default=None)
+
+
+def get_profile_dir():
+    return getattr(settings, 'PROFILE_DIR', None) or os.path.join(tempfile.gettempdir(), 'pstaxi-profiles')
+
+
+def make_profile_token():
+    return signing.TimestampSigner(salt=PROFILE_SALT).sign(PROFILE_TOKEN_VALUE)
+
+
+def check_profile_token(token):
+    try:
+        value = signing.TimestampSigner(salt=PROFILE_SALT).unsign(
+            token, max_age=getattr(settings, 'PROFILE_TOKEN_MAX_AGE', 600))
+    except signing.BadSignature:
+        return False
+    return value == PROFILE_TOKEN_VALUE
+
+
+def is_profile_requested(request):
+    token = request.headers.get('X-Profile')
+    if token:
+        return check_profile_token(token)
+    if PROFILE_QUERY_PARAM in request.GET:
+        user = getattr(request, 'user', None)
+        return bool(user and user.is_active and user.is_staff)
+    return False
+
+
+def get_rate_limit():
+    limit = getattr(settings, 'PROFILE_RATE_LIMIT', 10)
+    if is_shared_cache():
+        return limit
+    # В locmem каждый воркер считает сам, поэтому общий лимит делится на PROFILE_WORKERS
+    return max(1, limit // getattr(settings, 'PROFILE_WORKERS', 1))
+
+
+def acquire_rate_limit():
+    # Общий для всех воркеров лимит через кэш: не больше PROFILE_RATE_LIMIT профилей за PROFILE_RATE_PERIOD секунд
+    period = getattr(settings, 'PROFILE_RATE_PERIOD', 60)
+    key = f'profile_rate:{int(time.time() // period)}'
+    cache.add(key, 0, period * 2)
+    try:
+        count = cache.incr(key)
+    except ValueError:
+        return False
+    return count <= get_rate_limit()
+
+
+def format_frame(frame):
+    return f'{frame.f_globals.get("__name__", "?")}.{frame.f_code.co_name}'
+
+
+class StackSampler(threading.Thread):
+    # Раз в interval снимает стек потока, обрабатывающего запрос; профилируемый код не замедляется
+    # ничем, кроме GIL на время снятия стека. Под ASGI асинхронные представления работают в потоке
+    # event loop вместе с чужими запросами, их стек не снимается (см. ASYNC_VIEW_NOTE)
+
+    def __init__(self, thread_id, interval):
+        super(StackSampler, self).__init__(name='stack-sampler', daemon=True)
+        self.thread_id = thread_id
+        self.interval = interval
+        self.stacks = Counter()
+        self.stopped = threading.Event()
+
+    def run(self):
+        while not self.stopped.wait(self.interval):
+            frame = sys._current_frames().get(self.thread_id)
+            stack = []
+            while frame is not None:
+                stack.append(format_frame(frame))
+                frame = frame.f_back
+            if stack:
+                self.stacks[';'.join(reversed(stack))] += 1
+
+    def stop(self):
+        self.stopped.set()
+        self.join()
+
+
+class RequestProfile:
+
+    def __init__(self, request):
+        self.id = uuid.uuid4().hex[:12]
+        self.request = request
+        self.started = time.perf_counter()
+        self.queries = []
+        self.sampler = StackSampler(threading.get_ident(), getattr(settings, 'PROFILE_INTERVAL', 0.005))
+
+    def record_query(self, alias, sql, started, duration):
+        self.queries.append({
+            'alias': alias,
+            'start_ms': round((started - self.started) * 1000, 3),
+            'duration_ms': round(duration * 1000, 3),
+            'sql': sql,
+        })
+
+    def save(self, response):
+        duration = time.perf_counter() - self.started
+        directory = get_profile_dir()
+        os.makedirs(directory, exist_ok=True)
+        match = getattr(self.request, 'resolver_match', None)
+        view = match.view_name if match else 'unresolved'
+        notes = [ASYNC_VIEW_NOTE] if match and asyncio.iscoroutinefunction(match.func) else []
+        name = f'{time.strftime("%Y%m%d-%H%M%S")}_{view.replace(":", "-")}_{self.id}'
+        with open(os.path.join(directory, f'{name}.folded'), 'w') as file:
+            for stack, count in self.sampler.stacks.most_common():
+                file.write(f'{stack} {count}\n')
+        with open(os.path.join(directory, f'{name}.json'), 'w') as file:
+            json.dump({
+                'id': self.id,
+                'path': self.request.get_full_path(),
+                'method': self.request.method,
+                'view': view,
+                'status': response.status_code if response is not None else None,
+                'duration_ms': round(duration * 1000, 3),
+                'samples': sum(self.sampler.stacks.values()),
+                'interval_ms': self.sampler.interval * 1000,
+                'queries': self.queries,
+                'notes': notes,
+            }, file, ensure_ascii=False, indent=2)
+        return name
+
+
+def profile_sql_wrapper(execute, sql, params, many, context):
+    profile = request_profile.get()
+    if profile is None:
+        return execute(sql, params, many, context)
+    started = time.perf_counter()
+    try:
+        return execute(sql, params, many, context)
+    finally:
+        profile.record_query(context['connection'].alias, sql, started, time.perf_counter() - started)
+
+
+def install_profile_wrapper(connection, **kwargs):
+    if profile_sql_wrapper not in connection.execute_wrappers:
+        connection.execute_wrappers.append(profile_sql_wrapper)
+
+
+class RequestProfilerMiddleware:
+    # Профилирует отдельный запрос по подписанному заголовку X-Profile (manage.py profile_token)
+    # или параметру ?_profile для сотрудников; результат пишется в PROFILE_DIR
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.lock = threading.Lock()
+        connection_created.connect(install_profile_wrapper)
+        for connection in connections.all():
+            install_profile_wrapper(connection)
+
+    def __call__(self, request):
+        if not is_profile_requested(request):
+            return self.get_response(request)
+        # В каждом процессе одновременно профилируется не больше одного запроса
+        if not self.lock.acquire(blocking=False):
+            return self.get_response(request)
+        try:
+            if acquire_rate_limit():
+                return self.profile(request)
+        finally:
+            self.lock.release()
+        # Отказ по лимиту обслуживается уже без блокировки, чтобы не задерживать следующие профили
+        response = self.get_response(request)
+        response['X-Profile'] = 'rate-limited'
+        return response
+
+    def profile(self, request):
+        profile = RequestProfile(request)
+        token = request_profile.set(profile)
+        profile.sampler.start()
+        response = None
+        try:
+            response = self.get_response(request)
+        finally:
+            profile.sampler.stop()
+            request_profile.reset(token)
+            name = self.save(profile, response)
+        if name:
+            response['X-Profile'] = name
+        return response
+
+    def save(self, profile, response):
+        # Ошибка записи профиля не должна подменять ответ или исключение самого представления
+        try:
+            return profile.save(response)
+        except Exception:
+            logger.exception('Не удалось сохранить профиль запроса %s', profile.request.path)
+            return None
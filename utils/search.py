@@ -0,0 +1,48 @@
+import operator
+from functools import reduce
+
+from django.db.models import Q
+from django.db.models.constants import LOOKUP_SEP
+from django.utils.text import smart_split, unescape_string_literal
+
+from utils.counts import CountingPaginator
+
+# Короче трех символов триграммный индекс не помогает, остается только поиск по префиксу
+MIN_TRIGRAM_LENGTH = 3
+
+
+def split_search_field(model, field_name):
+    prefix = field_name.startswith('^')
+    parts = field_name.lstrip('^').split(LOOKUP_SEP)
+    relation = []
+    for part in parts[:-1]:
+        field = model._meta.get_field(part)
+        model = field.related_model
+        relation.append(part)
+    return LOOKUP_SEP.join(relation), model, parts[-1], prefix
+
+
+def get_search_condition(model, field_name, term):
+    relation, related_model, name, prefix = split_search_field(model, field_name)
+    lookup = 'istartswith' if prefix or len(term) < MIN_TRIGRAM_LENGTH else 'icontains'
+    condition = Q(**{f'{name}__{lookup}': term})
+    if not relation:
+        return condition
+    # Связанная таблица фильтруется подзапросом, без LIKE по результату соединения
+    return Q(**{f'{relation}__in': related_model._default_manager.filter(condition).values('pk')})
+
+
+class IndexedSearchMixin:
+    show_full_result_count = False
+    paginator = CountingPaginator
+
+    def get_search_results(self, request, queryset, search_term):
+        search_fields = self.get_search_fields(request)
+        if not search_fields or not search_term:
+            return queryset, False
+        for bit in smart_split(search_term):
+            if bit.startswith(('"', "'")) and bit[0] == bit[-1]:
+                bit = unescape_string_literal(bit)
+            conditions = [get_search_condition(queryset.model, str(field), bit) for field in search_fields]
+            queryset = queryset.filter(reduce(operator.or_, conditions))
+        return queryset, False
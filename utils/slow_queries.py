@@ -0,0 +1,240 @@
+import hashlib
+import json
+import logging
+import os
+import re
+import threading
+import time
+import uuid
+from contextlib import nullcontext
+from contextvars import ContextVar
+from datetime import datetime
+
+from django.conf import settings
+from django.db import DatabaseError, transaction
+
+logger = logging.getLogger(__name__)
+
+STRING_RE = re.compile(r"'(?:[^']|'')*'")
+NUMBER_RE = re.compile(r'(?<![\w"])-?\d+(?:\.\d+)?\b')
+PLACEHOLDER_RE = re.compile(r'%s|\?')
+IN_LIST_RE = re.compile(r'\bIN \((?:\?\s*,\s*)*\?\)', re.IGNORECASE)
+SPACE_RE = re.compile(r'\s+')
+ORDERINGS = ('total_ms', 'max_ms', 'count')
+
+current_request = ContextVar('slow_query_request', default=None)
+
+
+def normalize_sql(sql):
+    sql = STRING_RE.sub('?', sql)
+    sql = NUMBER_RE.sub('?', sql)
+    sql = PLACEHOLDER_RE.sub('?', sql)
+    # Списки IN разной длины дают один отпечаток
+    sql = IN_LIST_RE.sub('IN (...)', sql)
+    return SPACE_RE.sub(' ', sql).strip()
+
+
+def get_fingerprint(normalized_sql):
+    return hashlib.md5(normalized_sql.encode()).hexdigest()[:12]
+
+
+def get_param_shapes(params, many=False):
+    if many:
+        return [f'executemany[{len(params)}]'] if isinstance(params, (list, tuple)) else ['executemany']
+    if params is None:
+        return []
+    if isinstance(params, dict):
+        params = params.values()
+    shapes = []
+    for param in params:
+        if isinstance(param, (str, bytes, list, tuple)):
+            shape = f'{type(param).__name__}[{len(param)}]'
+        else:
+            shape = type(param).__name__
+        # Подряд идущие одинаковые параметры (списки IN) сворачиваются: int×20
+        if shapes and shapes[-1][0] == shape:
+            shapes[-1][1] += 1
+        else:
+            shapes.append([shape, 1])
+    return [shape if count == 1 else f'{shape}×{count}' for shape, count in shapes]
+
+
+def get_current_view():
+    request = current_request.get()
+    if request is None:
+        return 'вне запроса'
+    match = getattr(request, 'resolver_match', None)
+    return match.view_name if match else request.path
+
+
+def explain(connection, sql, params):
+    if not sql.lstrip().upper().startswith(('SELECT', 'WITH')):
+        return None
+    prefix = connection.ops.explain_query_prefix()
+    # Внутри транзакции EXPLAIN идет в точке сохранения: в PostgreSQL его ошибка иначе прервала бы
+    # транзакцию запроса, который журнал только наблюдает
+    savepoint = transaction.atomic(using=connection.alias) if connection.in_atomic_block else nullcontext()
+    try:
+        with savepoint:
+            # Сырой курсор бэкенда: EXPLAIN не проходит через обертки и не попадает в connection.queries,
+            # а ошибки драйвера приводятся к DatabaseError вручную
+            cursor = connection.create_cursor()
+            try:
+                with connection.wrap_database_errors:
+                    cursor.execute(f'{prefix} {sql}', params)
+                    rows = cursor.fetchall()
+            finally:
+                cursor.close()
+    except DatabaseError as error:
+        return f'EXPLAIN не выполнен: {error}'
+    if connection.vendor == 'sqlite':
+        depths, lines = {0: -1}, []
+        for node_id, parent, _, detail in rows:
+            depths[node_id] = depths.get(parent, -1) + 1
+            lines.append(f'{"  " * depths[node_id]}{detail}')
+        return '\n'.join(lines)
+    return '\n'.join(str(row[0]) for row in rows)
+
+
+class SlowQueryLog:
+    # Как и метрики, каждый процесс хранит сводку у себя и сбрасывает ее в свой файл в SLOW_QUERY_DIR
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.flush_lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        self.pid = os.getpid()
+        self.token = uuid.uuid4().hex[:8]
+        self.entries = {}
+        self.flushed = 0
+
+    @property
+    def directory(self):
+        return getattr(settings, 'SLOW_QUERY_DIR', None)
+
+    def record(self, connection, sql, params, many, duration_ms):
+        normalized = normalize_sql(sql)
+        fingerprint = get_fingerprint(normalized)
+        view = get_current_view()
+        logger.warning('Медленный запрос %.1f мс [%s] %s: %s', duration_ms, fingerprint, view, normalized)
+        with self.lock:
+            if self.pid != os.getpid():
+                self.reset()
+            entry = self.entries.get(fingerprint)
+            is_new = entry is None
+            if is_new:
+                entry = self.entries[fingerprint] = {
+                    'fingerprint': fingerprint, 'sql': normalized, 'alias': connection.alias, 'count': 0,
+                    'total_ms': 0.0, 'max_ms': 0.0, 'views': {}, 'params': [], 'explain': None, 'last_seen': None,
+                }
+            entry['count'] += 1
+            entry['total_ms'] += duration_ms
+            entry['views'][view] = entry['views'].get(view, 0) + 1
+            entry['last_seen'] = datetime.now().isoformat(timespec='seconds')
+            is_slowest = duration_ms > entry['max_ms']
+            if is_slowest:
+                entry['max_ms'] = duration_ms
+                entry['params'] = get_param_shapes(params, many)
+            self.trim()
+        # План зависит от данных, поэтому снимается заново для каждого нового максимума
+        if is_slowest and not many:
+            entry['explain'] = explain(connection, sql, params)
+        if is_new or time.monotonic() - self.flushed >= getattr(settings, 'SLOW_QUERY_FLUSH_SECONDS', 1):
+            self.flush()
+
+    def trim(self):
+        limit = getattr(settings, 'SLOW_QUERY_MAX_FINGERPRINTS', 500)
+        if len(self.entries) > limit:
+            for fingerprint in sorted(self.entries, key=lambda key: self.entries[key]['total_ms'])[:-limit]:
+                del self.entries[fingerprint]
+
+    def flush(self):
+        # Временный файл общий для процесса, поэтому сбрасывает только один поток за раз
+        if not self.directory or not self.flush_lock.acquire(blocking=False):
+            return
+        try:
+            self.flushed = time.monotonic()
+            os.makedirs(self.directory, exist_ok=True)
+            path = os.path.join(self.directory, f'slow_queries_{self.pid}_{self.token}.json')
+            with self.lock:
+                data = json.dumps(list(self.entries.values()), ensure_ascii=False)
+            with open(f'{path}.tmp', 'w', encoding='utf-8') as file:
+                file.write(data)
+            os.replace(f'{path}.tmp', path)
+        finally:
+            self.flush_lock.release()
+
+    def get_paths(self):
+        if not self.directory or not os.path.isdir(self.directory):
+            return []
+        return [os.path.join(self.directory, name) for name in os.listdir(self.directory)
+                if name.startswith('slow_queries_') and name.endswith('.json')]
+
+    def collect(self):
+        summary = {}
+        for path in self.get_paths():
+            try:
+                with open(path, encoding='utf-8') as file:
+                    entries = json.load(file)
+            except (OSError, ValueError):
+                continue
+            for entry in entries:
+                total = summary.get(entry['fingerprint'])
+                if total is None:
+                    summary[entry['fingerprint']] = entry
+                    continue
+                total['count'] += entry['count']
+                total['total_ms'] += entry['total_ms']
+                total['last_seen'] = max(total['last_seen'], entry['last_seen'])
+                for view, count in entry['views'].items():
+                    total['views'][view] = total['views'].get(view, 0) + count
+                if entry['max_ms'] > total['max_ms']:
+                    total.update(max_ms=entry['max_ms'], params=entry['params'], explain=entry['explain'])
+        return summary
+
+    def top(self, limit=None, order='total_ms'):
+        limit = limit or getattr(settings, 'SLOW_QUERY_TOP_N', 20)
+        return sorted(self.collect().values(), key=lambda entry: entry[order], reverse=True)[:limit]
+
+    def clear(self):
+        with self.lock:
+            self.reset()
+        for path in self.get_paths():
+            os.remove(path)
+
+
+slow_query_log = SlowQueryLog()
+
+
+def slow_query_wrapper(execute, sql, params, many, context):
+    started = time.perf_counter()
+    result = execute(sql, params, many, context)
+    duration_ms = (time.perf_counter() - started) * 1000
+    if duration_ms >= getattr(settings, 'SLOW_QUERY_THRESHOLD_MS', 100):
+        try:
+            slow_query_log.record(context['connection'], sql, params, many, duration_ms)
+        except Exception:
+            # Журнал медленных запросов не должен ломать сам запрос
+            logger.exception('Не удалось записать медленный запрос')
+    return result
+
+
+def install_slow_query_wrapper(connection, **kwargs):
+    if slow_query_wrapper not in connection.execute_wrappers:
+        connection.execute_wrappers.append(slow_query_wrapper)
+
+
+class SlowQueryMiddleware:
+    # Запоминает текущий запрос, чтобы в журнале было видно, из какого представления пришел медленный SQL
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        token = current_request.set(request)
+        try:
+            return self.get_response(request)
+        finally:
+            current_request.reset(token)
@@ -0,0 +1,136 @@
+import json
+import re
+from datetime import date, timedelta
+
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.db import connection
+from django.test import TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+
+# Таблицы, на которых полный перебор недопустим
+HOT_TABLES = (
+    'motorpool_auto', 'motorpool_auto_options', 'motorpool_vehiclepassport', 'motorpool_autoreview',
+    'motorpool_autorent', 'motorpool_autorating', 'motorpool_favorite', 'auth_user', 'accounts_profile',
+    'django_session',
+)
+SQLITE_SCAN_RE = re.compile(r'^SCAN (?:TABLE )?(\w+)(?: AS \w+)?$')
+SQLITE_TEMP_SORT = 'USE TEMP B-TREE FOR ORDER BY'
+
+
+def is_ordered_limit_scan(sql, details):
+    # Внешний перебор таблицы без сортировки под ORDER BY идет по rowid, то есть по первичному ключу,
+    # и с LIMIT останавливается на первой странице; перебор без ORDER BY или с сортировкой читает всё
+    return (bool(re.search(r'\bORDER BY\b.*\bLIMIT\b', sql)) and SQLITE_TEMP_SORT not in details
+            and bool(details) and bool(SQLITE_SCAN_RE.match(details[0])))
+
+
+def get_full_scans(sql, params):
+    if not sql.lstrip().upper().startswith('SELECT'):
+        return []
+    with connection.cursor() as cursor:
+        if connection.vendor == 'sqlite':
+            cursor.execute(f'EXPLAIN QUERY PLAN {sql}', params)
+            details = [row[-1] for row in cursor.fetchall()]
+            if is_ordered_limit_scan(sql, details):
+                details = details[1:]
+            return [match.group(1) for match in map(SQLITE_SCAN_RE.match, details) if match]
+        if connection.vendor == 'postgresql':
+            cursor.execute(f'EXPLAIN (FORMAT JSON) {sql}', params)
+            plan = cursor.fetchone()[0]
+            plan = json.loads(plan) if isinstance(plan, str) else plan
+            nodes, scans = [plan[0]['Plan']], []
+            while nodes:
+                node = nodes.pop()
+                if node['Node Type'] == 'Seq Scan':
+                    scans.append(node['Relation Name'])
+                nodes.extend(node.get('Plans', ()))
+            return scans
+    return []
+
+
+def format_queries(queries):
+    return '\n'.join(f'{index}. {query["sql"]}' for index, query in enumerate(queries, 1))
+
+
+def seed_fleet(brands=20, autos_per_brand=15, users=5):
+    from motorpool.fleet_summary import rebuild_summaries
+    from motorpool.models import Auto, AutoRent, AutoReview, Brand, Favorite, Option, VehiclePassport
+    from motorpool.ratings import rebuild_ratings
+
+    owners = [User.objects.create_user(f'user{index}', f'user{index}@example.com', 'password')
+              for index in range(users)]
+    # bulk_create на SQLite не возвращает первичные ключи, поэтому объекты перечитываются
+    Option.objects.bulk_create([Option(title=f'Опция {index}') for index in range(8)])
+    Brand.objects.bulk_create([Brand(title=f'Бренд {index}', slug=f'brand-{index}') for index in range(brands)])
+    brand_list = list(Brand.objects.order_by('pk'))
+    classes = [value for value, _ in Auto.AUTO_CLASS_CHOICES]
+    Auto.objects.bulk_create([
+        Auto(brand=brand, number=f'а{brand.pk:03}{index:03}', year=2000 + index % 22,
+             auto_class=classes[index % len(classes)])
+        for brand in brand_list for index in range(autos_per_brand)
+    ])
+    autos = list(Auto.objects.order_by('pk'))
+    VehiclePassport.objects.bulk_create([
+        VehiclePassport(auto=auto, vin=f'VIN{auto.pk:08}', engine_volume=1000 + auto.pk % 30 * 100,
+                        engine_power=60 + auto.pk % 250)
+        for auto in autos
+    ])
+    options = list(Option.objects.all())
+    Auto.options.through.objects.bulk_create([
+        Auto.options.through(auto_id=auto.pk, option_id=option.pk)
+        for auto in autos for option in options[:auto.pk % len(options) + 1]
+    ])
+    AutoReview.objects.bulk_create([
+        AutoReview(auto=auto, user=owner, rate=(auto.pk + owner.pk) % 6, text='Отзыв')
+        for auto in autos[::3] for owner in owners
+    ])
+    first_day = date.today()
+    AutoRent.objects.bulk_create([
+        AutoRent(auto=auto, user=owners[auto.pk % len(owners)],
+                 date_start=first_day + timedelta(days=auto.pk % 20),
+                 date_end=first_day + timedelta(days=auto.pk % 20 + 3))
+        for auto in autos[::2]
+    ])
+    Favorite.objects.bulk_create([Favorite(user=owners[0], brand=brand) for brand in brand_list[:5]])
+    rebuild_ratings()
+    rebuild_summaries()
+    return owners
+
+
+@override_settings(STATICFILES_STORAGE='django.contrib.staticfiles.storage.StaticFilesStorage')
+class QueryBudgetTestCase(TestCase):
+
+    def setUp(self):
+        from motorpool.availability import availability_index
+        from motorpool.facets import facet_index
+
+        cache.clear()
+        self.indexes = (facet_index, availability_index)
+        for index in self.indexes:
+            index.load()
+
+    def tearDown(self):
+        # Индексы живут в процессе и не откатываются вместе с транзакцией теста
+        for index in self.indexes:
+            index.loaded = False
+
+    def assertQueryBudget(self, url, max_queries, method='get', data=None, status_code=200, allowed_scans=(),
+                          **extra):
+        # Страничный кеш сбрасывается, иначе замерялось бы попадание в кеш, а не сама страница
+        cache.clear()
+        with CaptureQueriesContext(connection) as context:
+            response = getattr(self.client, method)(url, data, **extra)
+            if getattr(response, 'streaming', False):
+                b''.join(response.streaming_content)
+        self.assertEqual(response.status_code, status_code, url)
+        queries = context.captured_queries
+        if len(queries) > max_queries:
+            self.fail(f'{method.upper()} {url}: {len(queries)} запросов при бюджете {max_queries}\n'
+                      f'{format_queries(queries)}')
+        scans = [(query, table) for query in queries for table in get_full_scans(query['sql'], None)
+                 if table in HOT_TABLES and table not in allowed_scans]
+        if scans:
+            self.fail(f'{method.upper()} {url}: полный перебор таблиц\n'
+                      + '\n'.join(f'{table}: {query["sql"]}' for query, table in scans))
+        return response